@@ -0,0 +1,320 @@
+"""
+analytics.py
+
+Item analysis over the exam history: which questions are too hard, too
+easy, or likely mis-keyed.
+
+Every graded attempt also writes one fixed-size record per question served
+to an append-only answer log, through the result sink's batches. Positions
+are per bank, so each bank has its own log: ``answers.bin`` (or
+QUIZ_ANSWER_LOG) for the default bank, and ``answers.bin`` beside the shard
+of each course (courses.py), e.g. ``courses/bio101/answers.bin``:
+
+    position  uint32   0-based bank position
+    choice    uint8    option picked, in the bank's own order (0 = skipped,
+                       1-3 = a-c, whatever order the student saw)
+    key       uint8    the bank's correct option (1-3)
+    score     int16    the attempt's total score
+
+Records carry everything needed per answer, so the aggregation is one
+columnar pass with no joins. ItemAnalysis keeps per-question sums (served,
+correct, option counts, sum of scores, sum of scores when correct, sum of
+squared scores) that are all additive. ``refresh`` reads only the log's new
+tail with ``numpy.fromfile`` and folds it in with ``numpy.bincount``, and a
+full recompute is the same pass from offset 0, streamed in chunks.
+
+From those sums:
+
+    difficulty      share of students who answered correctly (p value;
+                    skips count as not correct)
+    discrimination  point-biserial correlation between getting the question
+                    right and the attempt's score; near 0 the question does
+                    not separate strong from weak students, below 0 the key
+                    is suspect
+    distractors     share of students picking each option, and skipping
+
+NumPy is needed for the analysis (not for recording answers).
+
+Run:
+    python analytics.py [--course bio101] [--sort discrimination] [--top 20] [--json]
+"""
+
+import os
+import struct
+import sys
+import threading
+import time
+
+import filelock
+import metrics
+from assembly import PERMUTATIONS
+from grading import OPTIONS
+
+ANSWER_LOG = "answers.bin"
+RECORD = struct.Struct("<IBBh")
+CHUNK_RECORDS = 1 << 22        # records per read during a refresh (32 MiB)
+MIN_RESPONSES = 20             # fewer than this and no question is flagged
+HARD, EASY = 0.2, 0.95         # difficulty bounds for the flags
+WEAK = 0.2                     # discrimination below this is flagged
+
+
+def answer_log_path(course=None):
+    """The answer log of ``course`` (beside its shard), or of the default bank."""
+    if course:
+        from courses import get_catalog  # courses imports storage; keep this module light
+        return os.path.join(os.path.dirname(get_catalog().shard_path(course)), ANSWER_LOG)
+    return os.environ.get("QUIZ_ANSWER_LOG", ANSWER_LOG)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise ImportError("Item analysis requires NumPy: pip install numpy") from exc
+    return numpy
+
+
+def _dtype(np):
+    return np.dtype([("position", "<u4"), ("choice", "u1"), ("key", "u1"), ("score", "<i2")])
+
+
+# ----------------- Recording -----------------
+
+def _code(letter):
+    return OPTIONS.index(letter) + 1 if letter in OPTIONS else 0
+
+
+def pack_answers(choices, key, score, positions, orders=None):
+    """
+    Encode one graded attempt as answer-log records.
+
+    ``choices`` and ``key`` are the letters as the student saw them (one
+    per question, None for skips), ``positions`` the bank position of each
+    question, ``orders`` the option shuffles of an ExamPlan (None if the
+    options were shown in bank order).
+    """
+    score = max(-32768, min(32767, int(score)))
+    out = bytearray()
+    for slot, (choice, answer, position) in enumerate(zip(choices, key, positions)):
+        shown, right = _code(choice), _code(answer)
+        if orders is not None:
+            perm = PERMUTATIONS[orders[slot]]
+            shown = perm[shown - 1] + 1 if shown else 0
+            right = perm[right - 1] + 1
+        out += RECORD.pack(position, shown, right, score)
+    return bytes(out)
+
+
+def append_answers(data, path=None):
+    """Append packed records (whole attempts) to the answer log."""
+    if data:
+        filelock.append(path or answer_log_path(), data, record_size=RECORD.size)
+        metrics.inc("quiz_answers_logged_total", len(data) // RECORD.size)
+
+
+# ----------------- Analysis -----------------
+
+class ItemAnalysis:
+    """
+    Per-question statistics over an answer log, maintained incrementally.
+    """
+
+    COUNTERS = ("served", "correct", "skip", "a", "b", "c")
+    SUMS = ("score", "score_correct", "score_sq")
+
+    def __init__(self, path=None):
+        self.path = path or answer_log_path()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        np = _numpy()
+        self.offset = 0
+        self.records = 0
+        self._counts = {name: np.zeros(0, dtype=np.int64) for name in self.COUNTERS}
+        self._sums = {name: np.zeros(0, dtype=np.float64) for name in self.SUMS}
+
+    def _grow(self, size):
+        np = _numpy()
+        for table in (self._counts, self._sums):
+            for name, values in table.items():
+                if len(values) < size:
+                    grown = np.zeros(max(size, 2 * len(values)), dtype=values.dtype)
+                    grown[:len(values)] = values
+                    table[name] = grown
+
+    def _fold(self, chunk):
+        """Add one structured array of records to the running sums."""
+        np = _numpy()
+        if not len(chunk):
+            return
+        size = int(chunk["position"].max()) + 1
+        self._grow(size)
+        position = chunk["position"]
+        choice = chunk["choice"]
+        right = choice == chunk["key"]
+        score = chunk["score"].astype(np.float64)
+
+        def add(table, name, weights=None, where=None):
+            index = position if where is None else position[where]
+            if weights is not None and where is not None:
+                weights = weights[where]
+            counts = np.bincount(index, weights=weights, minlength=size)
+            table[name][:size] += counts.astype(table[name].dtype, copy=False)
+
+        add(self._counts, "served")
+        add(self._counts, "correct", where=right)
+        for code, name in enumerate(("skip", "a", "b", "c")):
+            add(self._counts, name, where=choice == code)
+        add(self._sums, "score", score)
+        add(self._sums, "score_correct", score, where=right)
+        add(self._sums, "score_sq", score * score)
+
+    @metrics.timed("quiz_item_analysis_refresh_seconds")
+    def refresh(self):
+        """Fold in records appended since the last call; rebuild if the log shrank."""
+        np = _numpy()
+        dtype = _dtype(np)
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if size < self.offset:
+                self._reset()
+            complete = size - (size - self.offset) % RECORD.size  # skip a torn tail
+            if complete <= self.offset:
+                return self
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                remaining = (complete - self.offset) // RECORD.size
+                while remaining:
+                    chunk = np.fromfile(f, dtype=dtype, count=min(remaining, CHUNK_RECORDS))
+                    if not len(chunk):
+                        break
+                    self._fold(chunk)
+                    remaining -= len(chunk)
+                    self.records += len(chunk)
+                    self.offset += len(chunk) * RECORD.size
+        return self
+
+    def table(self):
+        """
+        Per-question statistics as a dict of NumPy arrays, one entry per
+        bank position up to the highest one answered (positions never served
+        have ``served == 0`` and NaN statistics).
+        """
+        np = _numpy()
+        with self._lock:
+            size = int(np.flatnonzero(self._counts["served"]).max() + 1) if self.records else 0
+            counts = {name: values[:size].copy() for name, values in self._counts.items()}
+            sums = {name: values[:size].copy() for name, values in self._sums.items()}
+        served = counts["served"].astype(np.float64)
+        correct = counts["correct"].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = correct / served
+            mean = sums["score"] / served
+            sd = np.sqrt(np.maximum(sums["score_sq"] / served - mean * mean, 0.0))
+            mean_right = sums["score_correct"] / correct
+            mean_wrong = (sums["score"] - sums["score_correct"]) / (served - correct)
+            discrimination = (mean_right - mean_wrong) / sd * np.sqrt(p * (1 - p))
+        # everyone right (or everyone wrong): the question separates no one
+        discrimination[(served > 0) & ((p == 0) | (p == 1) | (sd == 0))] = 0.0
+        table = {
+            "number": np.arange(1, size + 1),
+            "served": counts["served"],
+            "difficulty": p,
+            "discrimination": discrimination,
+        }
+        for name in ("a", "b", "c", "skip"):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                table[f"pick_{name}"] = counts[name] / served
+        return table
+
+    def flagged(self, table=None):
+        """Yield (number, reasons) for questions worth a teacher's look."""
+        table = self.table() if table is None else table
+        for i in range(len(table["number"])):
+            if table["served"][i] < MIN_RESPONSES:
+                continue
+            p, d = table["difficulty"][i], table["discrimination"][i]
+            reasons = []
+            if d < 0:
+                reasons.append("negative discrimination (check the key)")
+            elif d < WEAK:
+                reasons.append("weak discrimination")
+            if p < HARD:
+                reasons.append("very hard")
+            elif p > EASY:
+                reasons.append("very easy")
+            if reasons:
+                yield int(table["number"][i]), reasons
+
+    def stats(self):
+        with self._lock:
+            return {"records": self.records, "bytes": self.offset}
+
+
+_analyses = {}
+_analyses_lock = threading.Lock()
+
+
+def get_analysis(course=None):
+    """The process-wide analysis of ``answer_log_path(course)``, brought up to date."""
+    path = answer_log_path(course)
+    with _analyses_lock:
+        analysis = _analyses.get(path)
+        if analysis is None:
+            analysis = _analyses[path] = ItemAnalysis(path)
+    return analysis.refresh()
+
+
+# ----------------- Command line -----------------
+
+COLUMNS = ("number", "served", "difficulty", "discrimination",
+           "pick_a", "pick_b", "pick_c", "pick_skip")
+
+
+def rows(table, sort=None, top=None):
+    """Served questions as dicts, optionally sorted ascending by a column."""
+    np = _numpy()
+    order = np.flatnonzero(table["served"])
+    if sort:
+        order = order[np.argsort(table[sort][order], kind="stable")]
+    if top:
+        order = order[:top]
+    for i in order:
+        yield {name: round(float(table[name][i]), 3) if name not in ("number", "served")
+               else int(table[name][i]) for name in COLUMNS}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Item analysis of recorded answers")
+    parser.add_argument("--sort", choices=COLUMNS[1:],
+                        help="sort ascending by this column (default: bank order)")
+    parser.add_argument("--top", type=int, help="show only the first N questions")
+    parser.add_argument("--json", action="store_true", help="one JSON object per question")
+    parser.add_argument("--course", default=os.environ.get("QUIZ_COURSE"),
+                        help="course bank (default: QUIZ_COURSE, else the default bank)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    analysis = get_analysis(args.course)
+    elapsed = time.perf_counter() - started
+    table = analysis.table()
+    flags = dict(analysis.flagged(table))
+    if args.json:
+        for row in rows(table, args.sort, args.top):
+            print(json.dumps({**row, "flags": flags.get(row["number"], [])}))
+    else:
+        print(f"{'Q':>6}{'served':>9}{'p':>7}{'disc':>7}{'a':>6}{'b':>6}{'c':>6}{'skip':>6}  flags")
+        for row in rows(table, args.sort, args.top):
+            print(f"{row['number']:>6}{row['served']:>9}{row['difficulty']:>7.2f}"
+                  f"{row['discrimination']:>7.2f}{row['pick_a']:>6.2f}{row['pick_b']:>6.2f}"
+                  f"{row['pick_c']:>6.2f}{row['pick_skip']:>6.2f}  "
+                  + "; ".join(flags.get(row["number"], [])))
+    print(f"✅ {analysis.records} answers, {len(flags)} question(s) flagged "
+          f"({elapsed:.2f}s).", file=sys.stderr)
@@ -1,105 +1,202 @@
 # app.py
 import streamlit as st
-import pickle
-import csv
-import os
-import pandas as pd
-
-QUESTIONS_FILE = "quest.bin"
-RESULTS_FILE = "results.csv"
+from grading import CORRECT, INCORRECT, SKIPPED
 
 st.set_page_config(page_title="QuizMaster", page_icon="🎓", layout="centered")
 
+# Streamlit re-executes this script on every interaction, so everything
+# expensive is built once per process and fetched from st.cache_resource:
+# the storage backend (question bank cache, leaderboard, user index) and
+# the result sink (or the grading-service client, see grader.py). Heavier
+# modules (pandas, the exam engine) are imported by the page that needs them.
+@st.cache_resource(show_spinner=False)
+def get_backend(course=""):
+    # one cached view per course; its bank is opened lazily (see courses.py)
+    from storage import get_storage
+    return get_storage(course)
+
+@st.cache_resource(show_spinner=False)
+def get_course_catalog():
+    from courses import get_catalog
+    return get_catalog()
+
+@st.cache_resource(show_spinner=False)
+def get_result_sink():
+    from result_sink import get_sink
+    return get_sink()
+
+@st.cache_resource(show_spinner=False)
+def get_grader():
+    # None unless QUIZ_GRADER_SOCKET names a running grader.py service
+    from grader import get_client
+    return get_client()
+
+@st.cache_resource(show_spinner=False)
+def get_exam_proctor():
+    # None unless QUIZ_EXAM_MINUTES times the exams (see proctor.py)
+    from proctor import get_proctor
+    return get_proctor()
+
+def get_duplicate_index():
+    # dedupe keeps one index per process and rebuilds it when the course changes
+    from dedupe import get_index
+    return get_index(storage)
+
+catalog = get_course_catalog()
+course = ""
+if len(catalog):
+    titles = {c["course"]: c["title"] for c in catalog.courses()}
+    course = st.sidebar.selectbox("Course", [""] + list(titles),
+                                  format_func=lambda c: titles.get(c, "Default bank"))
+storage = get_backend(course)
+
 # ---------------------- Teacher Functions ----------------------
 def add_question(q, a, b, c, ans):
-    data = {q: [a, b, c, ans]}
-    with open(QUESTIONS_FILE, "ab") as f:
-        pickle.dump(data, f)
+    storage.add_question(q, a, b, c, ans)
 
 def view_questions():
-    if not os.path.exists(QUESTIONS_FILE):
+    if not storage.count_questions():
         st.warning("⚠️ No questions found yet.")
         return
+    for i, (q, opts) in enumerate(storage.iter_questions(), start=1):
+        st.write(f"**Q{i}. {q}**")
+        st.write(f"a) {opts[0]}")
+        st.write(f"b) {opts[1]}")
+        st.write(f"c) {opts[2]}")
+        st.success(f"✅ Correct Answer: {opts[3]}")
+        st.markdown("---")
+
+def search_questions():
+    from search import PAGE_SIZE, get_search_index
 
-    i = 1
-    with open(QUESTIONS_FILE, "rb") as f:
-        while True:
-            try:
-                data = pickle.load(f)
-                for q, opts in data.items():
-                    st.write(f"**Q{i}. {q}**")
-                    st.write(f"a) {opts[0]}")
-                    st.write(f"b) {opts[1]}")
-                    st.write(f"c) {opts[2]}")
-                    st.success(f"✅ Correct Answer: {opts[3]}")
-                    st.markdown("---")
-                    i += 1
-            except EOFError:
-                break
+    query_col, answer_col = st.columns([3, 1])
+    query = query_col.text_input("🔎 Search questions", placeholder="keywords, -word to exclude")
+    answer = answer_col.selectbox("Correct answer", ["any", "a", "b", "c"])
+    match_any = st.checkbox("Match any keyword")
+    if not query:
+        return
+    # the index lives per process and indexes only newly added questions per query
+    index = get_search_index(storage)
+    first = index.search(query, 0, match_any=match_any, answer=None if answer == "any" else answer)
+    if not first.total:
+        st.info("No matching questions.")
+        return
+    pages = (first.total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = st.number_input("Results page", min_value=1, max_value=pages, value=1) - 1
+    result = first if page == 0 else index.search(query, page, match_any=match_any,
+                                                   answer=None if answer == "any" else answer)
+    if result.partial and not match_any:
+        st.caption("No question contains every keyword; showing partial matches.")
+    for hit in result.hits:
+        st.write(f"**Q{hit.number}. {hit.text}**")
+        st.write("  \n".join(f"{letter}) {option}" for letter, option in zip("abc", hit.options)))
+        st.success(f"✅ Correct Answer: {hit.answer}")
+    st.caption(f"{result.total} matching question(s), page {page + 1} of {pages}")
 
 # ---------------------- Student Functions ----------------------
+OUTCOME_LABELS = {CORRECT: "✅ Correct", INCORRECT: "❌ Wrong", SKIPPED: "➡️ Skipped"}
+CHOICES = ["a", "b", "c", "Skip"]
+
+def _turn_page(step):
+    st.session_state.exam_page += step
+
 def start_exam(name):
-    if not os.path.exists(QUESTIONS_FILE):
+    """
+    Render one page of the running exam (st.session_state.exam).
+    Returns the result dict once the student submits, otherwise None.
+    """
+    exam = st.session_state.exam
+    if not len(exam):
         st.warning("⚠️ No questions available.")
+        del st.session_state.exam
         return None
 
-    correct = incorrect = skipped = score = 0
-    answers = []
-
-    with open(QUESTIONS_FILE, "rb") as f:
-        i = 1
-        while True:
-            try:
-                data = pickle.load(f)
-                for q, opts in data.items():
-                    st.write(f"**Q{i}. {q}**")
-                    choice = st.radio(
-                        f"Your Answer for Q{i}",
-                        ["a", "b", "c", "Skip"],
-                        key=f"q{i}"
-                    )
-                    if choice.lower() == opts[3]:
-                        correct += 1
-                        score += 4
-                        answers.append((q, "✅ Correct"))
-                    elif choice == "Skip":
-                        skipped += 1
-                        answers.append((q, "➡️ Skipped"))
-                    else:
-                        incorrect += 1
-                        score -= 1
-                        answers.append((q, "❌ Wrong"))
-                    i += 1
-            except EOFError:
-                break
-
-    # Save results
-    save_result(name, correct, incorrect, skipped, score)
-    return {
-        "name": name,
-        "correct": correct,
-        "incorrect": incorrect,
-        "skipped": skipped,
-        "score": score,
-        "answers": answers
-    }
+    timed = hasattr(exam, "deadline")
+    if timed:
+        from proctor import format_remaining
+        if exam.remaining() <= 0:
+            st.warning("⏰ Time is up! Your exam was submitted with the answers given so far.")
+            return _finish(name, exam.submit())  # the scheduler has usually done it already
+        st.info(f"⏳ {format_remaining(exam.remaining())} left (answers are saved as you go)")
+
+    page = st.session_state.exam_page
+    for q in exam.page(page):
+        st.write(f"**Q{q.number}. {q.text}**")
+        previous = exam.choice(q)
+        choice = st.radio(
+            f"Your Answer for Q{q.number}",
+            CHOICES,
+            index=CHOICES.index(previous) if previous else 3,
+            key=f"q{q.number}"
+        )
+        exam.answer(q, choice)
+
+    st.caption(f"Page {page + 1} of {exam.pages}")
+    prev_col, next_col, submit_col = st.columns(3)
+    prev_col.button("⬅️ Previous", disabled=page == 0, on_click=_turn_page, args=(-1,))
+    next_col.button("Next ➡️", disabled=page >= exam.pages - 1, on_click=_turn_page, args=(1,))
+    if not submit_col.button("✅ Submit Exam"):
+        return None
+
+    return _finish(name, exam.submit() if timed else grade_and_save(name, exam))
+
+def _finish(name, result):
+    exam = st.session_state.pop("exam")
+    texts = {q.number: q.text for q in exam}
+    result = dict(result, name=name)
+    result["answers"] = [(f"Q{n}. {texts[n]}", OUTCOME_LABELS[o]) for n, o in result["answers"]]
+    return result
 
 # ---------------------- Results Handling ----------------------
-def save_result(name, correct, incorrect, skipped, score):
-    file_exists = os.path.exists(RESULTS_FILE)
-    with open(RESULTS_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["Name", "Correct", "Incorrect", "Skipped", "Score"])
-        writer.writerow([name, correct, incorrect, skipped, score])
+def grade_and_save(name, exam):
+    """Grade through the grading service when one is configured, else in-process."""
+    client = get_grader()
+    if client is not None:
+        try:
+            return client.submit(name, name, exam.choices(), exam.plan, exam.course,
+                                 getattr(exam.storage, "ref", None))
+        except OSError:
+            st.toast("Grading service unavailable; grading locally.")
+    result = exam.result()
+    save_result(name, result["correct"], result["incorrect"], result["skipped"], result["score"],
+                exam.answer_records(result["score"]), exam.course)
+    return result
+
+def save_result(name, correct, incorrect, skipped, score, answers=None, course=None):
+    # the web app has no login, so the entered name doubles as the username
+    get_result_sink().submit(name, name, correct, incorrect, skipped, score, answers, course)
+
+PAGE_SIZE = 50
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def leaderboard_page(total, offset):
+    """One page of the board; ``total`` keys the cache, so new results miss it."""
+    return storage.top_results(PAGE_SIZE, offset)
 
 def show_performance():
-    if not os.path.exists(RESULTS_FILE):
+    import pandas as pd
+
+    if get_grader() is None:
+        get_result_sink().flush(timeout=1.0)
+    total = storage.count_results()
+    if not total:
         st.warning("⚠️ No results yet.")
         return
-    df = pd.read_csv(RESULTS_FILE)
-    df = df.sort_values("Score", ascending=False)
+    pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1)
+    offset = (page - 1) * PAGE_SIZE
+    df = pd.DataFrame(leaderboard_page(total, offset))
+    df.index = range(offset + 1, offset + len(df) + 1)
     st.dataframe(df, use_container_width=True)
+    st.caption(f"{total} attempts, page {page} of {pages}")
+
+    who = st.text_input("Find your rank (name)")
+    if who:
+        rank = storage.rank_of(who)
+        if rank is None:
+            st.info(f"No results for {who} yet.")
+        else:
+            st.success(f"🏅 {who} is ranked #{rank} of {total}.")
 
 # ---------------------- Streamlit App ----------------------
 st.title("🎓 QuizMaster: Student–Teacher Quiz System")
@@ -121,21 +218,45 @@ elif choice == "👨‍🏫 Teacher":
         b = st.text_input("Option B")
         c = st.text_input("Option C")
         ans = st.radio("Correct Answer", ["a", "b", "c"])
+        allow_duplicate = st.checkbox("Add even if a similar question exists")
         submitted = st.form_submit_button("Add Question")
 
         if submitted and q and a and b and c:
-            add_question(q, a, b, c, ans)
-            st.success("✅ Question Added!")
+            matches = get_duplicate_index().check(q)
+            if matches and not allow_duplicate:
+                st.warning("⚠️ This looks like a question already in the bank:")
+                from dedupe import format_matches
+                for line in format_matches(matches):
+                    st.write(line.strip())
+            else:
+                add_question(q, a, b, c, ans)
+                st.success("✅ Question Added!")
+
+    search_questions()
 
     if st.button("📚 View Questions"):
         view_questions()
 
+    stats = storage.stats()
+    if "hits" in stats:
+        st.caption(f"Question cache: {stats['hits']} hits / {stats['misses']} misses, {stats['reloads']} reloads")
+
 elif choice == "👩‍🎓 Student":
     st.subheader("👩‍🎓 Student Exam")
 
     name = st.text_input("Enter Your Name")
     if name and st.button("Start Exam"):
-        result = start_exam(name)
+        from exam import ExamSession
+        # the session survives reruns, so radio clicks don't restart the exam;
+        # a timed exam left unfinished (closed tab, crash) resumes where it was
+        proctor = get_exam_proctor()
+        st.session_state.exam = (proctor.start(name, name, storage) if proctor
+                                 else ExamSession.for_student(name, storage))
+        st.session_state.exam_name = name
+        st.session_state.exam_page = 0
+
+    if "exam" in st.session_state:
+        result = start_exam(st.session_state.exam_name)
         if result:
             st.success(f"🎉 Exam Completed! Score: {result['score']}")
             st.write("### 📊 Detailed Results")
@@ -0,0 +1,504 @@
+"""
+archive.py
+
+Compact, columnar archive of exam results, partitioned by day.
+
+results.csv only ever grows, and every leaderboard row read from it is
+text to parse. Compaction folds the CSV into ``results.archive/``, one
+directory per partition (the UTC day of the compaction by default, or any
+name such as an exam id), holding one fixed-width column per file:
+
+    user.u4  name.u4                  dictionary codes
+    correct.i4  incorrect.i4  skipped.i4  score.i4
+
+Usernames and display names are dictionary-encoded into ``users`` and
+``names``: append-only files of concatenated UTF-8 strings (``<kind>.str``)
+with the end offset of every entry (``<kind>.idx``, uint64), so any code
+decodes with one lookup and a page of rows never loads a whole dictionary.
+
+Columns are little-endian and memory-mapped with NumPy, so a query reads
+only the columns and partitions it touches; the leaderboard, for example,
+needs the score order and then just the rows on the requested page.
+
+``manifest.json`` is the commit point. It lists the partitions with their
+committed row counts, the dictionary sizes and the score histogram, and
+while a compaction is in flight, which bytes of which results.csv (by
+inode) are already folded in. Compaction appends to the columns and
+dictionaries, writes the rank order of every archived row
+(``order-<generation>.u4``, best score first, ties in archive order) and
+each user's best score (``best-<generation>.i4``, by user code), replaces
+the manifest atomically and only then truncates the CSV to its header.
+Bytes past the committed counts are leftovers of an interrupted
+compaction and are cut off by the next one. If the process dies after the
+manifest but before the CSV is truncated, readers skip the folded prefix
+and the next compaction finishes the job. All of it runs under the CSV's
+file lock, so writers simply wait for it.
+
+Example:
+    python archive.py compact [--partition midterm]
+    python archive.py stats
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import filelock
+import metrics
+
+ARCHIVE_SUFFIX = ".archive"
+MANIFEST = "manifest.json"
+DICTIONARIES = ("users", "names")
+COLUMNS = {
+    "user": "<u4",
+    "name": "<u4",
+    "correct": "<i4",
+    "incorrect": "<i4",
+    "skipped": "<i4",
+    "score": "<i4",
+}
+CSV_FIELDS = {"correct": "Correct", "incorrect": "Incorrect",
+              "skipped": "Skipped", "score": "Score"}
+READ_CHUNK = 1 << 23  # bytes of CSV parsed at a time
+NO_SCORE = -(1 << 31)  # best-score slot of a user without results
+
+
+def archive_dir(results_file):
+    """The archive directory that belongs to ``results_file``."""
+    return os.path.splitext(results_file)[0] + ARCHIVE_SUFFIX
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise ImportError("The results archive requires NumPy: pip install numpy") from exc
+    return numpy
+
+
+def _empty_manifest():
+    return {"generation": 0, "partitions": [], "scores": [], "source": None,
+            **{kind: {"count": 0, "bytes": 0} for kind in DICTIONARIES}}
+
+
+# ----------------- Reading the live CSV -----------------
+
+def read_live(results_file, start=0, chunk_size=READ_CHUNK):
+    """
+    Yield ``(end offset, header, [rows])`` chunk by chunk for the CSV rows
+    at or after byte ``start`` (the header is always read from the top). A
+    torn final line is left for the next reader.
+    """
+    try:
+        f = open(results_file, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        header = next(csv.reader([f.readline().decode("utf-8")]), None)
+        if not header:
+            return
+        if start > f.tell():
+            f.seek(start)
+        end, carry = f.tell(), b""
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            data, carry = data[:cut], data[cut:]
+            if data:
+                end += len(data)
+                rows = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+                yield end, header, [row for row in rows if row]
+
+
+# ----------------- Dictionaries -----------------
+
+class _Dictionary:
+    """Read side of one append-only string dictionary."""
+
+    def __init__(self, directory, kind, count):
+        self.count = count
+        self._text = self._ends = None
+        if count:
+            np = _numpy()
+            self._ends = np.memmap(os.path.join(directory, f"{kind}.idx"), dtype="<u8",
+                                   mode="r", shape=(count,))
+            size = int(self._ends[-1])
+            self._text = np.memmap(os.path.join(directory, f"{kind}.str"), dtype="u1",
+                                   mode="r", shape=(size,)) if size else np.zeros(0, "u1")
+
+    def decode(self, code):
+        code = int(code)
+        start = int(self._ends[code - 1]) if code else 0
+        return self._text[start:int(self._ends[code])].tobytes().decode("utf-8")
+
+    def all(self):
+        if not self.count:
+            return []
+        text = self._text.tobytes()
+        ends = self._ends.tolist()
+        return [text[start:end].decode("utf-8") for start, end in zip([0] + ends, ends)]
+
+
+# ----------------- Archive -----------------
+
+class ResultsArchive:
+    """Read access to one archive directory (refreshed when its manifest changes)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()  # cached builders call back into the archive
+        self._stamp = None
+        self._manifest = _empty_manifest()
+        self._cache = {}           # per-manifest derived data (maps, dictionaries, ...)
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def manifest(self):
+        """The current manifest (re-read only when the file changed)."""
+        path = self._path(MANIFEST)
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stamp = None
+            else:
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stamp != self._stamp:
+                if stamp is None:
+                    self._manifest = _empty_manifest()
+                else:
+                    with open(path, encoding="utf-8") as f:
+                        self._manifest = json.load(f)
+                self._stamp = stamp
+                self._cache = {}
+            return self._manifest
+
+    @property
+    def generation(self):
+        return self.manifest()["generation"]
+
+    def __len__(self):
+        return sum(p["rows"] for p in self.manifest()["partitions"])
+
+    def partitions(self):
+        return [p["name"] for p in self.manifest()["partitions"]]
+
+    def folded_bytes(self, results_file):
+        """How much of ``results_file`` is already archived (0 unless a compaction was cut short)."""
+        source = self.manifest()["source"]
+        try:
+            inode = os.stat(results_file).st_ino
+        except FileNotFoundError:
+            return 0
+        return source["size"] if source and source["inode"] == inode else 0
+
+    def _cached(self, key, build):
+        with self._lock:
+            manifest = self.manifest()
+            if key not in self._cache:
+                self._cache[key] = build(manifest)
+            return self._cache[key]
+
+    # ---- columns ----
+
+    def column(self, name, partition):
+        """Memory-map one committed column of one partition."""
+        np = _numpy()
+        rows = {p["name"]: p["rows"] for p in self.manifest()["partitions"]}[partition]
+        if not rows:
+            return np.zeros(0, dtype=COLUMNS[name])
+        return np.memmap(self._path(partition, f"{name}.{COLUMNS[name][1:]}"),
+                         dtype=COLUMNS[name], mode="r", shape=(rows,))
+
+    def scan(self, columns, partitions=None):
+        """Yield ``(partition, {column: array})``, touching only what is asked for."""
+        for name in self.partitions():
+            if partitions is None or name in partitions:
+                yield name, {column: self.column(column, name) for column in columns}
+
+    def dictionary(self, kind):
+        return self._cached(kind, lambda m: _Dictionary(self.directory, kind, m[kind]["count"]))
+
+    def user_codes(self):
+        """{username: code}; usernames are few next to rows or display names."""
+        return self._cached("user_codes", lambda m: {
+            s: i for i, s in enumerate(self.dictionary("users").all())})
+
+    def _starts(self):
+        np = _numpy()
+        return self._cached("starts", lambda m: np.cumsum(
+            [0] + [p["rows"] for p in m["partitions"]], dtype=np.int64))
+
+    def _generation_file(self, prefix, dtype, count):
+        np = _numpy()
+
+        def build(manifest):
+            if not count:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(self._path(f"{prefix}-{manifest['generation']}.{dtype[1:]}"),
+                             dtype=dtype, mode="r", shape=(count,))
+        return self._cached(prefix, build)
+
+    def order(self):
+        """Archive row numbers ranked by score (best first, ties in archive order)."""
+        return self._generation_file("order", "<u4", len(self))
+
+    def rows(self, numbers):
+        """Result dicts for archive row numbers (in the given order)."""
+        np = _numpy()
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if not len(numbers):
+            return []
+        starts = self._starts()
+        partitions = self.partitions()
+        users, names = self.dictionary("users"), self.dictionary("names")
+        where = np.searchsorted(starts, numbers, side="right") - 1
+        out = [None] * len(numbers)
+        for part in np.unique(where):
+            picked = np.flatnonzero(where == part)
+            local = numbers[picked] - starts[part]
+            cols = {c: self.column(c, partitions[part])[local] for c in COLUMNS}
+            for k, i in enumerate(picked):
+                out[i] = {
+                    "Username": users.decode(cols["user"][k]),
+                    "Name": names.decode(cols["name"][k]),
+                    "Correct": int(cols["correct"][k]),
+                    "Incorrect": int(cols["incorrect"][k]),
+                    "Skipped": int(cols["skipped"][k]),
+                    "Score": int(cols["score"][k]),
+                }
+        return out
+
+    def ranked(self, start, count):
+        """Result dicts ranked ``start`` .. ``start + count`` among archived rows."""
+        return self.rows(self.order()[start:start + count])
+
+    def score_counts(self):
+        """[(score, archived rows with that score)], best score first."""
+        return [tuple(pair) for pair in self.manifest()["scores"]]
+
+    def best_score(self, username):
+        """The user's best archived score (None if they have no archived result)."""
+        code = self.user_codes().get(username)
+        if code is None:
+            return None
+        best = self._generation_file("best", "<i4", self.manifest()["users"]["count"])
+        return None if best[code] == NO_SCORE else int(best[code])
+
+    def results_for(self, username):
+        """Every archived result of ``username``, in archive order."""
+        np = _numpy()
+        code = self.user_codes().get(username)
+        if code is None:
+            return []
+        numbers = []
+        starts = self._starts()
+        for part, (_, cols) in enumerate(self.scan(["user"])):
+            numbers.extend((np.flatnonzero(cols["user"] == code) + starts[part]).tolist())
+        return self.rows(numbers)
+
+
+# ----------------- Compaction -----------------
+
+def _valid_partition(name):
+    if not re.fullmatch(r"[\w.-]+", name) or name.startswith("."):
+        raise ValueError(f"invalid partition name {name!r}")
+    return name
+
+
+def _append_at(path, committed, data):
+    """Cut ``path`` back to ``committed`` bytes, append ``data`` and fsync."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        os.ftruncate(fd, committed)
+        os.lseek(fd, committed, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_manifest(directory, manifest):
+    with filelock.atomic_write(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _write_generation_file(directory, prefix, generation, array):
+    name = f"{prefix}-{generation}.{array.dtype.str[1:]}"
+    with filelock.atomic_write(os.path.join(directory, name), "wb") as f:
+        f.write(array.tobytes())
+
+
+class _Encoder:
+    """Write side of a dictionary during one compaction."""
+
+    def __init__(self, archive, kind):
+        self.kind = kind
+        self.committed = archive.manifest()[kind]
+        self.codes = {s: i for i, s in enumerate(archive.dictionary(kind).all())}
+        self.fresh = []
+
+    def encode(self, texts):
+        """Codes for ``texts`` as a uint32 array, adding unseen strings."""
+        np = _numpy()
+        get = self.codes.get
+        codes = [get(text) for text in texts]
+        for i, found in enumerate(codes):
+            if found is None:
+                text = texts[i]
+                found = codes[i] = get(text)
+                if found is None:
+                    found = codes[i] = self.codes[text] = len(self.codes)
+                    self.fresh.append(text)
+        return np.array(codes, dtype="<u4")
+
+    def commit(self, directory):
+        """Append the new entries; returns the dictionary's manifest entry."""
+        np = _numpy()
+        encoded = [s.encode("utf-8") for s in self.fresh]
+        count, size = self.committed["count"], self.committed["bytes"]
+        ends = size + np.cumsum([len(e) for e in encoded], dtype=np.uint64)
+        _append_at(os.path.join(directory, f"{self.kind}.str"), size, b"".join(encoded))
+        _append_at(os.path.join(directory, f"{self.kind}.idx"), count * 8,
+                   ends.astype("<u8").tobytes())
+        return {"count": count + len(encoded), "bytes": size + sum(map(len, encoded))}
+
+
+@metrics.timed("quiz_archive_compact_seconds")
+def compact(results_file, partition=None, directory=None):
+    """
+    Fold every row of ``results_file`` into the archive and truncate the
+    CSV to its header. Returns the number of rows archived.
+    """
+    np = _numpy()
+    directory = directory or archive_dir(results_file)
+    partition = _valid_partition(partition or time.strftime("%Y-%m-%d", time.gmtime()))
+    archive = ResultsArchive(directory)
+    with filelock.locked(results_file):
+        if not os.path.exists(results_file):
+            return 0
+        os.makedirs(directory, exist_ok=True)
+        manifest = archive.manifest()
+        st = os.stat(results_file)
+        start = end = archive.folded_bytes(results_file)
+
+        users, names = _Encoder(archive, "users"), _Encoder(archive, "names")
+        fresh = {name: [] for name in COLUMNS}
+        for end, header, rows in read_live(results_file, start):
+            def column(field):
+                i = header.index(field)
+                return [row[i] for row in rows]
+
+            name = column("Name")
+            # results written by the old Streamlit app had no Username column
+            user = column("Username") if "Username" in header else name
+            fresh["user"].append(users.encode([u or n for u, n in zip(user, name)]))
+            fresh["name"].append(names.encode(name))
+            for column_name, field in CSV_FIELDS.items():
+                fresh[column_name].append(np.array(column(field)).astype("<i4"))
+        added = sum(len(c) for c in fresh["score"])
+
+        if added:
+            partitions = [dict(p) for p in manifest["partitions"]]
+            entry = next((p for p in partitions if p["name"] == partition), None)
+            if entry is None:
+                entry = {"name": partition, "rows": 0}
+                partitions.append(entry)
+            os.makedirs(os.path.join(directory, partition), exist_ok=True)
+            for name, dtype in COLUMNS.items():
+                path = os.path.join(directory, partition, f"{name}.{dtype[1:]}")
+                _append_at(path, entry["rows"] * np.dtype(dtype).itemsize,
+                           np.concatenate(fresh[name]).astype(dtype).tobytes())
+            entry["rows"] += added
+            dictionaries = {"users": users.commit(directory), "names": names.commit(directory)}
+
+            # derived, per generation: rank order and best score per user
+            generation = manifest["generation"] + 1
+            user, score = (np.concatenate([
+                np.memmap(os.path.join(directory, p["name"], f"{c}.{COLUMNS[c][1:]}"),
+                          dtype=COLUMNS[c], mode="r", shape=(p["rows"],))
+                for p in partitions if p["rows"]]) for c in ("user", "score"))
+            order = np.argsort(-score.astype(np.int64), kind="stable").astype("<u4")
+            _write_generation_file(directory, "order", generation, order)
+            best = np.full(dictionaries["users"]["count"], NO_SCORE, dtype="<i4")
+            np.maximum.at(best, user, score)
+            _write_generation_file(directory, "best", generation, best)
+            values, counts = np.unique(score, return_counts=True)
+
+            manifest = {
+                "generation": generation,
+                "partitions": partitions,
+                **dictionaries,
+                "scores": [[int(v), int(c)] for v, c in zip(values[::-1], counts[::-1])],
+                "source": {"inode": st.st_ino, "size": end},
+            }
+            _write_manifest(directory, manifest)
+            for prefix, suffix in (("order", "u4"), ("best", "i4")):
+                stale = os.path.join(directory, f"{prefix}-{generation - 1}.{suffix}")
+                if os.path.exists(stale):
+                    os.remove(stale)  # maps already open stay valid
+
+        if added or start:
+            # everything up to ``end`` is committed: keep only what came after it
+            with open(results_file, "rb") as f:
+                header = f.readline()
+                f.seek(max(end, len(header)))
+                tail = f.read()
+            with filelock.atomic_write(results_file, "wb") as f:
+                f.write(header + tail)
+            # the old inode is gone (and may be reused): forget it
+            _write_manifest(directory, {**manifest, "source": None})
+        metrics.inc("quiz_archive_rows_total", added)
+        return added
+
+
+# ----------------- Command line -----------------
+
+def main(argv=None):
+    import argparse
+
+    from storage import RESULTS_FILE
+
+    parser = argparse.ArgumentParser(description="Columnar results archive")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    comp = sub.add_parser("compact", help="fold results.csv into the archive")
+    comp.add_argument("--partition", help="partition name (default: today's UTC date)")
+    sub.add_parser("stats", help="rows and mean score per partition")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "compact":
+        try:
+            added = compact(args.results, args.partition)
+        except ValueError as exc:
+            print(f"❌ {exc}", file=sys.stderr)
+            return 2
+        print(f"✅ Archived {added} result(s) ({time.perf_counter() - started:.2f}s).")
+        return 0
+
+    archive = ResultsArchive(archive_dir(args.results))
+    print(f"{'partition':<20}{'rows':>12}{'mean score':>12}")
+    for name, cols in archive.scan(["score"]):
+        rows = len(cols["score"])
+        mean = float(cols["score"].mean()) if rows else 0.0
+        print(f"{name:<20}{rows:>12}{mean:>12.2f}")
+    manifest = archive.manifest()
+    print(f"✅ {len(archive)} archived result(s), {manifest['users']['count']} users, "
+          f"{manifest['names']['count']} names ({time.perf_counter() - started:.2f}s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+assembly.py
+
+Randomized, per-student exam assembly.
+
+Instead of the whole bank in file order, each student gets ``size``
+questions drawn without replacement, in shuffled order, with the three
+options shuffled as well (the key letter is remapped to match). Everything
+derives from one integer seed, by default a hash of the exam id and the
+student's name, so a student gets the same paper every time and any paper
+can be rebuilt from its seed (against the same bank) for review or
+re-grading.
+
+Sampling never touches question text. A SamplingIndex keeps, per stratum,
+the bank positions that belong to it (an array of uint32); an unstratified
+bank needs no table at all, only its size. Drawing k questions is
+``random.sample`` over those positions, O(k) for k well below the bank
+size, and only the k drawn questions are ever read.
+
+Strata come from an optional labels CSV of ``number,label`` rows (1-based
+bank numbers), e.g. a topic tag or a difficulty band. Each stratum gets a
+share of the exam proportional to its size unless explicit quotas are
+given; questions without a label form a stratum of their own.
+
+Configuration (environment; unset keeps the classic whole-bank exam):
+
+    QUIZ_EXAM_SIZE=40           questions per student
+    QUIZ_EXAM_ID=midterm        salt for per-student seeds (default "quiz")
+    QUIZ_EXAM_STRATA=tags.csv   labels file for stratified draws
+
+Example:
+    plan = assemble(get_sampling_index(), 40, student_seed("ann"))
+    session = ExamSession(plan=plan)
+"""
+
+import csv
+import hashlib
+import itertools
+import os
+import random
+import threading
+from array import array
+from collections import namedtuple
+
+import metrics
+from grading import OPTIONS
+from storage import get_storage
+
+PERMUTATIONS = tuple(itertools.permutations(range(len(OPTIONS))))
+
+ExamPlan = namedtuple("ExamPlan", "seed positions orders")
+ExamPlan.__doc__ = (
+    "A drawn exam: bank ``positions`` in exam order (array of uint32) and, "
+    "per question, an index into PERMUTATIONS for its option order (bytes)."
+)
+
+
+def exam_size():
+    """Questions per student from QUIZ_EXAM_SIZE (0 = the whole bank)."""
+    return max(0, int(os.environ.get("QUIZ_EXAM_SIZE", "0") or 0))
+
+
+def student_seed(username, exam_id=None):
+    """Stable 64-bit seed for one student's paper in one exam."""
+    exam_id = exam_id or os.environ.get("QUIZ_EXAM_ID", "quiz")
+    text = f"{exam_id}\x1f{username}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "little")
+
+
+def shuffle_options(opts, order):
+    """Apply PERMUTATIONS[order] to ``[a, b, c, key]``; returns (options, key letter)."""
+    perm = PERMUTATIONS[order]
+    options = [opts[i] for i in perm]
+    return options, OPTIONS[perm.index(OPTIONS.index(opts[3]))]
+
+
+# ----------------- Sampling index -----------------
+
+def load_labels(path):
+    """Read a ``number,label`` CSV into {0-based position: label}."""
+    labels = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip().isdigit():
+                continue  # header or blank line
+            labels[int(row[0]) - 1] = row[1].strip()
+    return labels
+
+
+class SamplingIndex:
+    """
+    Bank positions grouped by stratum, built from labels alone (no question
+    reads) and extended with new positions as the bank grows.
+    """
+
+    def __init__(self, storage=None, labels=None):
+        self.storage = storage or get_storage()
+        self.labels = labels
+        self.total = 0
+        self.strata = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Pick up questions appended since the last call; returns self."""
+        with self._lock:
+            total = self.storage.count_questions()
+            if total < self.total:  # bank was rewritten
+                self.total, self.strata = 0, {}
+            if self.labels is not None:
+                for n in range(self.total, total):
+                    self.strata.setdefault(self.labels.get(n), array("I")).append(n)
+            self.total = total
+        return self
+
+    def sizes(self):
+        """{stratum label: number of questions}; one ``None`` stratum if unlabeled."""
+        if self.labels is None:
+            return {None: self.total}
+        return {label: len(positions) for label, positions in self.strata.items()}
+
+    def population(self, label=None):
+        if self.labels is None:
+            return range(self.total)
+        return self.strata.get(label, ())
+
+
+def allocate(sizes, size, quotas=None):
+    """
+    Split ``size`` questions over strata: explicit ``quotas`` ({label: n},
+    capped by stratum size) or proportional shares by largest remainder.
+    """
+    if quotas:
+        return {label: min(int(n), sizes.get(label, 0)) for label, n in quotas.items()}
+    total = sum(sizes.values())
+    size = min(size, total)
+    if not size:
+        return {}
+    shares = {label: size * n / total for label, n in sizes.items()}
+    counts = {label: int(share) for label, share in shares.items()}
+    short = size - sum(counts.values())
+    by_remainder = sorted(shares, key=lambda label: (counts[label] - shares[label], str(label)))
+    for label in by_remainder[:short]:
+        counts[label] += 1
+    return counts
+
+
+@metrics.timed("quiz_exam_assemble_seconds")
+def assemble(index, size, seed, quotas=None):
+    """Draw one exam of ``size`` questions from ``index``; returns an ExamPlan."""
+    rng = random.Random(seed)
+    positions = array("I")
+    allocation = allocate(index.sizes(), size, quotas)
+    for label in sorted(allocation, key=str):
+        positions.extend(rng.sample(index.population(label), allocation[label]))
+    rng.shuffle(positions)
+    orders = bytes(rng.randrange(len(PERMUTATIONS)) for _ in positions)
+    metrics.inc("quiz_exams_assembled_total")
+    return ExamPlan(seed, positions, orders)
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def get_sampling_index(storage=None):
+    """
+    Process-wide index over ``storage`` (default ``get_storage()``),
+    stratified by QUIZ_EXAM_STRATA if set. Course banks (courses.py) and
+    published exams (snapshot.py) are not stratified: the labels number
+    the default bank.
+    """
+    storage = storage or get_storage()
+    strata = os.environ.get("QUIZ_EXAM_STRATA") or None
+    if storage is not get_storage(""):
+        strata = None
+    with _index_lock:
+        index = _indexes.get(storage)
+        if index is None or index[0] != strata:
+            labels = load_labels(strata) if strata else None
+            index = _indexes[storage] = (strata, SamplingIndex(storage, labels))
+    return index[1].refresh()
+
+
+def plan_for(username, size=None, quotas=None, storage=None):
+    """The configured paper for ``username`` (None means serve the whole bank)."""
+    size = exam_size() if size is None else size
+    if not size:
+        return None
+    return assemble(get_sampling_index(storage), size, student_seed(username), quotas)
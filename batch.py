@@ -0,0 +1,125 @@
+"""
+batch.py
+
+Headless batch sessions for main.py (``python main.py --batch FILE``).
+
+Each input line is one JSON exam attempt:
+
+    {"username": "student1", "password": "stud123", "name": "Ann",
+     "answers": ["a", "c", "d", "b"]}
+
+``answers`` follows question-bank order (a string such as "acdb" also
+works); missing or non a/b/c entries count as skips. Attempts with a
+``password`` go through login.login_with_credentials; add
+``"register": true`` to create unknown users (a registered user with a
+wrong password fails the attempt, it is never re-registered). Attempts
+without a password, e.g. for grading paper exams, are recorded in guest
+mode as ``guest_<username>``, never under an account.
+
+Every attempt is graded by grading.grade against the bank's key (loaded
+once per run) and saved through util.save_result, i.e. the same journaled
+batch writer the interactive exam uses. One JSON result per attempt is
+written to the output, and a summary goes to stderr.
+"""
+
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import pack_answers
+from exam import answer_key
+from grading import grade
+from login import login_with_credentials, user_exists
+from storage import get_storage
+from util import save_result
+
+WINDOW_PER_JOB = 4  # attempts read ahead per worker thread
+
+
+def _login(attempt):
+    username = str(attempt.get("username", "")).strip()
+    if not username:
+        raise ValueError("missing username")
+    password = attempt.get("password")
+    if password is None:
+        return "guest", f"guest_{username}"  # unauthenticated: never an account's record
+    registered = user_exists(username)
+    mode, name = login_with_credentials(username, str(password),
+                                        auto_register=bool(attempt.get("register")) and not registered)
+    if registered and mode != "user":
+        raise ValueError(f"wrong password for {username}")
+    return mode, name
+
+
+def run_attempt(attempt, key, course=None):
+    """Log in, grade and save one attempt; returns its result dict."""
+    mode, username = _login(attempt)
+    answers = list(attempt.get("answers") or [])
+    answers = (answers + [None] * len(key))[:len(key)]
+    result = grade(answers, key)
+    name = attempt.get("name") or username
+    save_result(username, name, result["correct"], result["incorrect"],
+                result["skipped"], result["score"],
+                pack_answers(answers, key, result["score"], range(len(key))), course)
+    return {"username": username, "name": name, "mode": mode, **result}
+
+
+def _parse(lines):
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, exc
+
+
+def run_batch(source, out, jobs=4):
+    """
+    Process every JSONL attempt from the ``source`` lines, writing results
+    to ``out``. Returns (ok, failed) counts.
+    """
+    storage = get_storage()
+    key = answer_key(storage)
+    course = getattr(storage, "course", None) or None
+    ok = failed = 0
+    started = time.perf_counter()
+
+    def one(item):
+        number, attempt = item
+        if isinstance(attempt, Exception):
+            return {"line": number, "error": f"invalid JSON: {attempt}"}
+        try:
+            return {"line": number, **run_attempt(attempt, key, course)}
+        except Exception as exc:
+            return {"line": number, "error": str(exc)}
+
+    def emit(result):
+        nonlocal ok, failed
+        if "error" in result:
+            failed += 1
+        else:
+            ok += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    # password hashing releases the GIL, so a few threads overlap logins;
+    # pool.map would read the whole input up front, so keep a bounded window
+    # of attempts in flight and write results in input order
+    jobs = max(1, jobs)
+    window = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for item in _parse(source):
+            if len(window) >= jobs * WINDOW_PER_JOB:
+                emit(window.popleft().result())
+            window.append(pool.submit(one, item))
+        while window:
+            emit(window.popleft().result())
+
+    elapsed = time.perf_counter() - started
+    rate = (ok + failed) / elapsed if elapsed else 0.0
+    print(f"✅ {ok} attempt(s) graded, {failed} failed, {rate:.0f}/s "
+          f"against a {len(key)}-question key.", file=sys.stderr)
+    return ok, failed
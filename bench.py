@@ -0,0 +1,445 @@
+"""
+bench.py
+
+Benchmark harness for the Quiz System hot paths.
+
+For each requested size it builds a synthetic data set in a scratch
+directory (question bank, user table, result history), then drives the
+real functions non-interactively, with ``input``, ``print`` and
+``slow_print`` stubbed out:
+
+    view_questions      teacher.view_questions over the whole bank
+    search_index        search.SearchIndex built over the whole bank
+    search_questions    200 ranked keyword searches on that index
+    start_exam          student.start_exam answering every question in the bank
+    start_exam_published  the same exam from a published snapshot (snapshot.py)
+    authenticate        login.authenticate, 200 lookups against the user table
+    resume_session      login.AuthService.resume, 200 session-token lookups
+                        (what a returning client costs instead of a hash)
+    assemble_exam       assembly.assemble, 200 per-student 40-question draws
+                        plus reading each drawn paper
+    save_result         util.save_result x 1000, then a sink flush
+    performance_board   util.performance_board (top 10), cold and warm
+
+Each case records wall time (best of --repeat), peak traced memory and the
+net number of allocated blocks, and the run is written to a JSON report.
+Two reports can be compared to catch regressions.
+
+``--grader 1,2,4`` measures the grading service (grader.py): for each
+worker count it starts the service on a fresh data set and reports
+submissions per second from concurrent client processes.
+
+``--startup`` instead measures the Streamlit app: the first script run
+(cold imports and resource set-up) and the median rerun of the home and
+leaderboard pages, each repeat in a fresh interpreter via Streamlit's
+AppTest harness (requires streamlit).
+
+Run:
+    python bench.py --sizes 100,10000,1000000 --out bench.json
+    python bench.py --startup [--repeat 5] --out startup.json
+    python bench.py --grader 1,2,4 [--clients 8] --out grader.json
+    python bench.py --compare old.json new.json [--threshold 1.2]
+"""
+
+import argparse
+import builtins
+import contextlib
+import csv
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import assembly
+import login
+import result_sink
+import search
+import snapshot
+import storage
+import student
+import teacher
+import util
+from qbank import write_bank
+from userstore import CSV_HEADER, hash_password, set_hash_iterations
+
+DEFAULT_SIZES = "100,1000,10000"
+AUTH_LOOKUPS = 200
+EXAM_DRAWS = 200
+SEARCHES = 200
+RESULT_WRITES = 1000
+BENCH_HASH_ITERATIONS = 1000  # keep synthetic users cheap to verify
+
+
+# ----------------- Synthetic data -----------------
+
+def make_bank(path, size, rng):
+    def questions():
+        for i in range(size):
+            yield f"Synthetic question {i}?", [f"opt a {i}", f"opt b {i}", f"opt c {i}",
+                                               rng.choice("abc")]
+    write_bank(path, questions())
+
+
+def make_users(path, size):
+    # one shared hash keeps generation linear; lookups are what we measure
+    stored = hash_password("password", BENCH_HASH_ITERATIONS)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows((f"user{i}", stored) for i in range(size))
+
+
+def make_results(path, size, rng):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(storage.RESULTS_HEADER)
+        for i in range(size):
+            c, w = rng.randint(0, 20), rng.randint(0, 5)
+            writer.writerow([f"user{i % 997}", f"Student {i}", c, w, 0, c * 4 - w])
+
+
+# ----------------- Harness -----------------
+
+@contextlib.contextmanager
+def quiet(answers=()):
+    """Stub out interactive I/O: input() returns ``answers`` in a cycle."""
+    answers = list(answers) or [""]
+    counter = iter(range(sys.maxsize))
+    saved = (builtins.input, builtins.print, util.slow_print,
+             teacher.slow_print, student.slow_print)
+    builtins.input = lambda prompt="": answers[next(counter) % len(answers)]
+    builtins.print = lambda *a, **k: None
+    util.slow_print = teacher.slow_print = student.slow_print = lambda *a, **k: None
+    try:
+        yield
+    finally:
+        (builtins.input, builtins.print, util.slow_print,
+         teacher.slow_print, student.slow_print) = saved
+
+
+def install_backend(workdir):
+    """Point the process-wide storage and sink at a fresh data set."""
+    backend = storage.FileStorage(
+        os.path.join(workdir, "quest.bin"),
+        os.path.join(workdir, "data", "user.csv"),
+        os.path.join(workdir, "results.csv"),
+    )
+    storage.set_storage(backend)
+    sink = result_sink.ResultSink(backend, os.path.join(workdir, "results.journal"),
+                                  fsync=False, answer_log=os.path.join(workdir, "answers.bin"))
+    result_sink.set_sink(sink)
+    return backend, sink
+
+
+def measure(func, repeat, trace_memory):
+    """Return (best wall seconds, peak traced bytes, net allocated blocks)."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    peak = blocks = None
+    if trace_memory:
+        gc.collect()
+        before = sys.getallocatedblocks()
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        blocks = sys.getallocatedblocks() - before
+    return best, peak, blocks
+
+
+def run_size(size, repeat, trace_memory, seed):
+    rng = random.Random(seed)
+    set_hash_iterations(BENCH_HASH_ITERATIONS)  # don't re-hash every synthetic user
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="quizbench-") as workdir:
+        make_bank(os.path.join(workdir, "quest.bin"), size, rng)
+        make_users(os.path.join(workdir, "data", "user.csv"), size)
+        make_results(os.path.join(workdir, "results.csv"), size, rng)
+        backend, sink = install_backend(workdir)
+        # the first reply is the student's name; answers then cycle
+        exam_answers = ["Bench Student"] + [rng.choice("abcd") for _ in range(997)]
+
+        def exam():
+            with quiet(exam_answers):
+                student.start_exam("bench")
+
+        os.environ["QUIZ_EXAMS_DIR"] = os.path.join(workdir, "exams")
+        published = snapshot.publish("bench", None, backend)
+
+        def exam_published():
+            os.environ["QUIZ_EXAM_SNAPSHOT"] = published.name
+            try:
+                exam()
+            finally:
+                del os.environ["QUIZ_EXAM_SNAPSHOT"]
+
+        def auth():
+            for _ in range(AUTH_LOOKUPS):
+                login.authenticate(f"user{rng.randrange(size)}", "password")
+
+        index = search.SearchIndex(backend)
+
+        def build_index():
+            index._reset()
+            index.refresh()
+
+        queries = [f"question {rng.randrange(size)}" for _ in range(SEARCHES)]
+
+        def find():
+            for query in queries:
+                index.search(query)
+
+        service = login.AuthService(backend)
+        tokens = [service.issue(f"user{rng.randrange(size)}") for _ in range(AUTH_LOOKUPS)]
+
+        def resume():
+            for token in tokens:
+                service.resume(token)
+
+        def draw():
+            index = assembly.SamplingIndex(backend)
+            for seed in range(EXAM_DRAWS):
+                plan = assembly.assemble(index, 40, seed)
+                backend.get_questions(plan.positions)
+
+        def save():
+            for i in range(RESULT_WRITES):
+                util.save_result("bench", "Bench", 1, 0, 0, i % 50)
+            sink.flush()
+
+        def board():
+            with quiet():
+                util.performance_board(limit=10)
+
+        def board_cold():
+            backend.board._reset()
+            board()
+
+        cases = [
+            ("view_questions", lambda: _quietly(teacher.view_questions)),
+            ("search_index", build_index),
+            ("search_questions", find),
+            ("start_exam", exam),
+            ("start_exam_published", exam_published),
+            ("authenticate", auth),
+            ("resume_session", resume),
+            ("assemble_exam", draw),
+            ("save_result", save),
+            ("performance_board_cold", board_cold),
+            ("performance_board", board),
+        ]
+        for name, func in cases:
+            wall, peak, blocks = measure(func, repeat, trace_memory)
+            rows.append({"case": name, "size": size, "wall_s": round(wall, 6),
+                         "peak_bytes": peak, "alloc_blocks": blocks})
+            print(f"{name:<24}{size:>10}{wall * 1000:>12.2f} ms"
+                  + (f"{peak / 1024:>12.0f} KiB" if peak is not None else ""))
+        sink.close()
+        os.environ.pop("QUIZ_EXAMS_DIR", None)
+    return rows
+
+
+def _quietly(func):
+    with quiet():
+        func()
+
+
+# ----------------- Streamlit start-up -----------------
+
+STARTUP_SNIPPET = r"""
+import json, os, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+framework = time.perf_counter() - started
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+started = time.perf_counter()
+at.run()
+first = time.perf_counter() - started
+reruns = []
+for label in ["\U0001f3c6 Performance Board", "\U0001f3e0 Home"]:
+    at.sidebar.radio[0].set_value(label).run()
+    for _ in range(10):
+        started = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - started)
+print(json.dumps({"framework_import_s": framework, "first_run_s": first,
+                  "rerun_s": sorted(reruns)[len(reruns) // 2],
+                  "modules": len(sys.modules), "pandas": "pandas" in sys.modules}))
+"""
+
+
+def run_startup(repeat):
+    """Time the app's cold start and reruns in fresh interpreters."""
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    samples = []
+    with tempfile.TemporaryDirectory(prefix="quizbench-") as workdir:
+        make_bank(os.path.join(workdir, "quest.bin"), 1000, random.Random(0))
+        make_results(os.path.join(workdir, "results.csv"), 10000, random.Random(0))
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", STARTUP_SNIPPET, app_path], cwd=workdir,
+                capture_output=True, text=True, check=True,
+                env={**os.environ, "PYTHONPATH": os.path.dirname(app_path)},
+            ).stdout
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+    rows = []
+    for case in ("first_run_s", "rerun_s"):
+        best = min(s[case] for s in samples)
+        rows.append({"case": f"app_{case[:-2]}", "size": 1000, "wall_s": round(best, 6),
+                     "peak_bytes": None, "alloc_blocks": None})
+        print(f"{'app_' + case[:-2]:<24}{best * 1000:>12.2f} ms")
+    print(f"modules loaded: {samples[0]['modules']}, pandas imported: {samples[0]['pandas']}")
+    return rows
+
+
+GRADER_SUBMISSIONS = 2000  # per client process
+GRADER_CLIENT_SNIPPET = """
+import json, random, sys, time
+from grader import GraderClient
+path, count, bank, seed = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+rng = random.Random(seed)
+client = GraderClient(path)
+client.ping()
+sheets = [[rng.choice("abc") for _ in range(bank)] for _ in range(16)]
+started = time.time()
+for i in range(count):
+    client.submit(f"user{seed}-{i}", "Bench", sheets[i % len(sheets)])
+print(json.dumps({"started": started, "finished": time.time(), "count": count}))
+"""
+
+
+def _wait_for_socket(path, proc, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not os.path.exists(path):
+        if proc.poll() is not None or time.perf_counter() > deadline:
+            raise RuntimeError("grading service did not start")
+        time.sleep(0.02)
+
+
+def run_grader(worker_counts, clients, bank_size=40):
+    """Submissions/s through grader.py for each worker count."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": here, "QUIZ_JOURNAL_FSYNC": "0"}
+    rows = []
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory(prefix="quizbench-") as workdir:
+            make_bank(os.path.join(workdir, "quest.bin"), bank_size, random.Random(0))
+            path = os.path.join(workdir, "grader.sock")
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(here, "grader.py"),
+                 "--socket", path, "--workers", str(workers)],
+                cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+            try:
+                _wait_for_socket(path, server)
+                procs = [subprocess.Popen(
+                    [sys.executable, "-c", GRADER_CLIENT_SNIPPET, path,
+                     str(GRADER_SUBMISSIONS), str(bank_size), str(i)],
+                    cwd=workdir, env=env, stdout=subprocess.PIPE, text=True)
+                    for i in range(clients)]
+                samples = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+            finally:
+                server.terminate()
+                server.wait()
+            with open(os.path.join(workdir, "results.csv")) as f:
+                recorded = sum(1 for _ in f) - 1
+        total = sum(s["count"] for s in samples)
+        wall = max(s["finished"] for s in samples) - min(s["started"] for s in samples)
+        if recorded != total:
+            print(f"⚠️ {recorded} of {total} submissions reached results.csv")
+        rows.append({"case": f"grader_{workers}w", "size": total, "wall_s": round(wall, 6),
+                     "peak_bytes": None, "alloc_blocks": None,
+                     "per_s": round(total / wall, 1)})
+        print(f"{f'grader_{workers}w':<24}{total:>10}{wall * 1000:>12.2f} ms"
+              f"{total / wall:>12.0f}/s")
+    return rows
+
+
+# ----------------- Reports -----------------
+
+def compare(old_path, new_path, threshold):
+    """Print per-case time ratios; returns the number of regressions."""
+    with open(old_path) as f:
+        old = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressions = 0
+    print(f"{'case':<24}{'size':>10}{'old ms':>12}{'new ms':>12}{'ratio':>8}")
+    for row in new:
+        before = old.get((row["case"], row["size"]))
+        if before is None or not before["wall_s"]:
+            continue
+        ratio = row["wall_s"] / before["wall_s"]
+        flag = "  ⚠️ regression" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{row['case']:<24}{row['size']:>10}{before['wall_s'] * 1000:>12.2f}"
+              f"{row['wall_s'] * 1000:>12.2f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quiz System benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated data set sizes (e.g. 100,1e5,1e7)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc pass (faster for large sizes)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--startup", action="store_true",
+                        help="benchmark the Streamlit app's cold start and reruns")
+    parser.add_argument("--grader", metavar="WORKERS",
+                        help="benchmark grader.py with these worker counts (e.g. 1,2,4)")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="client processes for --grader")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    sizes = [int(float(s)) for s in args.sizes.split(",") if s]
+    results = []
+    if args.startup:
+        sizes = [1000]
+        results.extend(run_startup(args.repeat))
+    elif args.grader:
+        workers = [int(w) for w in args.grader.split(",") if w]
+        sizes = [args.clients * GRADER_SUBMISSIONS]
+        print(f"{'case':<24}{'submits':>10}{'wall':>15}{'rate':>14}  ({os.cpu_count()} CPUs)")
+        results.extend(run_grader(workers, args.clients))
+    else:
+        print(f"{'case':<24}{'size':>10}{'wall':>15}{'peak':>16}")
+        for size in sizes:
+            results.extend(run_size(size, args.repeat, not args.no_memory, args.seed))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sizes": sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+bulk.py
+
+Streaming bulk import and export of the question bank (CSV or JSONL).
+
+Rows are read lazily and validated one at a time the way
+teacher.add_question does: a question, three non-empty options and a
+correct answer of a, b or c. Valid rows are checked against a hash index
+of the bank (and of the rows already accepted from the same file) so
+re-importing a file, or a file with repeats, adds nothing twice. Accepted
+rows are written in chunks, each chunk one batched append through
+``Storage.add_questions``, so memory stays flat however large the input.
+
+CSV files need a header row with the columns ``question,a,b,c,answer``.
+JSONL lines are objects with the same keys, or ``[question, a, b, c,
+answer]`` lists. Export writes the same layouts, in bank order.
+
+Run:
+    python bulk.py import bank.csv [--chunk-size 1000] [--dry-run]
+    python bulk.py export bank.jsonl [--format jsonl]
+    python bulk.py import bio101.csv --course bio101     (a course bank, see courses.py)
+    (use '-' for stdin/stdout; the format defaults to the file extension)
+"""
+
+import csv
+import hashlib
+import json
+import sys
+import time
+
+import metrics
+from storage import get_storage
+
+FIELDS = ("question", "a", "b", "c", "answer")
+CHUNK_SIZE = 1000
+MAX_ERRORS = 50  # errors kept in the report; the rest are only counted
+
+
+# ----------------- Validation -----------------
+
+def validate(fields):
+    """
+    Check one row (a sequence in FIELDS order); returns ``(question, [a, b,
+    c, answer])`` with whitespace stripped. Raises ValueError if invalid.
+    """
+    if len(fields) != len(FIELDS):
+        raise ValueError(f"expected {len(FIELDS)} fields, got {len(fields)}")
+    question, a, b, c, answer = (str(f if f is not None else "").strip() for f in fields)
+    if not question:
+        raise ValueError("empty question")
+    if not (a and b and c):
+        raise ValueError("all three options are required")
+    answer = answer.lower()
+    if answer not in ("a", "b", "c"):
+        raise ValueError(f"answer must be a, b or c, got {answer!r}")
+    return question, [a, b, c, answer]
+
+
+def fingerprint(question, opts):
+    """64-bit hash of a question and its options, ignoring case and spacing."""
+    text = "\x1f".join(" ".join(str(s).split()).casefold() for s in (question, *opts[:3]))
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def hash_index(storage):
+    """Fingerprints of every question in the bank, streamed page by page."""
+    return {fingerprint(q, opts) for q, opts in storage.iter_questions()}
+
+
+# ----------------- Readers -----------------
+
+def read_csv(lines):
+    """Yield (line number, fields or ValueError) for a CSV source."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [h.strip().lower() for h in header]
+    if any(name not in names for name in FIELDS):
+        raise ValueError(f"CSV header must include the columns {','.join(FIELDS)}")
+    columns = [names.index(name) for name in FIELDS]
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != len(names):
+            yield reader.line_num, ValueError(f"expected {len(names)} columns, got {len(row)}")
+            continue
+        yield reader.line_num, [row[i] for i in columns]
+
+
+def read_jsonl(lines):
+    """Yield (line number, fields or ValueError) for a JSONL source."""
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f"invalid JSON: {exc}")
+            continue
+        if isinstance(item, dict):
+            yield number, [item.get(name) for name in FIELDS]
+        elif isinstance(item, list):
+            yield number, item
+        else:
+            yield number, ValueError("expected an object or a list")
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def guess_format(path, default="csv"):
+    if path.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if path.endswith(".csv"):
+        return "csv"
+    return default
+
+
+# ----------------- Import / export -----------------
+
+@metrics.timed("quiz_bulk_import_seconds")
+def import_questions(source, fmt="csv", storage=None, chunk_size=CHUNK_SIZE,
+                     dry_run=False, errors=None):
+    """
+    Validate, dedupe and append every row from the ``source`` lines.
+
+    Invalid rows are skipped and reported (to ``errors``, a text stream, as
+    they are found). With ``dry_run`` nothing is written. Returns a report
+    dict with read/added/duplicates/invalid counts and the first errors.
+    """
+    storage = storage or get_storage()
+    seen = hash_index(storage)
+    report = {"read": 0, "added": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            storage.add_questions(chunk)
+        report["added"] += len(chunk)
+        metrics.inc("quiz_bulk_imported_total", len(chunk))
+        chunk.clear()
+
+    for number, fields in READERS[fmt](source):
+        report["read"] += 1
+        try:
+            if isinstance(fields, Exception):
+                raise fields
+            question, opts = validate(fields)
+        except ValueError as exc:
+            report["invalid"] += 1
+            if len(report["errors"]) < MAX_ERRORS:
+                report["errors"].append({"line": number, "error": str(exc)})
+            if errors is not None:
+                errors.write(f"line {number}: {exc}\n")
+            continue
+        key = fingerprint(question, opts)
+        if key in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(key)
+        chunk.append((question, opts))
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return report
+
+
+@metrics.timed("quiz_bulk_export_seconds")
+def export_questions(out, fmt="csv", storage=None):
+    """Stream the whole bank to ``out``; returns the number of questions."""
+    storage = storage or get_storage()
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for q, opts in storage.iter_questions():
+            writer.writerow([q, *opts[:4]])
+            count += 1
+    else:
+        for q, opts in storage.iter_questions():
+            row = dict(zip(FIELDS, [q, *opts[:4]]))
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+# ----------------- Command line -----------------
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk question import/export")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="add questions from a CSV/JSONL file")
+    imp.add_argument("file", help="input file ('-' for stdin)")
+    imp.add_argument("--format", choices=sorted(READERS))
+    imp.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    imp.add_argument("--dry-run", action="store_true", help="validate only")
+    exp = sub.add_parser("export", help="write the bank to a CSV/JSONL file")
+    exp.add_argument("file", help="output file ('-' for stdout)")
+    exp.add_argument("--format", choices=sorted(READERS))
+    for command in (imp, exp):
+        command.add_argument("--course", help="course bank (default: QUIZ_COURSE, else quest.bin)")
+    args = parser.parse_args(argv)
+    fmt = args.format or guess_format(args.file)
+
+    started = time.perf_counter()
+    if args.command == "import":
+        source = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+        try:
+            report = import_questions(source, fmt, get_storage(args.course),
+                                      chunk_size=max(1, args.chunk_size),
+                                      dry_run=args.dry_run, errors=sys.stderr)
+        except ValueError as exc:
+            print(f"❌ {exc}", file=sys.stderr)
+            return 2
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        verb = "would be added" if args.dry_run else "added"
+        print(f"✅ {report['read']} rows read: {report['added']} {verb}, "
+              f"{report['duplicates']} duplicates, {report['invalid']} invalid "
+              f"({time.perf_counter() - started:.2f}s).", file=sys.stderr)
+        return 1 if report["invalid"] else 0
+
+    out = sys.stdout if args.file == "-" else open(args.file, "w", newline="", encoding="utf-8")
+    try:
+        count = export_questions(out, fmt, get_storage(args.course))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ Exported {count} questions ({time.perf_counter() - started:.2f}s).",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
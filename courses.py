@@ -0,0 +1,390 @@
+"""
+courses.py
+
+Per-course question banks ("shards") for hosting many courses in one
+process.
+
+Each course keeps its own indexed bank (qbank.py) under the courses
+directory (``courses/``, or QUIZ_COURSES_DIR), and ``catalog.json`` there
+lists every shard with its title, path, question count and size in bytes,
+so courses can be listed without opening a single bank:
+
+    courses/
+        catalog.json          {"version": 1, "courses": {"bio101": {...}, ...}}
+        bio101/quest.bin      (+ quest.bin.idx)
+        chem200/quest.bin
+
+Shards are opened lazily, on a course's first question read, through a
+ShardPool. The pool keeps the open shards in LRU order and keeps their
+estimated resident size (decoded question pages plus file buffers) under
+a memory budget (QUIZ_BANK_MEMORY_MB, default 64) and their number under
+QUIZ_BANK_MAX_OPEN (default 256, for file handles). A shard that does not
+fit is closed and simply reopened on its next use.
+
+``CourseStorage`` is the Storage view of one course: questions come from
+the course's shard, while users and results stay with the process-wide
+backend (file or SQLite), so logins and the leaderboard are shared across
+courses. ``storage.get_storage(course)`` returns it, and QUIZ_COURSE
+picks the course for the CLI tools (teacher, student, bulk imports); with
+no course set, the classic single ``quest.bin`` bank is used.
+
+Exam assembly from a course is unstratified: QUIZ_EXAM_STRATA numbers
+refer to the default bank.
+
+Run:
+    python courses.py create bio101 [--title "Biology 101"]
+    python courses.py list
+    python courses.py scan              # rebuild catalog.json from the shard files
+    QUIZ_COURSE=bio101 python bulk.py import bio101.csv
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import filelock
+import metrics
+from qbank import HEADER, OFFSET, QUESTIONS_FILE, BankCache, create_bank, index_path
+from storage import Storage, get_storage, questions_added
+
+COURSES_DIR = "courses"
+CATALOG_FILE = "catalog.json"
+CATALOG_VERSION = 1
+COURSE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+MEMORY_BUDGET = int(float(os.environ.get("QUIZ_BANK_MEMORY_MB", 64)) * 1024 * 1024)
+MAX_OPEN = int(os.environ.get("QUIZ_BANK_MAX_OPEN", 256))
+TRIM_EVERY = 256   # shard accesses between budget checks (plus one per shard opened)
+
+
+def courses_dir():
+    return os.environ.get("QUIZ_COURSES_DIR", COURSES_DIR)
+
+
+def _shard_size(path):
+    """(questions, bytes) of a shard from its file sizes, without opening it."""
+    try:
+        data, idx = os.path.getsize(path), os.path.getsize(index_path(path))
+    except FileNotFoundError:
+        return 0, 0
+    return idx // OFFSET.size, max(data - HEADER.size, 0)
+
+
+# ----------------- Catalog -----------------
+
+class Catalog:
+    """The course manifest: which shards exist, where, and how big they are."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or courses_dir()
+        self.path = os.path.join(self.directory, CATALOG_FILE)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._courses = {}
+
+    def _load(self):
+        """The catalog's course map, re-read only when the file changed."""
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            if signature != self._signature:
+                courses = {}
+                if signature is not None:
+                    with open(self.path, encoding="utf-8") as f:
+                        state = json.load(f)
+                    if state.get("version") != CATALOG_VERSION:
+                        raise ValueError(f"{self.path}: unsupported catalog version")
+                    courses = state["courses"]
+                self._courses, self._signature = courses, signature
+            return self._courses
+
+    def _update(self, change):
+        """Apply ``change(courses)`` to the on-disk catalog under its lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        with filelock.locked(self.path):
+            with self._lock:
+                self._signature = None  # re-read: another process may have written
+            courses = dict(self._load())
+            change(courses)
+            with filelock.atomic_write(self.path, "w", encoding="utf-8") as f:
+                json.dump({"version": CATALOG_VERSION, "courses": courses}, f,
+                          ensure_ascii=False, indent=1, sort_keys=True)
+
+    # ---- queries ----
+
+    def courses(self):
+        """Every course as a dict (course, title, path, questions, bytes), by name."""
+        return [{"course": name, **entry} for name, entry in sorted(self._load().items())]
+
+    def __contains__(self, course):
+        return course in self._load()
+
+    def __len__(self):
+        return len(self._load())
+
+    def shard_path(self, course):
+        entry = self._load().get(course)
+        if entry is None:
+            raise ValueError(f"Unknown course {course!r}. Create it with: python courses.py create {course}")
+        return os.path.join(self.directory, entry["path"])
+
+    # ---- updates ----
+
+    def create(self, course, title=None):
+        """Add an empty shard for ``course`` (no-op if it exists); returns its path."""
+        if not COURSE_NAME.match(course):
+            raise ValueError("Course names are letters, digits, '_', '.' and '-' (max 64).")
+        path = os.path.join(self.directory, course, QUESTIONS_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        create_bank(path)
+
+        def add(courses):
+            entry = courses.setdefault(course, {"path": os.path.join(course, QUESTIONS_FILE)})
+            entry["title"] = title or entry.get("title") or course
+            entry["questions"], entry["bytes"] = _shard_size(path)
+
+        self._update(add)
+        metrics.inc("quiz_courses_created_total")
+        return path
+
+    def record(self, course):
+        """Refresh ``course``'s question count and size after a write to its shard."""
+        path = self.shard_path(course)
+
+        def refresh(courses):
+            if course in courses:
+                courses[course]["questions"], courses[course]["bytes"] = _shard_size(path)
+
+        self._update(refresh)
+
+    def scan(self):
+        """Rebuild the catalog from the shard directories; returns the course count."""
+        found = {}
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, name, QUESTIONS_FILE)
+                if COURSE_NAME.match(name) and os.path.isfile(path):
+                    found[name] = path
+
+        def rebuild(courses):
+            for name in list(courses):
+                if name not in found:
+                    del courses[name]
+            for name, path in found.items():
+                entry = courses.setdefault(name, {"title": name})
+                entry["path"] = os.path.join(name, QUESTIONS_FILE)
+                entry["questions"], entry["bytes"] = _shard_size(path)
+
+        self._update(rebuild)
+        return len(found)
+
+
+# ----------------- Shard pool -----------------
+
+class ShardPool:
+    """Lazily opened course banks, evicted LRU-first beyond a memory budget."""
+
+    def __init__(self, catalog, budget=MEMORY_BUDGET, max_open=MAX_OPEN):
+        self.catalog = catalog
+        self.budget = budget
+        self.max_open = max_open
+        self.loads = self.evictions = 0
+        self._shards = OrderedDict()   # course -> BankCache, least recently used first
+        self._lock = threading.Lock()
+        self._since_trim = 0
+
+    def get(self, course):
+        """The (lazily opened) bank cache of ``course``."""
+        with self._lock:
+            cache = self._shards.get(course)
+            if cache is None:
+                cache = self._shards[course] = BankCache(self.catalog.shard_path(course))
+                self.loads += 1
+                metrics.inc("quiz_bank_shard_loads_total")
+                self._since_trim = TRIM_EVERY
+            else:
+                self._shards.move_to_end(course)
+            self._since_trim += 1
+            if self._since_trim >= TRIM_EVERY:
+                self._since_trim = 0
+                self._trim(keep=course)
+            return cache
+
+    def _trim(self, keep):
+        """Close least recently used shards until the rest fit the budget."""
+        sizes = {course: cache.resident_bytes() for course, cache in self._shards.items()}
+        total = sum(sizes.values())
+        for course in list(self._shards):
+            if total <= self.budget and len(self._shards) <= self.max_open:
+                break
+            if course == keep:
+                continue
+            self._shards.pop(course).close()
+            total -= sizes[course]
+            self.evictions += 1
+            metrics.inc("quiz_bank_shard_evictions_total")
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(cache.resident_bytes() for cache in self._shards.values())
+
+    def stats(self):
+        with self._lock:
+            open_shards = len(self._shards)
+        return {"open": open_shards, "loads": self.loads, "evictions": self.evictions,
+                "resident_bytes": self.resident_bytes(), "budget_bytes": self.budget}
+
+
+# ----------------- Storage view -----------------
+
+class CourseStorage(Storage):
+    """One course's questions, with users and results from the shared backend."""
+
+    def __init__(self, course, pool):
+        self.course = course
+        self.pool = pool
+
+    @property
+    def bank(self):
+        return self.pool.get(self.course)
+
+    @property
+    def base(self):
+        return get_storage("")
+
+    # ---- questions ----
+
+    def add_question(self, question, a, b, c, ans):
+        index = self.bank.append(question, a, b, c, ans)
+        self.pool.catalog.record(self.course)
+        questions_added(self, [index])
+        return index
+
+    @metrics.timed("quiz_storage_add_questions_seconds")
+    def add_questions(self, questions):
+        indexes = self.bank.extend(questions)
+        self.pool.catalog.record(self.course)
+        questions_added(self, indexes)
+        return indexes
+
+    def count_questions(self):
+        return len(self.bank)
+
+    def get_question(self, n):
+        return self.bank.get(n)
+
+    @metrics.timed("quiz_storage_get_questions_seconds")
+    def get_questions(self, positions):
+        return self.bank.get_many(positions)
+
+    @metrics.timed("quiz_storage_question_page_seconds")
+    def question_page(self, start, size):
+        return self.bank.page(start, size)
+
+    # ---- users and results: shared ----
+
+    def get_user(self, username):
+        return self.base.get_user(username)
+
+    def set_user(self, username, stored_hash, replace=False):
+        self.base.set_user(username, stored_hash, replace)
+
+    def list_users(self):
+        return self.base.list_users()
+
+    def count_users(self):
+        return self.base.count_users()
+
+    def save_results(self, rows):
+        self.base.save_results(rows)
+
+    def top_results(self, limit=None, offset=0):
+        return self.base.top_results(limit, offset)
+
+    def count_results(self):
+        return self.base.count_results()
+
+    def rank_of(self, username):
+        return self.base.rank_of(username)
+
+    def results_for(self, username):
+        return self.base.results_for(username)
+
+    def stats(self):
+        return {**self.bank.stats(), "course": self.course, "shards": self.pool.stats()}
+
+
+_pool = None
+_views = {}
+_pool_lock = threading.Lock()
+
+
+def get_catalog():
+    """The process-wide catalog of ``courses_dir()``."""
+    return get_pool().catalog
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.catalog.directory != courses_dir():
+            _pool = ShardPool(Catalog())
+            _views.clear()
+            metrics.gauge("quiz_bank_shards_open", lambda: len(_pool._shards),
+                          "Course banks currently open")
+            metrics.gauge("quiz_bank_shards_resident_bytes", lambda: _pool.resident_bytes(),
+                          "Estimated memory held by open course banks")
+        return _pool
+
+
+def course_storage(course):
+    """The process-wide CourseStorage of ``course`` (ValueError if it is unknown)."""
+    pool = get_pool()
+    pool.catalog.shard_path(course)  # fail fast on unknown courses
+    with _pool_lock:
+        view = _views.get(course)
+        if view is None:
+            view = _views[course] = CourseStorage(course, pool)
+        return view
+
+
+# ----------------- Command line -----------------
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-course question banks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    make = sub.add_parser("create", help="add an empty course bank")
+    make.add_argument("course")
+    make.add_argument("--title")
+    sub.add_parser("list", help="list courses from the catalog")
+    sub.add_parser("scan", help="rebuild the catalog from the shard files")
+    args = parser.parse_args(argv)
+
+    catalog = get_catalog()
+    try:
+        if args.command == "create":
+            path = catalog.create(args.course, args.title)
+            print(f"✅ Course {args.course} ready at {path}.")
+        elif args.command == "scan":
+            print(f"✅ Catalog lists {catalog.scan()} course(s).")
+        else:
+            courses = catalog.courses()
+            for entry in courses:
+                print(f"{entry['course']:<20}{entry['questions']:>10} questions"
+                      f"{entry['bytes'] / 1024:>10.0f} KiB  {entry['title']}")
+            print(f"{len(courses)} course(s) in {catalog.path}.", file=sys.stderr)
+    except ValueError as exc:
+        print(f"❌ {exc}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+dedupe.py
+
+Duplicate and near-duplicate detection over question text.
+
+Two indexes are kept per bank, both built with one streaming pass and then
+extended incrementally as questions are appended:
+
+    exact   hash of the normalized text (case, spacing and punctuation
+            ignored) -> first question with that text; O(1) lookups
+    near    MinHash signatures of character 5-gram shingles, split into
+            LSH bands; questions sharing any band are candidates, and
+            candidates are confirmed by the exact Jaccard similarity of
+            their shingle sets
+
+Signatures use one-permutation hashing: each shingle hash is computed
+once and lands in one of SIG_BINS bins (empty bins borrow from the next
+filled one), so indexing a question is linear in its length. With 8 bands
+of 4 rows, pairs above ~0.6 similarity almost always collide and pairs
+below ~0.3 rarely do. A query only looks at its bucket-mates, so the whole-
+bank report costs about one lookup per question instead of n² comparisons.
+Signatures are also kept packed (SIG_BINS uint32s per question), and a
+candidate's text is fetched for the exact check only when the signatures
+agree closely enough.
+
+Only the first copy of an exact duplicate enters the LSH buckets, so large
+groups of identical questions do not make buckets grow.
+
+Example:
+    from dedupe import get_index
+    for match in get_index().check("What is Chemistry?"):
+        print(match.number, match.similarity, match.text)
+
+Run (whole-bank report):
+    python dedupe.py [--threshold 0.7] [--json]
+"""
+
+import hashlib
+import operator
+import re
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+import metrics
+from storage import get_storage
+
+SHINGLE = 5
+SIG_BINS = 32
+BANDS = 8
+ROWS = SIG_BINS // BANDS
+THRESHOLD = 0.7
+PREFILTER_SLACK = 0.2  # estimated similarity may undershoot the real one by this much
+
+Match = namedtuple("Match", "number similarity text")  # number is 1-based
+
+
+# ----------------- Text features -----------------
+
+def normalize(text):
+    """Lower-case words only, single-spaced."""
+    return " ".join(re.findall(r"\w+", str(text).casefold()))
+
+
+def exact_key(text):
+    digest = hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def shingles(text):
+    """Set of hashed character shingles of the normalized text."""
+    norm = normalize(text)
+    if len(norm) <= SHINGLE:
+        return {zlib.crc32(norm.encode("utf-8"))}
+    data = norm.encode("utf-8")
+    return {zlib.crc32(data[i:i + SHINGLE]) for i in range(len(data) - SHINGLE + 1)}
+
+
+def signature(shingle_set):
+    """One-permutation MinHash signature (SIG_BINS values)."""
+    bins = [None] * SIG_BINS
+    for h in shingle_set:
+        slot, value = h % SIG_BINS, h // SIG_BINS
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    # densify: an empty bin takes the next filled bin's value, offset by distance
+    for i in range(SIG_BINS):
+        if bins[i] is None:
+            for step in range(1, SIG_BINS):
+                borrowed = bins[(i + step) % SIG_BINS]
+                if borrowed is not None:
+                    bins[i] = ((borrowed + step * 0x9E3779B1) & 0x7FFFFFFF) | 0x80000000
+                    break
+    return bins
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ----------------- Index -----------------
+
+class DuplicateIndex:
+    """
+    Exact and LSH indexes over a storage backend's questions.
+
+    ``check`` first indexes any questions appended since the last call
+    (reading only the new tail), so it can be called on every add.
+    """
+
+    def __init__(self, storage=None, threshold=THRESHOLD):
+        self.storage = storage or get_storage()
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self._exact = {}
+        self._bands = [{} for _ in range(BANDS)]
+        self._sigs = array("I")
+        self._last_key = None
+
+    # ---- building ----
+
+    def _insert(self, n, question):
+        key = exact_key(question)
+        first = self._exact.setdefault(key, n)
+        self._last_key = key
+        if first != n:
+            self._sigs.extend(self._sigs[first * SIG_BINS:(first + 1) * SIG_BINS])
+            return  # an exact copy; its original already sits in the buckets
+        sig = signature(shingles(question))
+        self._sigs.extend(sig)
+        for band, buckets in enumerate(self._bands):
+            buckets.setdefault(hash(tuple(sig[band * ROWS:(band + 1) * ROWS])), []).append(n)
+
+    @metrics.timed("quiz_dedupe_refresh_seconds")
+    def refresh(self):
+        """Index questions appended since the last refresh (rebuild if the bank was rewritten)."""
+        with self._lock:
+            total = self.storage.count_questions()
+            if total < self.count or (
+                self.count and exact_key(self.storage.get_question(self.count - 1)[0]) != self._last_key
+            ):
+                self._reset()
+            start = self.count
+            while self.count < total:
+                page = self.storage.question_page(self.count, 256)
+                if not page:
+                    break
+                for question, _ in page:
+                    self._insert(self.count, question)
+                    self.count += 1
+            if self.count > start:
+                metrics.inc("quiz_dedupe_indexed_total", self.count - start)
+
+    # ---- queries ----
+
+    def _candidates(self, sig):
+        found = set()
+        for band, buckets in enumerate(self._bands):
+            found.update(buckets.get(hash(tuple(sig[band * ROWS:(band + 1) * ROWS])), ()))
+        return found
+
+    def _similar(self, question, exclude=None, below=None, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        own = shingles(question)
+        sig = signature(own)
+        floor = (threshold - PREFILTER_SLACK) * SIG_BINS
+        matches = []
+        with self._lock:
+            candidates = [
+                n for n in self._candidates(sig)
+                if n != exclude and (below is None or n < below)
+                and sum(map(operator.eq, sig, self._sigs[n * SIG_BINS:(n + 1) * SIG_BINS])) >= floor
+            ]
+        for n in candidates:
+            text = self.storage.get_question(n)[0]
+            similarity = jaccard(own, shingles(text))
+            if similarity >= threshold:
+                matches.append(Match(n + 1, round(similarity, 3), text))
+        return matches
+
+    @metrics.timed("quiz_dedupe_check_seconds")
+    def check(self, question, limit=5):
+        """
+        Return up to ``limit`` existing questions that duplicate or nearly
+        duplicate ``question``, most similar first (empty if none).
+        """
+        self.refresh()
+        matches = []
+        with self._lock:
+            first = self._exact.get(exact_key(question))
+        if first is not None:
+            matches.append(Match(first + 1, 1.0, self.storage.get_question(first)[0]))
+        matches += self._similar(question, exclude=first)
+        matches.sort(key=lambda m: (-m.similarity, m.number))
+        if matches:
+            metrics.inc("quiz_dedupe_hits_total")
+        return matches[:limit]
+
+    def report(self, threshold=None):
+        """
+        Yield ``(number, Match)`` for every question that repeats an earlier
+        one: exact copies (similarity 1.0) and near duplicates.
+        """
+        self.refresh()
+        for n, (question, _) in enumerate(self.storage.iter_questions()):
+            if n >= self.count:
+                break
+            first = self._exact.get(exact_key(question))
+            if first is not None and first != n:
+                yield n + 1, Match(first + 1, 1.0, self.storage.get_question(first)[0])
+                continue
+            for match in self._similar(question, exclude=n, below=n, threshold=threshold):
+                yield n + 1, match
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexed": self.count,
+                "distinct": len(self._exact),
+                "buckets": sum(len(b) for b in self._bands),
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(storage=None):
+    """Return the process-wide index over ``storage`` (default ``get_storage()``)."""
+    storage = storage or get_storage()
+    with _indexes_lock:
+        index = _indexes.get(storage)
+        if index is None:
+            index = _indexes[storage] = DuplicateIndex(storage)
+        return index
+
+
+def format_matches(matches):
+    """Human-readable lines for check() results (CLI / server)."""
+    lines = []
+    for m in matches:
+        kind = "exact duplicate of" if m.similarity >= 1.0 else f"{m.similarity:.0%} similar to"
+        lines.append(f"   {kind} Q{m.number}: {m.text}")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Report duplicate questions in the bank")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="minimum Jaccard similarity for near duplicates")
+    parser.add_argument("--json", action="store_true", help="one JSON object per duplicate")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = get_index()
+    exact = near = 0
+    for number, match in index.report(args.threshold):
+        if match.similarity >= 1.0:
+            exact += 1
+        else:
+            near += 1
+        if args.json:
+            print(json.dumps({"question": number, "duplicates": match.number,
+                              "similarity": match.similarity, "text": match.text},
+                             ensure_ascii=False))
+        else:
+            print(f"Q{number}:" + format_matches([match])[0][2:])
+    print(f"✅ {index.count} questions: {exact} exact and {near} near duplicates "
+          f"({time.perf_counter() - started:.2f}s).", file=sys.stderr)
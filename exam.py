@@ -0,0 +1,243 @@
+"""
+exam.py
+
+Exam session engine shared by the CLI (student.py) and Streamlit (app.py).
+
+An ExamSession never loads the whole bank. Iterating over it streams the
+questions in order while a background thread prefetches the next ones into
+a bounded window, so the next question is ready before the student has
+answered the current one. Front ends that render several questions at a
+time use ``page()`` instead.
+
+A session covers either a contiguous slice of the bank or an ExamPlan
+from assembly.py (a per-student draw with shuffled options); with a plan,
+questions are fetched by position and their options reordered on the way
+out, so the letters a student sees and the key always agree.
+
+The "bank" can also be a published exam (snapshot.py, selected with
+QUIZ_EXAM_SNAPSHOT): then questions are decoded straight from the shared
+mapping and the key comes from its packed array without reading any
+question.
+
+Only the chosen letters and the answer key are kept for every question
+(two bytes each); question text lives in memory only while it is inside
+the prefetch window or the current page. Scoring is delegated to the pure
+functions in grading.py.
+
+Example:
+    session = ExamSession()            # or ExamSession.for_student("ann")
+    for q in session:
+        outcome = session.answer(q, input(q.text))
+    print(session.result())
+"""
+
+import queue
+import threading
+from collections import namedtuple
+
+from analytics import pack_answers
+from assembly import plan_for, shuffle_options
+from grading import OPTIONS, grade_detailed, score_answer
+from snapshot import get_snapshot
+from storage import get_storage
+
+PREFETCH_WINDOW = 16   # questions held ahead of the student
+PAGE_SIZE = 10         # questions per page for paged front ends
+
+Question = namedtuple("Question", "number text options answer")
+Question.__doc__ = "One exam question; ``number`` is 1-based within the session."
+
+_END = object()
+
+
+class ExamSession:
+    """Streams a slice of the bank (or a drawn ExamPlan) and records the student's answers."""
+
+    def __init__(self, storage=None, start=0, count=None,
+                 window=PREFETCH_WINDOW, page_size=PAGE_SIZE, plan=None):
+        self.storage = storage or get_storage()
+        self.plan = plan
+        if plan is None:
+            total = self.storage.count_questions()
+            self.start = min(max(start, 0), total)
+            self.stop = total if count is None else min(total, self.start + count)
+        else:
+            self.start, self.stop = 0, len(plan.positions)
+        self.window = window
+        self.page_size = page_size
+        # one byte per question: the chosen letter / the key letter (0 = none yet)
+        self._choices = bytearray(len(self))
+        self._key = bytearray(len(self))
+
+    @classmethod
+    def for_student(cls, username, storage=None, **kwargs):
+        """
+        The session ``username`` should sit: their own draw when
+        QUIZ_EXAM_SIZE is set (see assembly.py), otherwise the whole bank
+        (the published exam named by QUIZ_EXAM_SNAPSHOT takes precedence
+        over ``storage``).
+        """
+        storage = get_snapshot() or storage or get_storage()
+        return cls(storage, plan=plan_for(username, storage=storage), **kwargs)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def course(self):
+        """The course of the bank being served (None: the default bank)."""
+        return getattr(self.storage, "course", None) or None
+
+    def _fetch(self, first, size):
+        """Raw (question, opts) items for session slots first .. first+size-1."""
+        if self.plan is None:
+            return self.storage.question_page(self.start + first, size)
+        return self.storage.get_questions(self.plan.positions[first:first + size])
+
+    def _options(self, slot, opts):
+        if self.plan is None:
+            return list(opts[:3]), opts[3]
+        return shuffle_options(opts, self.plan.orders[slot])
+
+    def _make(self, slot, item):
+        text, opts = item
+        options, answer = self._options(slot, opts)
+        self._key[slot] = ord(answer)
+        return Question(slot + 1, text, options, answer)
+
+    # ---- streaming ----
+
+    def __iter__(self):
+        """Yield questions in order, prefetching up to ``window`` ahead."""
+        buf = queue.Queue(maxsize=self.window)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buf.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            slot = 0
+            try:
+                while slot < len(self) and not stop.is_set():
+                    chunk = self._fetch(slot, min(self.window, len(self) - slot))
+                    if not chunk:
+                        break
+                    for item in chunk:
+                        if not put(self._make(slot, item)):
+                            return
+                        slot += 1
+            except Exception as exc:  # surface storage errors in the consumer
+                put(exc)
+            put(_END)
+
+        thread = threading.Thread(target=producer, name="exam-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = buf.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    # ---- paging ----
+
+    @property
+    def pages(self):
+        return (len(self) + self.page_size - 1) // self.page_size
+
+    def page(self, number):
+        """Return the questions on 0-based page ``number``."""
+        first = number * self.page_size
+        size = max(0, min(self.page_size, len(self) - first))
+        return [self._make(first + i, item) for i, item in enumerate(self._fetch(first, size))]
+
+    # ---- answers ----
+
+    def answer(self, question, choice):
+        """Record ``choice`` for ``question``; returns its grading outcome."""
+        choice = (choice or "").strip().lower()
+        slot = question.number - 1
+        self._choices[slot] = ord(choice) if choice in OPTIONS else 0
+        return score_answer(choice, question.answer)
+
+    def choice(self, question):
+        """The letter recorded for ``question`` (or None)."""
+        value = self._choices[question.number - 1]
+        return chr(value) if value else None
+
+    def restore(self, letters):
+        """Set recorded answers from ``{slot: letter code}`` (resuming from checkpoints)."""
+        for slot, code in letters.items():
+            self._choices[slot] = code
+
+    def _fill_key(self):
+        """Load key letters for questions the student never saw."""
+        if hasattr(self.storage, "key_letters"):  # published exam: packed key, no question reads
+            if self.plan is None:
+                self._key[:] = self.storage.key_letters(range(self.start, self.stop))
+            else:
+                self._key[:] = self.storage.key_letters(self.plan.positions, self.plan.orders)
+            return
+        missing = [i for i, k in enumerate(self._key) if not k]
+        for i in missing:
+            if self._key[i]:
+                continue  # filled by an earlier page read
+            size = min(self.page_size, len(self) - i)
+            for offset, (_, opts) in enumerate(self._fetch(i, size)):
+                self._key[i + offset] = ord(self._options(i + offset, opts)[1])
+
+    def choices(self):
+        """Every recorded letter in question order (None where unanswered)."""
+        return [chr(c) if c else None for c in self._choices]
+
+    def result(self):
+        """Grade the recorded answers (unanswered questions count as skipped)."""
+        self._fill_key()
+        return grade_detailed(self.choices(), [chr(k) for k in self._key])
+
+    def answer_records(self, score):
+        """Per-question records of this attempt for the answer log (see analytics.py)."""
+        self._fill_key()
+        if self.plan is None:
+            positions, orders = range(self.start, self.stop), None
+        else:
+            positions, orders = self.plan.positions, self.plan.orders
+        return pack_answers(self.choices(), [chr(k) for k in self._key], score,
+                            bank_positions(self.storage, positions), orders)
+
+
+def bank_positions(storage, positions):
+    """Map session positions to bank positions (they differ only for published exams)."""
+    mapping = getattr(storage, "bank_positions", None)
+    return positions if mapping is None else [mapping[n] for n in positions]
+
+
+def plan_key(plan, storage=None):
+    """Return the key letters of a drawn ExamPlan, options shuffled as served."""
+    storage = storage or get_storage()
+    if hasattr(storage, "key_letters"):
+        return [chr(k) for k in storage.key_letters(plan.positions, plan.orders)]
+    return [shuffle_options(opts, order)[1]
+            for (_, opts), order in zip(storage.get_questions(plan.positions), plan.orders)]
+
+
+def answer_key(storage=None, start=0, count=None):
+    """Return the key letters for a slice of the bank (for bulk re-grading)."""
+    storage = storage or get_storage()
+    stop = storage.count_questions() if count is None else start + count
+    key = []
+    for first in range(start, stop, PAGE_SIZE * 100):
+        page = storage.question_page(first, min(PAGE_SIZE * 100, stop - first))
+        key.extend(opts[3] for _, opts in page)
+    return key
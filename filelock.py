@@ -0,0 +1,196 @@
+"""
+filelock.py
+
+Inter-process locking and atomic file updates for the data files.
+
+Several CLI sessions, Streamlit workers and the exam server may share one
+data directory, so every writer goes through this module:
+
+    locked(path)            exclusive advisory lock (fcntl.flock) on
+                            ``<path>.lock``; serializes appends and
+                            read-modify-write cycles across processes
+    atomic_write(path)      write a temp file beside ``path``, fsync it and
+                            rename it over ``path``; readers see the old or
+                            the new file, never a mix
+    append(path, data)      one locked O_APPEND write of whole records, so
+                            concurrent appenders never interleave rows
+    try_lock(path)          take a lock without waiting and keep it (a
+                            journal owned for a process's lifetime)
+
+Locks live in sidecar files so they survive ``os.replace`` of the data
+file itself, and they are re-entrant within a thread. They are advisory:
+they only exclude other users of this module. Without fcntl (Windows) only
+the threads of one process are serialized.
+
+Time spent waiting is recorded in the ``quiz_lock_wait_seconds`` histogram,
+acquisitions that had to wait in ``quiz_lock_contended_total``, and per file
+in ``stats()``.
+
+Example:
+    with locked("data/user.csv"):
+        rows = read_rows()
+        with atomic_write("data/user.csv", "w", newline="") as f:
+            write_rows(f, rows)
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locks
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+_held = threading.local()       # paths this thread already holds (re-entrancy)
+_thread_locks = {}              # fallback locks when fcntl is unavailable
+_stats = {}
+_guard = threading.Lock()
+
+
+def lock_path(path):
+    return path + LOCK_SUFFIX
+
+
+def _key(path):
+    return os.path.abspath(path)
+
+
+def _open_lock_file(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return os.open(lock_path(path), os.O_RDWR | os.O_CREAT, 0o666)
+
+
+def _record(key, waited, contended):
+    metrics.observe("quiz_lock_wait_seconds", waited,
+                    "Time spent waiting for data-file locks")
+    if contended:
+        metrics.inc("quiz_lock_contended_total", doc="Lock acquisitions that had to wait")
+    with _guard:
+        entry = _stats.setdefault(key, {"acquired": 0, "contended": 0,
+                                        "wait_s": 0.0, "max_wait_s": 0.0})
+        entry["acquired"] += 1
+        entry["contended"] += contended
+        entry["wait_s"] += waited
+        entry["max_wait_s"] = max(entry["max_wait_s"], waited)
+
+
+@contextlib.contextmanager
+def locked(path, shared=False):
+    """Hold ``path``'s lock (exclusive, or shared for readers) for the block."""
+    key = _key(path)
+    held = _held.__dict__.setdefault("paths", set())
+    if key in held:
+        yield  # already held by this thread
+        return
+
+    started = time.perf_counter()
+    if fcntl is None:
+        with _guard:
+            lock = _thread_locks.setdefault(key, threading.RLock())
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        release = lock.release
+    else:
+        fd = _open_lock_file(path)
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            contended = False
+        except BlockingIOError:
+            contended = True
+            fcntl.flock(fd, mode)
+        release = lambda: os.close(fd)  # closing the descriptor drops the lock
+    _record(key, time.perf_counter() - started, contended)
+
+    held.add(key)
+    try:
+        yield
+    finally:
+        held.discard(key)
+        release()
+
+
+class HeldLock:
+    """A lock taken by ``try_lock`` and kept until ``release()``."""
+
+    def __init__(self, path, fd):
+        self.path = path
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def try_lock(path):
+    """Take ``path``'s exclusive lock if it is free; returns a HeldLock or None."""
+    if fcntl is None:
+        return HeldLock(path, None)
+    fd = _open_lock_file(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return HeldLock(path, fd)
+
+
+# ----------------- Writes -----------------
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", fsync=True, **kwargs):
+    """
+    Yield a file object for the new contents of ``path``; on success it is
+    flushed, optionally fsynced and renamed into place, on error discarded.
+    Take ``locked(path)`` around it when the new contents depend on the old.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+
+
+def append(path, data, fsync=False, record_size=None):
+    """
+    Append ``data`` (bytes of whole records) to ``path`` under its lock.
+    With ``record_size``, a partial record left at the end by a writer that
+    died mid-append is cut off first, so the records stay aligned.
+    """
+    with locked(path):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            if record_size:
+                size = os.fstat(fd).st_size
+                if size % record_size:
+                    os.ftruncate(fd, size - size % record_size)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def stats():
+    """Per-file lock counters: acquisitions, contended ones and wait times."""
+    with _guard:
+        return {path: dict(entry) for path, entry in _stats.items()}
@@ -0,0 +1,303 @@
+"""
+grader.py
+
+Local grading service: grades exam submissions and persists the results
+for any number of front-end processes (Streamlit workers, CLI sessions)
+over a Unix socket.
+
+    python grader.py [--socket quiz-grader.sock] [--workers 4]
+
+The parent binds the socket and forks ``--workers`` processes that all
+accept on it; the kernel spreads connections across them. Each worker has
+its own storage handles, answer-key cache and result sink (with a private
+journal, see result_sink.py), so parsing, grading and journaling scale
+with cores while appends to results.csv stay serialized by filelock.
+Leaderboard queries run on a worker's thread pool, so a slow board refresh
+never holds up a submission.
+
+Protocol, one JSON object per line in each direction:
+
+    {"op": "submit", "username": "ann", "name": "Ann",
+     "choices": ["a", null, "c"],              # one entry per question
+     "plan": {"positions": [...], "orders": [...]},   # omitted: bank order
+     "course": "bio101",                       # omitted: the default bank
+     "exam": {"name": "midterm", "revision": 3}}  # a published exam (snapshot.py)
+        -> {"ok": true, "correct": 1, "incorrect": 1, "skipped": 1,
+            "score": 3, "answers": [[1, "correct"], [2, "skipped"], [3, "incorrect"]]}
+    {"op": "board", "limit": 10, "offset": 0}
+        -> {"ok": true, "rows": [...], "total": 120}
+    {"op": "ping"} -> {"ok": true, "pid": 1234}
+
+Errors come back as ``{"ok": false, "error": "..."}``. Front ends talk to
+it through GraderClient; app.py does so when QUIZ_GRADER_SOCKET is set and
+otherwise grades in-process as before.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import threading
+
+import metrics
+from analytics import pack_answers
+from assembly import ExamPlan
+from exam import answer_key, bank_positions, plan_key
+from grading import grade_detailed
+from result_sink import get_sink
+from snapshot import get_snapshot
+from storage import get_storage
+
+SOCKET_PATH = "quiz-grader.sock"
+LINE_LIMIT = 1 << 20  # longest request line accepted (bytes)
+
+
+# ----------------- Worker -----------------
+
+class Grader:
+    """Per-process grading state: storage, result sink and each bank's key."""
+
+    def __init__(self, storage=None, sink=None):
+        self.storage = storage or get_storage()
+        self.sink = sink or get_sink()
+        self._keys = {}   # course ("" for the default bank) -> key letters
+        self._lock = threading.Lock()
+
+    def _bank(self, course=None, exam=None):
+        if exam:
+            return get_snapshot(exam["name"], exam["revision"])
+        return get_storage(course) if course else self.storage
+
+    def bank_key(self, course=None):
+        """A whole bank's key, extended as questions are appended."""
+        storage = self._bank(course)
+        with self._lock:
+            key = self._keys.setdefault(course or "", [])
+            total = storage.count_questions()
+            if total < len(key):  # bank rewritten
+                key = self._keys[course or ""] = []
+            if total > len(key):
+                key += answer_key(storage, len(key), total - len(key))
+            return key
+
+    @metrics.timed("quiz_grader_submit_seconds")
+    def submit(self, username, name, choices, plan=None, course=None, exam=None):
+        storage = self._bank(course, exam)
+        if plan:
+            plan = ExamPlan(None, plan["positions"], bytes(plan["orders"]))
+            key = plan_key(plan, storage)
+            positions, orders = plan.positions, plan.orders
+        elif exam:
+            key = [chr(k) for k in storage.key_letters()]  # the packed key, no question reads
+            positions, orders = range(len(key)), None
+        else:
+            # the session covered the bank as it was when it started; questions
+            # appended since are not on the sheet, so grade only the ones that are
+            key = self.bank_key(course)
+            if len(choices) > len(key):
+                raise ValueError(f"{len(choices)} answers for a {len(key)}-question bank")
+            key = key[:len(choices)]
+            positions, orders = range(len(key)), None
+        choices = (list(choices) + [None] * len(key))[:len(key)]
+        result = grade_detailed(choices, key)
+        self.sink.submit(username, name or username, result["correct"],
+                         result["incorrect"], result["skipped"], result["score"],
+                         pack_answers(choices, key, result["score"],
+                                      bank_positions(storage, positions), orders),
+                         getattr(storage, "course", None) or None)
+        metrics.inc("quiz_grader_submissions_total")
+        return result
+
+    def board(self, limit=10, offset=0):
+        self.sink.flush(timeout=1.0)
+        return {"rows": self.storage.top_results(limit, offset),
+                "total": self.storage.count_results()}
+
+
+async def handle(grader, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "submit":
+                    # journaling may fsync: keep it off the event loop
+                    reply = await loop.run_in_executor(
+                        None, grader.submit, str(request["username"]),
+                        request.get("name"), request.get("choices") or [], request.get("plan"),
+                        request.get("course"), request.get("exam"))
+                elif op == "board":
+                    reply = await loop.run_in_executor(
+                        None, grader.board, request.get("limit", 10), request.get("offset", 0))
+                elif op == "ping":
+                    reply = {"pid": os.getpid()}
+                else:
+                    raise ValueError(f"unknown op {op!r}")
+                reply = {"ok": True, **reply}
+            except Exception as exc:
+                reply = {"ok": False, "error": str(exc)}
+            writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_worker(sock):
+    """Serve connections accepted on the shared listening socket until interrupted."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    grader = Grader()
+
+    async def main():
+        server = await asyncio.start_unix_server(
+            lambda r, w: handle(grader, r, w), sock=sock, limit=LINE_LIMIT)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):  # let the final flush finish
+            signal.signal(signum, signal.SIG_IGN)
+        grader.sink.close()
+
+
+def serve(path=SOCKET_PATH, workers=os.cpu_count() or 1):
+    """Bind ``path`` and run ``workers`` forked grading processes (Unix only)."""
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1024)
+    signal.signal(signal.SIGTERM, _interrupt)
+    children = []
+    try:
+        for _ in range(max(1, workers)):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    run_worker(sock)
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        print(f"📝 Grading service on {path} with {len(children)} worker(s).", flush=True)
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)  # workers flush their sinks and exit
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        sock.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ----------------- Client -----------------
+
+class GraderClient:
+    """Blocking client with one connection per thread (reconnects once on failure)."""
+
+    def __init__(self, path=SOCKET_PATH, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self._local.conn = None
+
+    def call(self, request):
+        data = (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+        for attempt in (1, 2):
+            try:
+                sock, reader = self._connection()
+                sock.sendall(data)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("grading service closed the connection")
+                break
+            except OSError:
+                self._drop()
+                if attempt == 2:
+                    raise
+        reply = json.loads(line)
+        if not reply.pop("ok", False):
+            raise RuntimeError(reply.get("error", "grading failed"))
+        return reply
+
+    def submit(self, username, name, choices, plan=None, course=None, exam=None):
+        """Grade and record one sheet; returns the grading.grade_detailed dict."""
+        request = {"op": "submit", "username": username, "name": name, "choices": list(choices)}
+        if plan is not None:
+            request["plan"] = {"positions": list(plan.positions), "orders": list(plan.orders)}
+        if course:
+            request["course"] = course
+        if exam:
+            request["exam"] = exam
+        result = self.call(request)
+        result["answers"] = [tuple(a) for a in result.get("answers", [])]
+        return result
+
+    def board(self, limit=10, offset=0):
+        return self.call({"op": "board", "limit": limit, "offset": offset})
+
+    def ping(self):
+        return self.call({"op": "ping"})
+
+    def close(self):
+        self._drop()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client for QUIZ_GRADER_SOCKET (None when unset)."""
+    global _client
+    path = os.environ.get("QUIZ_GRADER_SOCKET")
+    if not path:
+        return None
+    with _client_lock:
+        if _client is None or _client.path != path:
+            _client = GraderClient(path)
+        return _client
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local grading service")
+    parser.add_argument("--socket", default=os.environ.get("QUIZ_GRADER_SOCKET", SOCKET_PATH))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    serve(args.socket, args.workers)
@@ -0,0 +1,135 @@
+"""
+grading.py
+
+Scoring rules for the Quiz System, kept free of I/O so every front end
+(CLI, Streamlit, batch tools) grades the same way.
+
+    correct answer   +4
+    wrong answer     -1
+    skip / invalid    0
+
+Answers and keys are option letters ("a", "b", "c"); anything else counts
+as a skip.
+
+``grade_sheets`` applies the same rules to a whole matrix of answer sheets
+at once with NumPy (imported on first use, so the interactive front ends
+do not need it), e.g. to re-grade a term after a key is fixed.
+"""
+
+import metrics
+
+CORRECT_POINTS = 4
+WRONG_POINTS = -1
+SKIP_POINTS = 0
+OPTIONS = ("a", "b", "c")
+
+CORRECT = "correct"
+INCORRECT = "incorrect"
+SKIPPED = "skipped"
+
+
+def score_answer(choice, answer):
+    """Classify one answer as CORRECT, INCORRECT or SKIPPED."""
+    choice = (choice or "").strip().lower()
+    if choice not in OPTIONS:
+        return SKIPPED
+    return CORRECT if choice == answer else INCORRECT
+
+
+@metrics.timed("quiz_grade_seconds")
+def grade(choices, key):
+    """
+    Grade one answer sheet against a key (equal-length sequences of letters).
+    Returns a dict with correct/incorrect/skipped counts and the score.
+    """
+    counts = {CORRECT: 0, INCORRECT: 0, SKIPPED: 0}
+    for choice, answer in zip(choices, key):
+        counts[score_answer(choice, answer)] += 1
+    return {
+        "correct": counts[CORRECT],
+        "incorrect": counts[INCORRECT],
+        "skipped": counts[SKIPPED],
+        "score": total_score(counts[CORRECT], counts[INCORRECT], counts[SKIPPED]),
+    }
+
+
+def grade_detailed(choices, key):
+    """``grade`` plus ``answers``: (1-based number, outcome) for every question, skips included."""
+    outcome = grade(choices, key)
+    outcome["answers"] = [
+        (number, score_answer(choice, answer))
+        for number, (choice, answer) in enumerate(zip(choices, key), start=1)
+    ]
+    return outcome
+
+
+def total_score(correct, incorrect, skipped=0):
+    return correct * CORRECT_POINTS + incorrect * WRONG_POINTS + skipped * SKIP_POINTS
+
+
+# ----------------- Bulk grading -----------------
+
+SKIP_CODE = 0  # sheet/key codes: 0 = skip, 1 = a, 2 = b, 3 = c
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise ImportError("Bulk grading requires NumPy: pip install numpy") from exc
+    return numpy
+
+
+def encode_answers(answers):
+    """
+    Convert letters (any nesting of lists / arrays of str) to uint8 codes.
+    Integer arrays are assumed to be codes already and are passed through.
+    """
+    np = _numpy()
+    arr = np.asarray(answers)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.uint8, copy=False)
+    letters = np.char.lower(np.char.strip(arr.astype(str)))
+    codes = np.zeros(letters.shape, dtype=np.uint8)
+    for code, letter in enumerate(OPTIONS, start=1):
+        codes[letters == letter] = code
+    return codes
+
+
+@metrics.timed("quiz_grade_sheets_seconds")
+def grade_sheets(sheets, key):
+    """
+    Grade a students x questions matrix of answers against a key in one pass.
+
+    Returns a dict of NumPy arrays:
+        correct, incorrect, skipped, score   one entry per student
+        p_correct                            fraction correct per question
+        option_counts                        questions x 4 counts of
+                                             (skip, a, b, c) choices
+    """
+    np = _numpy()
+    sheet = encode_answers(sheets)
+    if sheet.ndim == 1:
+        sheet = sheet[np.newaxis, :]
+    key = encode_answers(key).reshape(-1)
+    if sheet.shape[1] != key.shape[0]:
+        raise ValueError(
+            f"Answer sheets have {sheet.shape[1]} questions but the key has {key.shape[0]}.")
+
+    answered = sheet != SKIP_CODE
+    right = answered & (sheet == key)
+    correct = right.sum(axis=1, dtype=np.int64)
+    incorrect = answered.sum(axis=1, dtype=np.int64) - correct
+    skipped = sheet.shape[1] - correct - incorrect
+
+    students = max(sheet.shape[0], 1)
+    option_counts = np.stack(
+        [(sheet == code).sum(axis=0) for code in range(len(OPTIONS) + 1)], axis=1)
+    return {
+        "correct": correct,
+        "incorrect": incorrect,
+        "skipped": skipped,
+        "score": correct * CORRECT_POINTS + incorrect * WRONG_POINTS + skipped * SKIP_POINTS,
+        "p_correct": right.sum(axis=0) / students,
+        "option_counts": option_counts,
+    }
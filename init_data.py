@@ -1,14 +1,13 @@
 import os
-import csv
-import pickle
 
-# Directory for data files
+from storage import get_storage
+from userstore import hash_password
+
+# Seed whichever backend QUIZ_STORAGE selects, at the same paths the
+# app, CLI and login code read from.
 DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
-
-USER_FILE = os.path.join(DATA_DIR, "user.csv")
-QUEST_FILE = os.path.join(DATA_DIR, "quest.bin")
-RESULTS_FILE = os.path.join(DATA_DIR, "results.csv")
+storage = get_storage()
 
 # Dummy users
 users = [
@@ -52,22 +51,14 @@ questions = {
     ]
 }
 
-# Create user.csv
-if not os.path.exists(USER_FILE):
-    with open(USER_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerows(users)
-    print("✅ Created user.csv with demo users.")
-
-# Create quest.bin
-if not os.path.exists(QUEST_FILE):
-    with open(QUEST_FILE, "wb") as f:
-        pickle.dump(questions, f)
-    print("✅ Created quest.bin with funny demo questions.")
+# Create demo users
+if not storage.count_users():
+    for username, password in users:
+        storage.set_user(username, hash_password(password))
+    print("✅ Created demo users.")
 
-# Create results.csv
-if not os.path.exists(RESULTS_FILE):
-    with open(RESULTS_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Name", "Correct", "Incorrect", "Skipped", "Score"])
-    print("✅ Created results.csv (empty).")
+# Create question bank
+if not storage.count_questions():
+    for q, opts in questions.items():
+        storage.add_question(q, *opts)
+    print("✅ Created question bank with funny demo questions.")
@@ -0,0 +1,350 @@
+"""
+leaderboard.py
+
+Incrementally maintained leaderboard over results.csv.
+
+Results are bucketed by score, and each bucket keeps the byte offsets of
+its rows in insertion order. A Fenwick (binary indexed) tree over the score
+range counts how many results sit at or above any score, which gives:
+
+    top-K / any page      O(log S) to find the first bucket, then one seek per row
+    a user's rank         O(log S) (1 + results with a strictly higher score)
+    adding a result       O(log S)
+
+where S is the spread of scores seen so far (not the number of results).
+Ties keep file order, matching the stable sort the board used before.
+
+The structure is snapshotted to ``<results>.lb`` every SNAPSHOT_EVERY new
+rows and at exit. On load only the CSV tail written after the snapshot is
+parsed, so rows appended by other processes are picked up cheaply too.
+
+Rows compacted into the columnar archive (archive.py) rank ahead of the
+CSV rows with the same score, as they were written first. They are not
+kept in the buckets at all: each score just knows its range in the
+archive's precomputed rank order, taken from the manifest's score
+histogram, so a compacted board of any size loads in O(S) and a page reads
+only the archived rows it shows.
+"""
+
+import atexit
+import csv
+import os
+import pickle
+import threading
+from array import array
+
+import metrics
+from archive import ResultsArchive, archive_dir
+from filelock import atomic_write
+
+SNAPSHOT_SUFFIX = ".lb"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_EVERY = 1000
+
+
+# ----------------- Fenwick tree -----------------
+
+class _Fenwick:
+    """Counts per slot with O(log n) prefix sums and k-th lookups."""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, i, delta):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Sum of slots 0..i (inclusive); -1 gives 0."""
+        total = 0
+        i += 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """Smallest slot i with prefix(i) >= k (k is 1-based)."""
+        pos, step = 0, 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+# ----------------- Leaderboard -----------------
+
+class Leaderboard:
+    """Order-statistic view of one results CSV and its archive."""
+
+    def __init__(self, results_file, snapshot_file=None, archive=None):
+        self.results_file = results_file
+        self.snapshot_file = snapshot_file or results_file + SNAPSHOT_SUFFIX
+        self.archive = archive or ResultsArchive(archive_dir(results_file))
+        self._lock = threading.RLock()
+        self._reset()
+        self._load_snapshot()
+
+    def _reset(self):
+        self._buckets = {}        # score -> array of row byte offsets
+        self._ranges = {}         # score -> (start, count) in the archive's rank order
+        self._generation = None   # archive generation the ranges belong to
+        self._best = {}           # username -> best score
+        self._columns = None      # header of the CSV being indexed
+        self._consumed = 0        # bytes of the CSV already indexed
+        self._inode = None
+        self._hi = 0              # highest score the tree can hold
+        self._tree = _Fenwick(64)
+        self._count = 0
+        self._unsaved = 0
+
+    # ---- score <-> slot ----
+
+    def _slot(self, score):
+        return self._hi - score
+
+    def _fits(self, score):
+        return 0 <= self._slot(score) < self._tree.size
+
+    def _grow(self, score):
+        """Rebuild the tree over a range that also covers ``score``."""
+        scores = list(self._buckets) + list(self._ranges) + [score]
+        hi, lo = max(scores), min(scores)
+        span = max(64, 2 * (hi - lo + 1))
+        self._hi = hi + span // 4
+        self._tree = _Fenwick(span + span // 4)
+        for s, rows in self._buckets.items():
+            self._tree.add(self._slot(s), len(rows))
+        for s, (_, count) in self._ranges.items():
+            self._tree.add(self._slot(s), count)
+
+    def _insert(self, username, score, offset):
+        if not self._fits(score):
+            self._grow(score)
+        self._buckets.setdefault(score, array("q")).append(offset)
+        self._tree.add(self._slot(score), 1)
+        if score > self._best.get(username, score - 1):
+            self._best[username] = score
+        self._count += 1
+        self._unsaved += 1
+
+    def _load_archive(self, generation):
+        """Count the archive's rows in, one range per score."""
+        self._generation = generation
+        start = 0
+        for score, count in self.archive.score_counts():
+            self._ranges[score] = (start, count)
+            start += count
+        self._count += start
+        if self._ranges:
+            self._grow(next(iter(self._ranges)))
+
+    # ---- ingest ----
+
+    @metrics.timed("quiz_leaderboard_refresh_seconds")
+    def refresh(self):
+        """Index any rows appended to the CSV (or compacted into the archive) since the last call."""
+        with self._lock:
+            generation = self.archive.generation
+            try:
+                st = os.stat(self.results_file)
+            except FileNotFoundError:
+                st = None
+            inode = st.st_ino if st else None
+            if (generation != self._generation or inode != self._inode
+                    or (st and st.st_size < self._consumed)):
+                self._reset()
+                self._inode = inode
+                self._load_archive(generation)
+                # a compaction cut short leaves its folded prefix in the CSV
+                self._consumed = self.archive.folded_bytes(self.results_file)
+            if st is None or st.st_size == self._consumed:
+                return
+            with open(self.results_file, "rb") as f:
+                if self._columns is None and self._consumed:
+                    self._columns = next(csv.reader([f.readline().decode("utf-8")]))
+                f.seek(self._consumed)
+                chunk = f.read(st.st_size - self._consumed)
+            pos = 0
+            while True:
+                end = chunk.find(b"\n", pos)
+                if end < 0:
+                    break  # incomplete trailing row: wait for the writer
+                line = chunk[pos:end + 1]
+                offset = self._consumed + pos
+                pos = end + 1
+                row = next(csv.reader([line.decode("utf-8")]), None)
+                if not row:
+                    continue
+                if self._columns is None:
+                    self._columns = row
+                    continue
+                rec = self._parse(row)
+                if rec is None:
+                    continue  # a torn row another row was glued onto: not a result
+                self._insert(rec["Username"], rec["Score"], offset)
+            self._consumed += pos
+            if self._unsaved >= SNAPSHOT_EVERY:
+                self.save_snapshot()
+
+    # ---- queries ----
+
+    def __len__(self):
+        with self._lock:
+            self.refresh()
+            return self._count
+
+    def _read_rows(self, offsets):
+        out = []
+        if not offsets:
+            return out
+        with open(self.results_file, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                rec = self._parse(next(csv.reader([f.readline().decode("utf-8")]), []))
+                if rec is not None:
+                    out.append(rec)
+        return out
+
+    def _parse(self, row):
+        """The result in one CSV row, or None if the row is not a whole result."""
+        if len(row) != len(self._columns):
+            return None
+        rec = dict(zip(self._columns, row))
+        try:
+            return {
+                "Username": rec.get("Username") or rec["Name"],
+                "Name": rec["Name"],
+                "Correct": int(rec["Correct"]),
+                "Incorrect": int(rec["Incorrect"]),
+                "Skipped": int(rec["Skipped"]),
+                "Score": int(rec["Score"]),
+            }
+        except (KeyError, ValueError):
+            return None
+
+    def top(self, limit=None, offset=0):
+        """Return results ranked ``offset`` .. ``offset + limit`` (highest score first)."""
+        with self._lock:
+            self.refresh()
+            stop = self._count if limit is None else min(self._count, offset + limit)
+            out, archived, offsets = [], [], []
+            position = max(offset, 0)
+            while position < stop:
+                slot = self._tree.find(position + 1)
+                score = self._hi - slot
+                skip = position - self._tree.prefix(slot - 1)
+                start, count = self._ranges.get(score, (0, 0))
+                if skip < count:
+                    # archived rows come first within a score
+                    if offsets:
+                        out += self._read_rows(offsets)
+                        offsets = []
+                    take = min(count - skip, stop - position)
+                    archived.append((start + skip, take))
+                else:
+                    if archived:
+                        out += self._read_archived(archived)
+                        archived = []
+                    skip -= count
+                    rows = self._buckets[score][skip:skip + stop - position]
+                    offsets.extend(rows)
+                    take = len(rows)
+                position += take
+            if archived:
+                out += self._read_archived(archived)
+            return out + self._read_rows(offsets)
+
+    def _read_archived(self, spans):
+        return [row for start, take in spans for row in self.archive.ranked(start, take)]
+
+    def rank_of(self, username):
+        """1-based rank of the user's best result, or None if they have none."""
+        with self._lock:
+            self.refresh()
+            best = self._best_of(username)
+            if best is None:
+                return None
+            return self._tree.prefix(self._slot(best) - 1) + 1
+
+    def best_score(self, username):
+        with self._lock:
+            self.refresh()
+            return self._best_of(username)
+
+    def _best_of(self, username):
+        scores = [self._best.get(username)]
+        if self._ranges:
+            scores.append(self.archive.best_score(username))
+        scores = [s for s in scores if s is not None]
+        return max(scores) if scores else None
+
+    # ---- persistence ----
+
+    def save_snapshot(self):
+        with self._lock:
+            if self._inode is None:
+                return
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "generation": self._generation,
+                "inode": self._inode,
+                "consumed": self._consumed,
+                "columns": self._columns,
+                "buckets": self._buckets,
+                "best": self._best,
+            }
+            # unique temp name: several processes may snapshot the same board
+            with atomic_write(self.snapshot_file, "wb", fsync=False) as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._unsaved = 0
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_file, "rb") as f:
+                state = pickle.load(f)
+            st = os.stat(self.results_file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        if (state.get("version") != SNAPSHOT_VERSION or state["inode"] != st.st_ino
+                or state["consumed"] > st.st_size
+                or state["generation"] != self.archive.generation):
+            return  # stale: rebuild from the CSV on first refresh
+        self._inode = state["inode"]
+        self._consumed = state["consumed"]
+        self._columns = state["columns"]
+        self._buckets = state["buckets"]
+        self._best = state["best"]
+        self._count = sum(len(rows) for rows in self._buckets.values())
+        if self._buckets:
+            self._grow(next(iter(self._buckets)))
+        self._load_archive(state["generation"])
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def get_leaderboard(results_file):
+    """Return the process-wide ``Leaderboard`` for ``results_file``."""
+    key = os.path.abspath(results_file)
+    with _boards_lock:
+        board = _boards.get(key)
+        if board is None:
+            board = _boards[key] = Leaderboard(results_file)
+            atexit.register(_save_quietly, board)
+        return board
+
+
+def _save_quietly(board):
+    """Exit hook: a snapshot is only an optimisation, so never fail on it."""
+    try:
+        board.save_snapshot()
+    except OSError:
+        pass
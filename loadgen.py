@@ -0,0 +1,116 @@
+"""
+loadgen.py
+
+Load generator for server.py: simulates N concurrent students, each
+logging in, taking the exam with random answers and leaving.
+
+Per-question latency is the time from sending an answer until the next
+prompt arrives. The report gives p50/p99/max latency and the overall
+answer throughput.
+
+Each client registers a new user unless --guest is given. Registrations
+are charged to the server's per-address bucket. Loopback is exempt by
+default (QUIZ_AUTH_TRUSTED_SOURCES), so run against another host only
+with the generator's address in that list, or with --guest.
+
+Run:
+    python loadgen.py --clients 1000 [--host 127.0.0.1] [--port 8765]
+                      [--password loadtest] [--guest]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from server import HOST, PORT, PROMPT
+
+
+async def read_prompt(reader):
+    """Read display lines until the next prompt; returns the prompt text."""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        text = line.decode("utf-8", "replace").rstrip("\n")
+        if text.startswith(PROMPT):
+            return text[len(PROMPT):]
+
+
+async def student(number, args, latencies):
+    reader, writer = await asyncio.open_connection(args.host, args.port, limit=64 * 1024)
+
+    async def reply(text):
+        writer.write((text + "\n").encode("utf-8"))
+        await writer.drain()
+
+    try:
+        prompt = await read_prompt(reader)
+        while not prompt.startswith("Choose an option"):
+            if prompt.startswith("Enter username"):
+                await reply(f"load{number}")
+            elif prompt.startswith("Enter password"):
+                await reply(args.password)
+            elif prompt.startswith("Register"):
+                await reply("guest" if args.guest else "y")
+            else:
+                await reply("")
+            prompt = await read_prompt(reader)
+
+        await reply("3")
+        prompt = await read_prompt(reader)       # "Enter your name:"
+        await reply(f"Load Student {number}")
+        prompt = await read_prompt(reader)
+        while prompt.startswith("Your answer"):
+            sent = time.perf_counter()
+            await reply(random.choice("abcd"))
+            prompt = await read_prompt(reader)
+            latencies.append(time.perf_counter() - sent)
+        await reply("5")
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(args):
+    latencies = []
+    sem = asyncio.Semaphore(args.connect_limit)
+
+    async def one(number):
+        async with sem:
+            await student(number, args, latencies)
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(n) for n in range(args.clients)),
+                                    return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failures = [o for o in outcomes if isinstance(o, Exception)]
+
+    latencies.sort()
+    print(f"Students:   {args.clients} ({len(failures)} failed)")
+    print(f"Answers:    {len(latencies)} in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed if elapsed else 0:.0f}/s)")
+    print(f"Latency:    p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms, "
+          f"max {(latencies[-1] if latencies else 0) * 1000:.2f} ms")
+    if failures:
+        print(f"First failure: {failures[0]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent exam takers")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--guest", action="store_true",
+                        help="continue as guest instead of registering new users")
+    parser.add_argument("--connect-limit", type=int, default=1000,
+                        help="maximum simultaneously open connections")
+    asyncio.run(run(parser.parse_args()))
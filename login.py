@@ -8,6 +8,29 @@ Public function:
         mode: "user" or "guest"
         username: the username string (guest username if guest chosen)
 
+Every password check goes through AuthService (``get_auth()``), which sits
+in front of ``authenticate``:
+
+  - token-bucket rate limiting per username and per source (client
+    address): each wrong password for a registered user spends a token
+    from both buckets, and while either is empty further attempts are
+    refused with RateLimited before any password is hashed. Unknown
+    usernames cost no hashing and are not charged; registering one
+    (``register``) is checked and charged like a failed attempt, so it
+    cannot be used to get around the limits. A successful login clears the
+    user's bucket. Tune with QUIZ_AUTH_USER_RATE / QUIZ_AUTH_USER_BURST
+    and QUIZ_AUTH_SOURCE_RATE / QUIZ_AUTH_SOURCE_BURST (failed attempts
+    per minute / bucket size; a rate of 0 switches that limit off).
+    Sources listed in QUIZ_AUTH_TRUSTED_SOURCES (comma-separated, default
+    loopback) skip the per-source bucket, so a load generator or a local
+    proxy registering many users from one address is not serialised
+    behind it; the per-user buckets still apply to them.
+  - a bounded LRU cache of session tokens (QUIZ_SESSION_CACHE entries,
+    QUIZ_SESSION_TTL seconds): ``resume(token)`` logs a returning client
+    back in without hashing its password again.
+
+Attempts, rejections and session hits are counted in metrics.py.
+
 Example:
     from login import login_user
     mode, username = login_user()
@@ -17,13 +40,23 @@ Example:
         # guest mode
 """
 
-import csv
 import os
+import threading
+
+import metrics
+from ratelimit import RateLimiter, SessionCache
+from storage import get_storage
+from userstore import DATA_DIR, UserExists, hash_password, needs_rehash, verify_password
 
-# Config: change if you want a different data folder / filename
-DATA_DIR = "data"
-USER_CSV = os.path.join(DATA_DIR, "user.csv")
-CSV_HEADER = ["username", "password"]
+USER_RATE = float(os.environ.get("QUIZ_AUTH_USER_RATE", 5))        # failures per minute
+USER_BURST = int(os.environ.get("QUIZ_AUTH_USER_BURST", 5))
+SOURCE_RATE = float(os.environ.get("QUIZ_AUTH_SOURCE_RATE", 60))
+SOURCE_BURST = int(os.environ.get("QUIZ_AUTH_SOURCE_BURST", 30))
+TRUSTED_SOURCES = frozenset(
+    src.strip() for src in os.environ.get("QUIZ_AUTH_TRUSTED_SOURCES", "127.0.0.1,::1").split(",")
+    if src.strip())
+SESSION_CACHE = int(os.environ.get("QUIZ_SESSION_CACHE", 10_000))
+SESSION_TTL = float(os.environ.get("QUIZ_SESSION_TTL", 3600))
 
 
 # ----------------- Helpers -----------------
@@ -36,62 +69,21 @@ def ensure_data_dir():
 
 def ensure_user_csv():
     """
-    Ensure the user.csv file exists and has a header row.
-    If the file exists but lacks a header, this function will add one.
+    Ensure the user store exists (for the file backend: user.csv with a header).
+    The header check runs once per process, when the store is first created.
     """
     ensure_data_dir()
-    if not os.path.exists(USER_CSV):
-        # create with header
-        with open(USER_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(CSV_HEADER)
-        return
-
-    # check header presence
-    with open(USER_CSV, "r", newline="", encoding="utf-8") as f:
-        try:
-            reader = csv.reader(f)
-            first = next(reader, None)
-        except Exception:
-            first = None
-
-    if first is None or first != CSV_HEADER:
-        # Read existing rows then rewrite with proper header
-        with open(USER_CSV, "r", newline="", encoding="utf-8") as f:
-            rows = list(csv.reader(f))
-        # If the first row looks like data, keep it but add header
-        with open(USER_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(CSV_HEADER)
-            # If original file had data rows, write them back (except header-like duplicates)
-            for row in rows:
-                if row == CSV_HEADER:
-                    continue
-                if len(row) >= 2:
-                    writer.writerow([row[0].strip(), row[1].strip()])
-                elif row:
-                    # ignore malformed single-column rows
-                    continue
+    get_storage()
 
 
 def read_users():
-    """Return a list of (username, password) tuples from user.csv (excluding header)."""
-    ensure_user_csv()
-    users = []
-    with open(USER_CSV, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            uname = (r.get("username") or "").strip()
-            pwd = (r.get("password") or "").strip()
-            if uname and pwd:
-                users.append((uname, pwd))
-    return users
+    """Return a list of (username, password_hash) tuples from the user store."""
+    return list(get_storage().list_users())
 
 
 def user_exists(username):
-    """Return True if username exists in user.csv (case-sensitive)."""
-    users = read_users()
-    return any(u == username for u, _ in users)
+    """Return True if username is registered (case-sensitive)."""
+    return get_storage().get_user(username) is not None
 
 
 def validate_password(password):
@@ -111,17 +103,125 @@ def validate_password(password):
 
 
 def register_user(username, password):
-    """Append a new user (username, password) to user.csv. Assumes validated inputs."""
-    ensure_user_csv()
-    with open(USER_CSV, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([username, password])
+    """
+    Store a new user with a salted password hash. Assumes validated inputs;
+    raises UserExists rather than replace a registered user's password.
+    """
+    get_storage().set_user(username, hash_password(password))
 
 
+@metrics.timed("quiz_auth_seconds")
 def authenticate(username, password):
     """Return True if credentials match a registered user."""
-    users = read_users()
-    return any(u == username and p == password for u, p in users)
+    storage = get_storage()
+    stored = storage.get_user(username)
+    if stored is None or not verify_password(password, stored):
+        metrics.inc("quiz_auth_failures_total")
+        return False
+    metrics.inc("quiz_auth_successes_total")
+    if needs_rehash(stored):
+        # plaintext row from an older install, or the hash cost changed
+        storage.set_user(username, hash_password(password), replace=True)
+    return True
+
+
+# ----------------- Auth service -----------------
+
+class RateLimited(Exception):
+    """Too many failed attempts for this user or source; retry later."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed attempts. Try again in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class AuthService:
+    """Rate-limited front door to ``authenticate`` with a session-token cache."""
+
+    def __init__(self, storage=None, users=None, sources=None, sessions=None, trusted=None):
+        self._storage = storage
+        self.trusted = TRUSTED_SOURCES if trusted is None else frozenset(trusted)
+        # "is None", not "or": an empty limiter or cache has len() 0 and is falsy
+        self.users = RateLimiter(USER_RATE / 60, USER_BURST) if users is None else users
+        self.sources = RateLimiter(SOURCE_RATE / 60, SOURCE_BURST) if sources is None else sources
+        self.sessions = SessionCache(SESSION_CACHE, SESSION_TTL) if sessions is None else sessions
+
+    @property
+    def storage(self):
+        return self._storage or get_storage()
+
+    def _source(self, source):
+        # None is never limited, so trusted sources skip the per-source bucket
+        return None if source in self.trusted else source
+
+    def check(self, username, source=None):
+        """Raise RateLimited if ``username`` or ``source`` may not try a password now."""
+        wait = max(self.users.retry_after(username),
+                   self.sources.retry_after(self._source(source)))
+        if wait > 0:
+            metrics.inc("quiz_auth_rejected_total", doc="Login attempts refused by rate limiting")
+            raise RateLimited(wait)
+
+    def login(self, username, password, source=None):
+        """
+        Verify a password; returns a session token, or None if the
+        credentials are wrong. Raises RateLimited without checking the
+        password while the user or the source is throttled.
+        """
+        self.check(username, source)
+        metrics.inc("quiz_auth_attempts_total", doc="Login attempts checked")
+        if not authenticate(username, password):
+            if self.storage.get_user(username) is not None:
+                self.users.charge(username)
+                self.sources.charge(self._source(source))
+            return None
+        self.users.forget(username)
+        return self.issue(username)
+
+    def register(self, username, password, source=None):
+        """
+        Register a new user and return a session token. Raises RateLimited
+        while the user or source is throttled, and UserExists for a
+        registered username (its password is never replaced).
+        """
+        self.check(username, source)
+        self.users.charge(username)
+        self.sources.charge(self._source(source))
+        register_user(username, password)
+        metrics.inc("quiz_auth_registrations_total", doc="New users registered")
+        return self.issue(username)
+
+    def issue(self, username):
+        """A session token for a user who just proved who they are (login, registration)."""
+        return self.sessions.issue(username, self.storage.get_user(username) or "")
+
+    def resume(self, token):
+        """The username a session token belongs to, or None (no password hashing)."""
+        username = self.sessions.get(token, self.storage.get_user)
+        metrics.inc("quiz_auth_session_hits_total" if username else "quiz_auth_session_misses_total")
+        return username
+
+    def logout(self, token):
+        self.sessions.revoke(token)
+
+    def stats(self):
+        return {"sessions": len(self.sessions), "tracked_users": len(self.users),
+                "tracked_sources": len(self.sources)}
+
+
+_auth = None
+_auth_lock = threading.Lock()
+
+
+def get_auth():
+    """Return the process-wide ``AuthService``."""
+    global _auth
+    with _auth_lock:
+        if _auth is None:
+            _auth = AuthService()
+            metrics.gauge("quiz_auth_sessions", lambda: len(_auth.sessions),
+                          "Session tokens in the LRU cache")
+        return _auth
 
 
 # ----------------- Public API -----------------
@@ -136,10 +236,51 @@ def login_user():
         - mode == "guest": guest mode (username is provided guest id)
     """
     ensure_user_csv()
+    auth = get_auth()
 
     print("\n=== Welcome to the Quiz System Login ===\n")
 
-    # ask for credentials
+    # each pass is one login attempt; retries loop here instead of recursing
+    while True:
+        username = _ask_username()
+        password = _ask_password()
+
+        try:
+            if auth.login(username, password):
+                print(f"\n✅ Logged in as registered user: {username}")
+                return ("user", username)
+        except RateLimited as exc:
+            print(f"\n⛔ {exc}")
+            continue
+
+        # user not found / incorrect credentials
+        print("\n❌ Username/password not found or incorrect.")
+        while True:
+            choice = input("Do you want to register this account? (y/n) or type 'guest' to continue as guest: ").strip().lower()
+            if choice in ("y", "yes", "n", "no", "guest"):
+                break
+            print("Please type 'y' to register, 'n' to try logging in again, or 'guest' to continue as guest.")
+
+        if choice in ("y", "yes"):
+            # register after validation; an existing account is never overwritten
+            try:
+                auth.register(username, password)
+            except RateLimited as exc:
+                print(f"\n⛔ {exc}")
+                continue
+            except UserExists:
+                print("That username already exists with a different password. Try logging in or choose another username.")
+                continue
+            print(f"\n✅ Registered new user: {username} (you are now logged in).")
+            return ("user", username)
+        if choice == "guest":
+            guest_name = f"guest_{username}"
+            print(f"\n⚠️ Continuing in guest mode as {guest_name}. (Data will not be saved to the user database.)")
+            return ("guest", guest_name)
+        print("Okay — let's try logging in again.")
+
+
+def _ask_username():
     while True:
         raw_user = input("Enter username (no commas): ").strip()
         if not raw_user:
@@ -148,54 +289,28 @@ def login_user():
         if "," in raw_user:
             print("Username must not contain commas. Try again.")
             continue
-        username = raw_user
-        break
+        return raw_user
+
 
+def _ask_password():
     while True:
         raw_pwd = input("Enter password (min 4 chars, no commas): ").strip()
         is_valid, msg = validate_password(raw_pwd)
         if not is_valid:
             print("Invalid password:", msg)
             continue
-        password = raw_pwd
-        break
-
-    # try authenticate
-    if authenticate(username, password):
-        print(f"\n✅ Logged in as registered user: {username}")
-        return ("user", username)
-
-    # user not found / incorrect credentials
-    print("\n❌ Username/password not found or incorrect.")
-    while True:
-        choice = input("Do you want to register this account? (y/n) or type 'guest' to continue as guest: ").strip().lower()
-        if choice in ("y", "yes"):
-            if user_exists(username):
-                print("That username already exists with a different password. Try logging in or choose another username.")
-                # give option to retry login/register by returning control to caller
-                return login_user()
-            # register after validation
-            register_user(username, password)
-            print(f"\n✅ Registered new user: {username} (you are now logged in).")
-            return ("user", username)
-        elif choice in ("guest",):
-            guest_name = f"guest_{username}"
-            print(f"\n⚠️ Continuing in guest mode as {guest_name}. (Data will not be saved to the user database.)")
-            return ("guest", guest_name)
-        elif choice in ("n", "no"):
-            # offer to retry or exit to caller — we loop back to login_user to restart
-            print("Okay — let's try logging in again.")
-            return login_user()
-        else:
-            print("Please type 'y' to register, 'n' to try logging in again, or 'guest' to continue as guest.")
+        return raw_pwd
 
 
 # Optional: allow non-interactive programmatic usage
-def login_with_credentials(username, password, auto_register=False):
+def login_with_credentials(username, password, auto_register=False, source=None):
     """
     Programmatic login helper.
-    Returns ("user", username) if authenticated or registered (if auto_register True).
-    Returns ("guest", username) if auto_register==False and not found.
+    Returns ("user", username) if authenticated, or if registered (only
+    with auto_register, and only when the username is not taken).
+    Returns ("guest", "guest_<username>") otherwise, including a wrong
+    password for a registered user.
+    Raises RateLimited while ``username`` or ``source`` is throttled.
     """
     username = username.strip()
     password = password.strip()
@@ -203,11 +318,15 @@ def login_with_credentials(username, password, auto_register=False):
     if not is_valid:
         raise ValueError(f"Invalid password: {msg}")
 
-    if authenticate(username, password):
-        return ("user", username)
-    if auto_register:
-        register_user(username, password)
+    auth = get_auth()
+    if auth.login(username, password, source):
         return ("user", username)
+    if auto_register and not user_exists(username):
+        try:
+            auth.register(username, password, source)
+            return ("user", username)
+        except UserExists:
+            pass  # registered by someone else in the meantime
     return ("guest", f"guest_{username}")
 
 
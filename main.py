@@ -1,14 +1,50 @@
+import argparse
+import sys
+
 from login import login_user
-from teacher import add_question, view_questions
+from teacher import add_question, search_questions, view_questions
 from student import start_exam, show_result
-from util import banner, clear_screen, performance_board
+from util import banner, clear_screen, performance_board, set_fast
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Student-Teacher Quiz Interface")
+    parser.add_argument("--fast", action="store_true",
+                        help="skip screen clearing and slow printing")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="grade JSONL exam attempts from FILE ('-' for stdin) and exit")
+    parser.add_argument("--out", metavar="FILE",
+                        help="write batch results here instead of stdout")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="concurrent logins in batch mode")
+    return parser.parse_args(argv)
+
+def run_headless(args):
+    """Batch mode: no prompts, no effects; one exam attempt per input line."""
+    from batch import run_batch
+
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        _, failed = run_batch(source, out, jobs=args.jobs)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fast or args.batch:
+        set_fast()
+    if args.batch:
+        return run_headless(args)
 
-def main():
     clear_screen()
     banner("The Greatest Student-Teacher Quiz Interface")
 
-   mode, username = login_user()
-   if not username:
+    mode, username = login_user()
+    if not username:
         print("❌ Login failed. Exiting...")
         return
 
@@ -17,26 +53,29 @@ def main():
         banner("Main Menu")
         print("1. Teacher - Add Question")
         print("2. Teacher - View Question Bank")
-        print("3. Student - Take Exam")
-        print("4. See Performance Board")
-        print("5. Exit")
+        print("3. Teacher - Search Question Bank")
+        print("4. Student - Take Exam")
+        print("5. See Performance Board")
+        print("6. Exit")
 
-        choice = input("Choose an option (1-4): ").strip()
+        choice = input("Choose an option (1-6): ").strip()
 
         if choice == "1":
             add_question()
         elif choice == "2":
             view_questions()
         elif choice == "3":
-            result = start_exam()
+            search_questions()
+        elif choice == "4":
+            result = start_exam(username)
             show_result(result)
-        elif choice == 4:
-            performance_board()
         elif choice == "5":
+            performance_board()
+        elif choice == "6":
             print("👋 Goodbye!")
             break
         else:
-            print("⚠️ Invalid choice. Please select 1-5.")
+            print("⚠️ Invalid choice. Please select 1-6.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+metrics.py
+
+Lightweight instrumentation for the Quiz System: counters, gauges and
+latency histograms around storage, auth, grading and rendering calls.
+
+Instrumentation is off unless switched on, and a disabled ``@timed``
+wrapper costs one global flag check per call. Configuration comes from the
+environment (read once, at import):
+
+    QUIZ_METRICS=1              collect metrics in-process
+    QUIZ_METRICS_PORT=9100      also serve Prometheus text at
+                                http://127.0.0.1:9100/metrics
+    QUIZ_METRICS_FILE=path      write Prometheus text to ``path`` at exit
+    QUIZ_TRACE=path             record timed calls as Chrome trace events
+                                (open in chrome://tracing or Perfetto) and
+                                write them to ``path`` at exit
+
+Any of the last three implies QUIZ_METRICS=1.
+
+Example:
+    import metrics
+
+    @metrics.timed("quiz_bank_read_seconds")
+    def read(...): ...
+
+    metrics.inc("quiz_cache_misses_total")
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+TRACE_LIMIT = 200_000  # most recent trace events kept in memory
+
+_enabled = False
+_tracing = False
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_help = {}
+_trace = deque(maxlen=TRACE_LIMIT)
+_pid = os.getpid()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace=False):
+    global _enabled, _tracing
+    _enabled = True
+    _tracing = _tracing or trace
+
+
+def disable():
+    global _enabled, _tracing
+    _enabled = _tracing = False
+
+
+def reset():
+    """Drop every recorded value (gauges stay registered)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _trace.clear()
+
+
+# ----------------- Recording -----------------
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def inc(name, amount=1, doc=None):
+    """Add ``amount`` to counter ``name``."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+        if doc:
+            _help.setdefault(name, doc)
+
+
+def observe(name, value, doc=None, buckets=DEFAULT_BUCKETS):
+    """Record ``value`` (usually seconds) in histogram ``name``."""
+    if not _enabled:
+        return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram(buckets)
+        hist.observe(value)
+        if doc:
+            _help.setdefault(name, doc)
+
+
+def gauge(name, func, doc=None):
+    """Register a callback sampled whenever metrics are exported."""
+    with _lock:
+        _gauges[name] = func
+        if doc:
+            _help[name] = doc
+
+
+def _record_span(name, started, elapsed):
+    observe(name, elapsed)
+    if _tracing:
+        _trace.append({
+            "name": name.replace("_seconds", ""),
+            "ph": "X",
+            "ts": started * 1e6,
+            "dur": elapsed * 1e6,
+            "pid": _pid,
+            "tid": threading.get_ident(),
+        })
+
+
+def timed(name):
+    """Decorator: record the call's duration in histogram ``name``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record_span(name, started, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+class span:
+    """Context manager timing a block: ``with metrics.span("x_seconds"): ...``"""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter() if _enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            _record_span(self.name, self.started, time.perf_counter() - self.started)
+
+
+# ----------------- Export -----------------
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text():
+    """Render every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (h.bounds, list(h.counts), h.total, h.count)
+                      for k, h in _histograms.items()}
+        gauges = dict(_gauges)
+        helps = dict(_help)
+
+    lines = []
+    for name in sorted(counters):
+        if name in helps:
+            lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {_fmt(counters[name])}")
+    for name in sorted(gauges):
+        try:
+            value = gauges[name]()
+        except Exception:
+            continue
+        if name in helps:
+            lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_fmt(value)}")
+    for name in sorted(histograms):
+        bounds, counts, total, count = histograms[name]
+        if name in helps:
+            lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip(bounds, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{name}_sum {_fmt(total)}")
+        lines.append(f"{name}_count {count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def write_trace(path):
+    """Write recorded spans as a Chrome trace-event JSON file."""
+    with _lock:
+        events = list(_trace)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _handler():
+    # http.server drags in email/http.client; import it only when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve_http(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _handler())
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def configure_from_env():
+    port = os.environ.get("QUIZ_METRICS_PORT")
+    prom_file = os.environ.get("QUIZ_METRICS_FILE")
+    trace_file = os.environ.get("QUIZ_TRACE")
+    if os.environ.get("QUIZ_METRICS", "0") != "0" or port or prom_file or trace_file:
+        enable(trace=bool(trace_file))
+    if port:
+        serve_http(int(port))
+    if prom_file:
+        atexit.register(write_prometheus, prom_file)
+    if trace_file:
+        atexit.register(write_trace, trace_file)
+
+
+configure_from_env()
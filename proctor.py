@@ -0,0 +1,453 @@
+"""
+proctor.py
+
+Timed exams: a time limit per session, enforced by one deadline scheduler
+for every session in the process, with answers checkpointed as they are
+given so a session survives a crash.
+
+Set QUIZ_EXAM_MINUTES to time every exam; the front ends (student.py,
+server.py, app.py) then start sessions through ``get_proctor()``:
+
+    proctor = get_proctor()                  # None while exams are untimed
+    session = proctor.start("ann", "Ann")    # or her unfinished session, resumed
+    for q in session:
+        session.answer(q, input(q.text))     # None once time is up
+    result = session.submit()
+
+Scheduling: DeadlineScheduler keeps a heap of (deadline, session) and one
+thread that sleeps until the earliest deadline, so 2,000 takers cost 2,000
+heap entries, not 2,000 timers. When a deadline passes the session is
+graded and saved as it stands (auto-submit), whether or not its student is
+still connected.
+
+Checkpoints: every session is an append-only run of compact records in
+``checkpoints.bin`` (QUIZ_CHECKPOINT_LOG):
+
+    START   uint8 1 | uint64 session | uint32 n | n bytes of JSON (who, which
+            questions: the bank slice or the drawn plan, and the deadline)
+    ANSWER  uint8 2 | uint64 session | uint32 slot | uint8 letter (0 = cleared)
+    END     uint8 3 | uint64 session
+
+An answer is one 14-byte locked append. Starting a session for a student
+who has an open one resumes it with the answers given so far and the
+original deadline (the clock keeps running while the process is down).
+A proctor coming up schedules every open session in the log, so sessions
+orphaned by a crash are still submitted when their time is up. A record
+torn by a crash is cut off before the next append. Submission
+happens under the log's file lock and only if the session has no END yet,
+so a result is saved exactly once even when several processes proctor the
+same log. Ended sessions are dropped when the log is compacted.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import secrets
+import struct
+import sys
+import threading
+import time
+
+import filelock
+import metrics
+from assembly import ExamPlan
+from exam import ExamSession
+from result_sink import get_sink
+from snapshot import get_snapshot
+from storage import get_storage
+
+CHECKPOINT_LOG = "checkpoints.bin"
+COMPACT_BYTES = 4 * 1024 * 1024    # compact the log past this size, on a submit
+
+START, ANSWER, END = 1, 2, 3
+START_HEAD = struct.Struct("<BQI")
+ANSWER_REC = struct.Struct("<BQIB")
+END_REC = struct.Struct("<BQ")
+
+
+def exam_minutes():
+    """The time limit from QUIZ_EXAM_MINUTES (0 = untimed)."""
+    return max(0.0, float(os.environ.get("QUIZ_EXAM_MINUTES", "0") or 0))
+
+
+def checkpoint_path():
+    return os.environ.get("QUIZ_CHECKPOINT_LOG", CHECKPOINT_LOG)
+
+
+def format_remaining(seconds):
+    seconds = max(0, int(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+# ----------------- Deadline scheduler -----------------
+
+class DeadlineScheduler:
+    """One thread and a heap of deadlines; calls ``on_expire(key)`` as each passes."""
+
+    def __init__(self, on_expire, clock=time.time):
+        self.on_expire = on_expire
+        self.clock = clock
+        self._heap = []
+        self._live = {}               # key -> its current deadline
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, key, deadline):
+        """Fire for ``key`` at ``deadline`` (replacing any earlier schedule)."""
+        with self._cond:
+            self._live[key] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._seq), key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="exam-deadlines", daemon=True)
+                self._thread.start()
+            if self._heap[0][2] == key:
+                self._cond.notify()   # new earliest deadline: re-arm the wait
+
+    def cancel(self, key):
+        """Forget ``key``; its heap entry is skipped when it surfaces."""
+        with self._cond:
+            self._live.pop(key, None)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._live)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _, key = self._heap[0]
+                    if self._live.get(key) != deadline:
+                        heapq.heappop(self._heap)   # cancelled or rescheduled
+                        continue
+                    delay = deadline - self.clock()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    del self._live[key]
+                    break
+            try:
+                self.on_expire(key)
+            except Exception as exc:  # one bad session must not stop the clock
+                print(f"⚠️ Auto-submit of session {key:x} failed: {exc}", file=sys.stderr)
+
+
+# ----------------- Checkpoint log -----------------
+
+class CheckpointLog:
+    """
+    The checkpoint file folded into ``{session id: {"meta", "answers"}}`` for
+    sessions without an END, kept fresh from the file tail.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or checkpoint_path()
+        self.sessions = {}
+        self._lock = threading.RLock()
+        self._offset = 0
+        self._inode = None
+
+    def refresh(self):
+        """Fold records appended since the last call (by any process); returns ``sessions``."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self.sessions, self._offset, self._inode = {}, 0, None
+                return self.sessions
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self.sessions, self._offset, self._inode = {}, 0, st.st_ino  # compacted
+            if st.st_size > self._offset:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    self._offset += self._fold(f.read(st.st_size - self._offset))
+            return self.sessions
+
+    def _fold(self, buf):
+        """Apply whole records from ``buf``; returns the bytes consumed."""
+        pos = 0
+        while pos < len(buf):
+            kind = buf[pos]
+            if kind == START:
+                if pos + START_HEAD.size > len(buf):
+                    break
+                _, sid, size = START_HEAD.unpack_from(buf, pos)
+                end = pos + START_HEAD.size + size
+                if end > len(buf):
+                    break
+                meta = json.loads(buf[pos + START_HEAD.size:end].decode("utf-8"))
+                self.sessions.setdefault(sid, {"meta": meta, "answers": {}})
+            elif kind == ANSWER:
+                end = pos + ANSWER_REC.size
+                if end > len(buf):
+                    break
+                _, sid, slot, letter = ANSWER_REC.unpack_from(buf, pos)
+                if sid in self.sessions:
+                    self.sessions[sid]["answers"][slot] = letter
+            elif kind == END:
+                end = pos + END_REC.size
+                if end > len(buf):
+                    break  # torn tail: a writer died mid-record
+                self.sessions.pop(END_REC.unpack_from(buf, pos)[1], None)
+            else:
+                raise ValueError(f"{self.path}: corrupt checkpoint record at byte {self._offset + pos}")
+            pos = end
+        return pos
+
+    def _append(self, data):
+        with filelock.locked(self.path), self._lock:
+            self.refresh()
+            known = self._inode is not None
+            if known and os.path.getsize(self.path) > self._offset:
+                # a writer died mid-record: cut it off so new records stay parseable
+                os.truncate(self.path, self._offset)
+            filelock.append(self.path, data)
+            if known:
+                self._offset += self._fold(data)  # our own records: no need to read them back
+        metrics.inc("quiz_checkpoint_bytes_total", len(data))
+
+    def start(self, sid, meta):
+        payload = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._append(START_HEAD.pack(START, sid, len(payload)) + payload)
+
+    def answer(self, sid, slot, letter):
+        self._append(ANSWER_REC.pack(ANSWER, sid, slot, letter))
+
+    def end(self, sid):
+        self._append(END_REC.pack(END, sid))
+
+    def compact(self):
+        """Rewrite the log with only the open sessions' start and latest answers."""
+        with filelock.locked(self.path), self._lock:
+            sessions = self.refresh()
+            out = bytearray()
+            for sid, state in sessions.items():
+                payload = json.dumps(state["meta"], ensure_ascii=False,
+                                     separators=(",", ":")).encode("utf-8")
+                out += START_HEAD.pack(START, sid, len(payload)) + payload
+                for slot, letter in state["answers"].items():
+                    out += ANSWER_REC.pack(ANSWER, sid, slot, letter)
+            with filelock.atomic_write(self.path, "wb") as f:
+                f.write(out)
+            self._inode = None  # re-read the rewritten file on the next refresh
+        metrics.inc("quiz_checkpoint_compactions_total")
+
+
+# ----------------- Sessions -----------------
+
+class TimedSession:
+    """An ExamSession with a deadline whose every answer is checkpointed."""
+
+    def __init__(self, proctor, sid, meta, exam):
+        self.proctor = proctor
+        self.id = sid
+        self.meta = meta
+        self.exam = exam
+        self.result = None
+        self._lock = threading.Lock()
+
+    # ---- the ExamSession surface the front ends use ----
+
+    def __len__(self):
+        return len(self.exam)
+
+    def __iter__(self):
+        return iter(self.exam)
+
+    @property
+    def pages(self):
+        return self.exam.pages
+
+    @property
+    def plan(self):
+        return self.exam.plan
+
+    @property
+    def storage(self):
+        return self.exam.storage
+
+    def page(self, number):
+        return self.exam.page(number)
+
+    def choice(self, question):
+        return self.exam.choice(question)
+
+    def choices(self):
+        return self.exam.choices()
+
+    # ---- timing ----
+
+    @property
+    def deadline(self):
+        return self.meta["deadline"]
+
+    def remaining(self):
+        """Seconds left (0.0 once time is up)."""
+        return max(0.0, self.deadline - time.time())
+
+    @property
+    def submitted(self):
+        return self.result is not None
+
+    def answered(self):
+        return sum(1 for c in self.exam.choices() if c)
+
+    # ---- answers ----
+
+    def answer(self, question, choice):
+        """Record and checkpoint ``choice``; returns its outcome, or None once time is up."""
+        if time.time() >= self.deadline:
+            self.submit()
+        with self._lock:
+            if self.result is not None:
+                return None
+            before = self.exam.choice(question)
+            outcome = self.exam.answer(question, choice)
+            after = self.exam.choice(question)
+            if after != before:
+                self.proctor.log.answer(self.id, question.number - 1, ord(after) if after else 0)
+            return outcome
+
+    def submit(self):
+        """Grade and save the session once (later calls return the same result)."""
+        with self._lock:
+            if self.result is None:
+                self.result = self.proctor._finish(self)
+            return self.result
+
+
+class Proctor:
+    """Starts, resumes, times and submits the exam sessions of one checkpoint log."""
+
+    def __init__(self, minutes=None, log=None, sink=None):
+        self.minutes = exam_minutes() if minutes is None else minutes
+        self.log = log or CheckpointLog()
+        self.sink = sink
+        self.scheduler = DeadlineScheduler(self._expire)
+        self._live = {}                 # session id -> TimedSession started or resumed here
+        self._lock = threading.Lock()
+        for sid, state in self.log.refresh().items():
+            self.scheduler.schedule(sid, state["meta"]["deadline"])
+
+    def start(self, username, name=None, storage=None):
+        """A new timed session for ``username``, or their open one resumed."""
+        session = self.resume(username)
+        if session is not None:
+            return session
+        exam = ExamSession.for_student(username, storage)
+        sid = secrets.randbits(64)
+        meta = {
+            "username": username,
+            "name": name or username,
+            "deadline": time.time() + self.minutes * 60,
+            "course": exam.course,
+            "exam": getattr(exam.storage, "ref", None),
+        }
+        if exam.plan is None:
+            meta["start"], meta["stop"] = exam.start, exam.stop
+        else:
+            meta["plan"] = {"positions": list(exam.plan.positions), "orders": exam.plan.orders.hex()}
+        self.log.start(sid, meta)
+        session = TimedSession(self, sid, meta, exam)
+        with self._lock:
+            self._live[sid] = session
+        self.scheduler.schedule(sid, meta["deadline"])
+        metrics.inc("quiz_exam_sessions_started_total")
+        return session
+
+    def resume(self, username):
+        """``username``'s unfinished session (answers restored), or None."""
+        open_sessions = self.log.refresh()
+        for sid, state in list(open_sessions.items()):
+            if state["meta"]["username"] == username:
+                with self._lock:
+                    session = self._live.get(sid)
+                if session is None:
+                    session = self._rebuild(sid, state)
+                    metrics.inc("quiz_exam_sessions_resumed_total")
+                if session.remaining() <= 0:
+                    session.submit()   # expired while nobody was looking
+                    continue
+                return session
+        return None
+
+    def _rebuild(self, sid, state):
+        meta = state["meta"]
+        if meta.get("exam"):
+            storage = get_snapshot(meta["exam"]["name"], meta["exam"]["revision"])
+        else:
+            storage = get_storage(meta.get("course") or "")
+        if "plan" in meta:
+            plan = ExamPlan(None, meta["plan"]["positions"], bytes.fromhex(meta["plan"]["orders"]))
+            exam = ExamSession(storage, plan=plan)
+        else:
+            exam = ExamSession(storage, meta["start"], meta["stop"] - meta["start"])
+        exam.restore(state["answers"])
+        session = TimedSession(self, sid, meta, exam)
+        with self._lock:
+            session = self._live.setdefault(sid, session)
+        self.scheduler.schedule(sid, meta["deadline"])
+        return session
+
+    def _expire(self, sid):
+        with self._lock:
+            session = self._live.get(sid)
+        if session is None:
+            state = self.log.refresh().get(sid)
+            if state is None:
+                return  # submitted already, here or by another process
+            session = self._rebuild(sid, state)
+        if session.result is None:
+            metrics.inc("quiz_exam_autosubmitted_total")
+        session.submit()
+
+    def _finish(self, session):
+        """Grade and save ``session`` unless another process already has; returns the result."""
+        self.scheduler.cancel(session.id)
+        with filelock.locked(self.log.path):
+            state = self.log.refresh().get(session.id)
+            if state is not None:
+                session.exam.restore(state["answers"])  # answers given in other processes too
+            result = session.exam.result()
+            if state is not None:
+                meta = session.meta
+                (self.sink or get_sink()).submit(
+                    meta["username"], meta["name"], result["correct"], result["incorrect"],
+                    result["skipped"], result["score"], session.exam.answer_records(result["score"]),
+                    session.exam.course)
+                self.log.end(session.id)
+                metrics.inc("quiz_exam_sessions_submitted_total")
+        with self._lock:
+            self._live.pop(session.id, None)
+        if os.path.getsize(self.log.path) > COMPACT_BYTES:
+            self.log.compact()
+        return result
+
+    def stats(self):
+        with self._lock:
+            live = len(self._live)
+        return {"scheduled": len(self.scheduler), "live": live,
+                "open_in_log": len(self.log.refresh())}
+
+
+_proctor = None
+_proctor_lock = threading.Lock()
+
+
+def get_proctor():
+    """The process-wide Proctor, or None while QUIZ_EXAM_MINUTES is unset."""
+    global _proctor
+    if not exam_minutes():
+        return None
+    with _proctor_lock:
+        if _proctor is None:
+            _proctor = Proctor()
+            metrics.gauge("quiz_exam_sessions_scheduled", lambda: len(_proctor.scheduler),
+                          "Timed exam sessions waiting for their deadline")
+        return _proctor
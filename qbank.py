@@ -0,0 +1,515 @@
+"""
+qbank.py
+
+Indexed, random-access question bank for the Quiz System.
+
+On-disk layout (version 1):
+
+    quest.bin       header + length-prefixed records
+        header:  b"QBNK" | uint16 version | uint16 flags | 8 reserved bytes
+        record:  uint32 length | UTF-8 JSON [question, a, b, c, answer]
+    quest.bin.idx   flat array of little-endian uint64 record offsets
+
+The bank size is the index file size divided by 8, question N is one seek
+into the index plus one seek into the data file, and appending a question
+writes one record and one index entry without touching anything else.
+
+Older installs stored the bank as concatenated ``pickle.dump`` frames
+(``init_data.py`` wrote a single dict holding all its questions). Such files
+are detected by their missing magic and converted once by ``migrate_legacy``.
+
+Example:
+    from qbank import open_bank
+    with open_bank() as bank:
+        print(len(bank))
+        question, opts = bank.get(0)
+"""
+
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+from collections import OrderedDict
+
+import metrics
+from filelock import atomic_write, locked
+
+QUESTIONS_FILE = "quest.bin"
+INDEX_SUFFIX = ".idx"
+
+MAGIC = b"QBNK"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+RECORD_LEN = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+LETTERS = ("a", "b", "c")
+QUESTION_OVERHEAD = 320        # bytes of Python objects per decoded question, beyond its record
+OPEN_BANK_BYTES = 16 * 1024    # file buffers of an open bank
+
+
+# ----------------- Encoding -----------------
+
+def normalize_answer(opts):
+    """
+    Return the correct option as a letter.
+    Legacy banks sometimes stored the answer as the option text instead.
+    """
+    ans = str(opts[3]).strip()
+    if ans.lower() in LETTERS:
+        return ans.lower()
+    for letter, text in zip(LETTERS, opts[:3]):
+        if text == ans:
+            return letter
+    raise ValueError(f"Answer {ans!r} matches none of the options.")
+
+
+def encode_record(question, opts):
+    """Serialize one question into a length-prefixed record."""
+    payload = json.dumps(
+        [question, opts[0], opts[1], opts[2], normalize_answer(opts)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return RECORD_LEN.pack(len(payload)) + payload
+
+
+def decode_record(buf, offset):
+    """Decode the record at ``offset`` in ``buf``; returns (question, [a, b, c, ans])."""
+    (length,) = RECORD_LEN.unpack_from(buf, offset)
+    start = offset + RECORD_LEN.size
+    fields = json.loads(bytes(buf[start:start + length]).decode("utf-8"))
+    return fields[0], fields[1:]
+
+
+# ----------------- Format detection / migration -----------------
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def is_legacy(path):
+    """Return True if ``path`` exists and is not in the indexed format."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC))
+    return head != MAGIC
+
+
+def iter_legacy(path):
+    """Yield (question, opts) pairs from a legacy concatenated-pickle bank."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                data = pickle.load(f)
+            except EOFError:
+                break
+            for q, opts in data.items():
+                yield q, opts
+
+
+def create_bank(path):
+    """Create an empty bank (header only) and an empty index."""
+    with locked(path):
+        if os.path.exists(path):
+            return  # another process got there first
+        with atomic_write(index_path(path), "wb"):
+            pass
+        with atomic_write(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0))
+
+
+def write_bank(path, questions):
+    """
+    Write a complete bank from an iterable of (question, opts) pairs.
+    The new files are written beside the target and renamed into place.
+    Returns the number of questions written.
+    """
+    tmp, tmp_idx = path + ".tmp", index_path(path) + ".tmp"
+    count = 0
+    with locked(path):
+        with open(tmp, "wb") as data, open(tmp_idx, "wb") as idx:
+            data.write(HEADER.pack(MAGIC, VERSION, 0))
+            for q, opts in questions:
+                idx.write(OFFSET.pack(data.tell()))
+                data.write(encode_record(q, opts))
+                count += 1
+            data.flush()
+            os.fsync(data.fileno())
+        # drop the old index first: if we crash before the new one lands, the
+        # missing index is rebuilt from the data file on the next open
+        if os.path.exists(index_path(path)):
+            os.remove(index_path(path))
+        os.replace(tmp, path)
+        os.replace(tmp_idx, index_path(path))
+    return count
+
+
+def migrate_legacy(path=QUESTIONS_FILE, keep_backup=True):
+    """
+    Convert a legacy pickle-stream bank at ``path`` into the indexed format.
+    The original is kept as ``<path>.legacy`` unless ``keep_backup`` is False.
+    Returns the number of questions migrated (0 if nothing needed migrating).
+    """
+    with locked(path):
+        if not is_legacy(path):
+            return 0  # nothing to do, or another process already migrated it
+        questions = list(iter_legacy(path))
+        if keep_backup:
+            with open(path, "rb") as src, atomic_write(path + ".legacy", "wb") as dst:
+                dst.write(src.read())
+        return write_bank(path, questions)
+
+
+# ----------------- QuestionBank -----------------
+
+class QuestionBank:
+    """
+    Random-access reader/appender over an indexed bank.
+
+    Questions are returned as ``(question, [a, b, c, answer_letter])`` so
+    callers can keep using the ``opts[0..3]`` layout of the old format.
+    Pass ``use_mmap=True`` to serve reads from memory-mapped files.
+    """
+
+    def __init__(self, path=QUESTIONS_FILE, use_mmap=False):
+        self.path = path
+        self.use_mmap = use_mmap
+        if not os.path.exists(path):
+            create_bank(path)
+        elif is_legacy(path):
+            migrate_legacy(path)
+        if not os.path.exists(index_path(path)):
+            self._rebuild_index()
+        self._data = open(path, "rb")
+        self._idx = open(index_path(path), "rb")
+        self._check_header()
+        self._data_map = self._idx_map = None
+        self._mapped_size = -1
+
+    # ---- lifecycle ----
+
+    def close(self):
+        self._unmap()
+        self._data.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check_header(self):
+        magic, version, _ = HEADER.unpack(self._data.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a question bank.")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported bank version {version}.")
+
+    def _rebuild_index(self):
+        """Recreate a lost index by walking the records once."""
+        with locked(self.path):
+            if os.path.exists(index_path(self.path)):
+                return  # rebuilt by another process meanwhile
+            with open(self.path, "rb") as f:
+                buf = f.read()
+            offsets = bytearray()
+            pos = HEADER.size
+            while pos + RECORD_LEN.size <= len(buf):
+                (length,) = RECORD_LEN.unpack_from(buf, pos)
+                if pos + RECORD_LEN.size + length > len(buf):
+                    break  # torn trailing record
+                offsets += OFFSET.pack(pos)
+                pos += RECORD_LEN.size + length
+            with atomic_write(index_path(self.path), "wb") as f:
+                f.write(offsets)
+
+    def _unmap(self):
+        for m in (self._data_map, self._idx_map):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        self._data_map = self._idx_map = None
+
+    def _maps(self):
+        """Return (data_map, idx_map), remapping if the files grew."""
+        size = os.fstat(self._idx.fileno()).st_size
+        if size != self._mapped_size:
+            self._unmap()
+            self._data_map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            self._idx_map = (
+                mmap.mmap(self._idx.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            )
+            self._mapped_size = size
+        return self._data_map, self._idx_map
+
+    # ---- reads ----
+
+    def __len__(self):
+        return os.fstat(self._idx.fileno()).st_size // OFFSET.size
+
+    def _offset(self, n):
+        if self.use_mmap:
+            return OFFSET.unpack_from(self._maps()[1], n * OFFSET.size)[0]
+        self._idx.seek(n * OFFSET.size)
+        return OFFSET.unpack(self._idx.read(OFFSET.size))[0]
+
+    @metrics.timed("quiz_bank_read_seconds")
+    def get(self, n):
+        """Return question ``n`` (0-based) as (question, opts)."""
+        size = len(self)
+        if n < 0:
+            n += size
+        if not 0 <= n < size:
+            raise IndexError("question index out of range")
+        offset = self._offset(n)
+        if self.use_mmap:
+            return decode_record(self._maps()[0], offset)
+        self._data.seek(offset)
+        (length,) = RECORD_LEN.unpack(self._data.read(RECORD_LEN.size))
+        return decode_record(RECORD_LEN.pack(length) + self._data.read(length), 0)
+
+    __getitem__ = get
+
+    def page(self, start, size):
+        """Return up to ``size`` questions starting at index ``start``."""
+        stop = min(start + size, len(self))
+        return [self.get(n) for n in range(max(start, 0), stop)]
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.get(n)
+
+    # ---- writes ----
+
+    def append(self, question, a, b, c, ans):
+        """Append one question; returns its index."""
+        return self.extend([(question, [a, b, c, ans])])[0]
+
+    @metrics.timed("quiz_bank_append_seconds")
+    def extend(self, questions):
+        """Append many (question, opts) pairs in one write; returns their indexes."""
+        records, offsets = bytearray(), bytearray()
+        encoded = [encode_record(q, opts) for q, opts in questions]
+        # offsets depend on the current end of file, so concurrent appenders
+        # must not interleave; records land before the index entries that
+        # make them visible, so lock-free readers never see a partial record
+        with locked(self.path):
+            with open(self.path, "ab") as data:
+                pos = data.seek(0, os.SEEK_END)
+                for record in encoded:
+                    offsets += OFFSET.pack(pos + len(records))
+                    records += record
+                data.write(records)
+            with open(index_path(self.path), "ab") as idx:
+                end = idx.seek(0, os.SEEK_END)
+                if end % OFFSET.size:  # torn entry from a writer that died: drop it
+                    end = idx.truncate(end - end % OFFSET.size)
+                first = end // OFFSET.size
+                idx.write(offsets)
+        return list(range(first, first + len(offsets) // OFFSET.size))
+
+
+def open_bank(path=QUESTIONS_FILE, use_mmap=False):
+    """Open (creating or migrating as needed) the question bank at ``path``."""
+    return QuestionBank(path, use_mmap=use_mmap)
+
+
+# ----------------- Process-wide cache -----------------
+
+class BankCache:
+    """
+    Thread-safe, bounded cache of decoded questions for one bank file.
+
+    Questions are cached in fixed-size pages held in an LRU of at most
+    ``max_pages`` entries, so memory stays bounded however large the bank
+    is. Every access compares the (mtime, size) signature of the bank and
+    its index with the one the cache was filled from; when a teacher adds
+    a question the signature changes and the cache is dropped and reopened.
+
+    The bank files are opened on first access. ``close()`` gives back the
+    pages and the file handles (the course shard pool uses it to evict), and
+    the next access simply opens them again.
+    """
+
+    def __init__(self, path=QUESTIONS_FILE, page_size=64, max_pages=256):
+        self.path = path
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.hits = self.misses = self.reloads = 0
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._bank = None
+        self._signature = None
+        self._record_bytes = 0
+
+    def _stat_signature(self):
+        try:
+            data, idx = os.stat(self.path), os.stat(index_path(self.path))
+        except FileNotFoundError:
+            return None
+        return (data.st_ino, data.st_mtime_ns, data.st_size, idx.st_mtime_ns, idx.st_size)
+
+    def _refresh(self):
+        """Reopen the bank if the files changed since the cache was filled."""
+        signature = self._stat_signature()
+        if self._bank is not None and signature == self._signature:
+            return self._bank
+        if self._bank is not None:
+            self._bank.close()
+        self._pages.clear()
+        self._bank = QuestionBank(self.path)
+        self._signature = self._stat_signature()
+        size = len(self._bank)
+        self._record_bytes = (self._signature[2] - HEADER.size) // size if size else 0
+        self.reloads += 1
+        metrics.inc("quiz_bank_cache_reloads_total")
+        return self._bank
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is not None:
+            self._pages.move_to_end(number)
+            self.hits += 1
+            metrics.inc("quiz_bank_cache_hits_total")
+            return page
+        self.misses += 1
+        metrics.inc("quiz_bank_cache_misses_total")
+        page = self._bank.page(number * self.page_size, self.page_size)
+        self._pages[number] = page
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def __len__(self):
+        with self._lock:
+            return len(self._refresh())
+
+    def get(self, n):
+        """Return question ``n`` (0-based) as (question, opts)."""
+        with self._lock:
+            size = len(self._refresh())
+            if n < 0:
+                n += size
+            if not 0 <= n < size:
+                raise IndexError("question index out of range")
+            return self._page(n // self.page_size)[n % self.page_size]
+
+    __getitem__ = get
+
+    def get_many(self, positions):
+        """
+        Return the questions at arbitrary ``positions``. Cached pages are
+        used when present; otherwise only the one record is decoded, so
+        scattered reads (sampled exams) don't pull whole pages in.
+        """
+        with self._lock:
+            bank = self._refresh()
+            size = len(bank)
+            found = []
+            for n in positions:
+                if not 0 <= n < size:
+                    raise IndexError("question index out of range")
+                page = self._pages.get(n // self.page_size)
+                if page is not None:
+                    self.hits += 1
+                    found.append(page[n % self.page_size])
+                else:
+                    self.misses += 1
+                    found.append(bank.get(n))
+            return found
+
+    def page(self, start, size):
+        """Return up to ``size`` questions starting at index ``start``."""
+        with self._lock:
+            stop = min(start + size, len(self._refresh()))
+            out = []
+            n = max(start, 0)
+            while n < stop:
+                page = self._page(n // self.page_size)
+                offset = n % self.page_size
+                out.extend(page[offset:offset + stop - n])
+                n += len(page) - offset
+            return out
+
+    def __iter__(self):
+        start = 0
+        while True:
+            chunk = self.page(start, self.page_size)
+            if not chunk:
+                return
+            yield from chunk
+            start += len(chunk)
+
+    def append(self, question, a, b, c, ans):
+        """Append through the cache so the next read sees the new question."""
+        with self._lock:
+            index = self._refresh().append(question, a, b, c, ans)
+            self._signature = None  # force a reload on next access
+            return index
+
+    def extend(self, questions):
+        """Append many (question, opts) pairs in one write through the cache."""
+        with self._lock:
+            indexes = self._refresh().extend(questions)
+            self._signature = None
+            return indexes
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = None
+
+    def close(self):
+        """Drop the cached pages and close the bank; the next access reopens it."""
+        with self._lock:
+            self._pages.clear()
+            if self._bank is not None:
+                self._bank.close()
+                self._bank = None
+            self._signature = None
+
+    def resident_bytes(self):
+        """Approximate memory held: decoded questions plus the open files."""
+        with self._lock:
+            if self._bank is None:
+                return 0
+            cached = len(self._pages) * self.page_size  # only the last page can be short
+            return OPEN_BANK_BYTES + cached * (self._record_bytes + QUESTION_OVERHEAD)
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "pages": len(self._pages),
+                "max_pages": self.max_pages,
+            }
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(path=QUESTIONS_FILE, **kwargs):
+    """Return the process-wide ``BankCache`` for ``path`` (created on first use)."""
+    key = os.path.abspath(path)
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = BankCache(path, **kwargs)
+        return cache
+
+
+if __name__ == "__main__":
+    import sys
+
+    target = sys.argv[1] if len(sys.argv) > 1 else QUESTIONS_FILE
+    migrated = migrate_legacy(target)
+    if migrated:
+        print(f"✅ Migrated {migrated} questions in {target} to the indexed format.")
+    else:
+        print(f"{target} is already in the indexed format (or does not exist).")
@@ -0,0 +1,177 @@
+"""
+ratelimit.py
+
+Building blocks for throttled authentication: token-bucket rate limiting
+and a bounded LRU cache of verified sessions. Nothing here knows about
+users or storage; login.py wires them into AuthService.
+
+A TokenBucket holds up to ``burst`` tokens and refills at ``rate`` tokens
+per second. RateLimiter keeps one bucket per key (a username, a client
+address) in insertion order, so the map stays bounded: buckets that have
+refilled to full carry no state worth keeping and are dropped first, and
+past ``max_keys`` the least recently touched bucket goes.
+
+SessionCache maps opaque random tokens to the username they were issued
+for, with a time-to-live, evicting the least recently used token once
+``capacity`` is reached. Each entry also records the credential it was
+verified against, so a token stops working as soon as the user's stored
+password changes.
+
+Example:
+    limiter = RateLimiter(rate=0.5, burst=5)
+    wait = limiter.retry_after("ann")       # 0.0 -> allowed
+    limiter.charge("ann")                   # after a failed attempt
+
+    sessions = SessionCache(capacity=10_000, ttl=3600)
+    token = sessions.issue("ann", stored_hash)
+    sessions.get(token, current_hash)       # -> "ann"
+"""
+
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN_BYTES = 24
+
+
+# ----------------- Token buckets -----------------
+
+class TokenBucket:
+    """``burst`` tokens, refilled continuously at ``rate`` tokens per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def _refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def wait(self, now, cost=1):
+        """Seconds until ``cost`` tokens are available (0.0 if they are now)."""
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, now, cost=1):
+        """Remove ``cost`` tokens (the balance may go negative: more waiting)."""
+        self._refill(now)
+        self.tokens -= cost
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """Token buckets per key, bounded to ``max_keys`` entries."""
+
+    def __init__(self, rate, burst, max_keys=100_000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def retry_after(self, key, cost=1):
+        """Seconds ``key`` must wait before spending ``cost`` tokens (0.0: go ahead)."""
+        if not self.enabled or key is None:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return bucket.wait(self.clock(), cost) if bucket else 0.0
+
+    def charge(self, key, cost=1):
+        """Spend ``cost`` tokens from ``key``'s bucket."""
+        if not self.enabled or key is None:
+            return
+        with self._lock:
+            now = self.clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            else:
+                self._buckets.move_to_end(key)
+            bucket.take(now, cost)  # before evicting, so the new bucket is not "full"
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+
+    def forget(self, key):
+        """Drop ``key``'s bucket (e.g. after a successful login)."""
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _evict(self, now):
+        for key in [k for k, b in self._buckets.items() if b.full(now)]:
+            del self._buckets[key]
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+# ----------------- Session cache -----------------
+
+class SessionCache:
+    """Bounded LRU map of session token -> username, with expiry."""
+
+    def __init__(self, capacity=10_000, ttl=3600.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()   # token -> (username, credential, expires)
+        self._lock = threading.Lock()
+
+    def issue(self, username, credential):
+        """Return a new token for ``username``, verified against ``credential``."""
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        with self._lock:
+            self._entries[token] = (username, credential, self.clock() + self.ttl)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token, credential_of):
+        """
+        The username ``token`` was issued for, or None if it is unknown,
+        expired, or the user's credential has changed since.
+        ``credential_of(username)`` returns the current stored credential.
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            username, credential, expires = entry
+            if self.clock() >= expires:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+        current = credential_of(username)
+        if current is None or not hmac.compare_digest(current.encode("utf-8"),
+                                                      credential.encode("utf-8")):
+            self.revoke(token)
+            return None
+        return username
+
+    def revoke(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
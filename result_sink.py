@@ -0,0 +1,358 @@
+"""
+result_sink.py
+
+Batched, journaled writer for exam results.
+
+``save_result`` used to open results.csv, write one row and close it for
+every submission. The sink instead:
+
+    1. appends the submission to a small write-ahead journal (one line,
+       flushed and optionally fsynced) and returns,
+    2. queues it for a background thread that drains the queue and writes
+       everything it has as one batch (``Storage.save_results``) once
+       BATCH_SIZE rows are waiting or MAX_DELAY seconds have passed,
+    3. marks the batch committed in the journal (or truncates the journal
+       when nothing is pending).
+
+A failed batch write is retried with exponential backoff (RETRY_DELAY
+doubling up to RETRY_MAX_DELAY), at most RETRIES times. After that the
+sink gives up on the batch, leaves its rows uncommitted in the journal
+and moves on. Failures are reported on stderr.
+
+On start-up any journaled rows not covered by a commit marker are
+replayed. This includes batches the sink gave up on, so a crash or
+restart loses nothing that ``submit`` returned for. A crash between a
+batch write and its commit marker can replay that batch once more
+(at-least-once delivery).
+
+A journal belongs to one sink at a time (an exclusive filelock held for
+the sink's lifetime). When several processes share a data directory, the
+first owns ``results.journal`` and the others write private
+``results.journal.<pid>-<n>`` files; journals left behind by processes
+that died are replayed by the next sink that starts.
+
+Submissions may carry per-answer records (analytics.pack_answers) and the
+course whose bank they refer to. They are journaled with the result and
+appended to that bank's answer log once per batch, right after the
+batch's results.
+
+Queue depth and flush latency are reported by ``stats()``.
+"""
+
+import atexit
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import analytics
+import metrics
+from filelock import LOCK_SUFFIX, try_lock
+from storage import get_storage
+
+JOURNAL_FILE = "results.journal"
+BATCH_SIZE = 256
+MAX_DELAY = 0.05  # seconds a submission may wait before its batch is flushed
+RETRIES = 6            # attempts per batch before it is left to the journal
+RETRY_DELAY = 0.05     # seconds before the first retry, doubled after each
+RETRY_MAX_DELAY = 2.0
+
+
+class ResultSink:
+    """Group-commit writer in front of a Storage backend."""
+
+    def __init__(self, storage, journal_file=JOURNAL_FILE, batch_size=BATCH_SIZE,
+                 max_delay=MAX_DELAY, fsync=None, answer_log=None):
+        self.storage = storage
+        self.answer_log = answer_log or analytics.answer_log_path()
+        self.base_journal = journal_file
+        self.journal_file, self._owner = self._claim_journal(journal_file)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        if fsync is None:
+            fsync = os.environ.get("QUIZ_JOURNAL_FSYNC", "1") != "0"
+        self.fsync = fsync
+
+        self._queue = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._seq = 0
+        self._pending = 0           # journaled but not yet written (or given up on)
+        self._stranded = 0          # given up on: kept in the journal for the next start
+        self._idle = threading.Condition(threading.Lock())
+
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        self._recover()
+        self._journal = open(self.journal_file, "a", encoding="utf-8")
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self._thread.start()
+
+    # ---- journal ----
+
+    @staticmethod
+    def _claim_journal(base):
+        """Lock ``base`` or, if another live sink owns it, a private sibling."""
+        owner = try_lock(base)
+        if owner is not None:
+            return base, owner
+        n = 0
+        while True:
+            path = f"{base}.{os.getpid()}-{n}"
+            owner = try_lock(path)
+            if owner is not None:
+                return path, owner
+            n += 1
+
+    def _replay(self, path):
+        """Commit the rows of journal ``path`` that never reached storage."""
+        entries, answers, committed, ranges = {}, {}, 0, []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn final line from a crash mid-write
+                if "first" in record:
+                    ranges.append((record["first"], record["commit"]))
+                elif "commit" in record:  # covers every earlier row
+                    committed = max(committed, record["commit"])
+                else:
+                    entries[record["seq"]] = record["row"]
+                    if "answers" in record:
+                        answers[record["seq"]] = (bytes.fromhex(record["answers"]),
+                                                  record.get("course"))
+        replay = [seq for seq in sorted(entries)
+                  if seq > committed and not any(lo <= seq <= hi for lo, hi in ranges)]
+        if replay:
+            self.storage.save_results([entries[seq] for seq in replay])
+            self._append_answers([answers[seq] for seq in replay if seq in answers])
+        return len(replay)
+
+    def _append_answers(self, items):
+        """Append (records, course) pairs, grouped into one write per answer log."""
+        logs = {}
+        for data, course in items:
+            path = analytics.answer_log_path(course) if course else self.answer_log
+            logs.setdefault(path, bytearray()).extend(data)
+        for path, data in logs.items():
+            analytics.append_answers(bytes(data), path)
+
+    def _recover(self):
+        """Replay our own journal and any orphaned by processes that died."""
+        if os.path.exists(self.journal_file):
+            self._replay(self.journal_file)
+            open(self.journal_file, "w").close()
+        for path in glob.glob(glob.escape(self.base_journal) + ".*"):
+            if path.endswith(LOCK_SUFFIX) or path == self.journal_file:
+                continue
+            orphan = try_lock(path)
+            if orphan is None:
+                continue  # a live sink still owns it
+            try:
+                if os.path.exists(path):
+                    self._replay(path)
+                    os.remove(path)
+                _remove_quietly(path + LOCK_SUFFIX)
+            finally:
+                orphan.release()
+
+    def _write_journal(self, record):
+        self._journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    # ---- public API ----
+
+    def submit(self, username, name, correct, incorrect, skipped, score, answers=None,
+               course=None):
+        """
+        Durably accept one result (and its packed answer records, if given,
+        for the answer log of ``course``'s bank); it reaches storage with
+        the next batch.
+        """
+        row = [username, name, int(correct), int(incorrect), int(skipped), int(score)]
+        record = {"seq": 0, "row": row}
+        if answers:
+            record["answers"] = answers.hex()
+            if course:
+                record["course"] = course
+        with self._journal_lock:
+            if self._closed:
+                raise RuntimeError("result sink is closed")
+            self._seq += 1
+            seq = record["seq"] = self._seq
+            self._write_journal(record)
+            self._pending += 1
+            # enqueue under the lock so batches (and commit markers) stay in seq order
+            self._queue.put((seq, row, answers, course))
+
+    def flush(self, timeout=None):
+        """
+        Block until every submitted result has been written or given up on;
+        returns False on timeout or if any were left to the journal.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return not self._stranded
+
+    def close(self):
+        """Flush outstanding results and stop the writer thread."""
+        with self._journal_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._journal.close()
+        if self.journal_file != self.base_journal and not self._pending and not self._stranded:
+            # a private journal with nothing pending is not worth keeping
+            _remove_quietly(self.journal_file)
+            _remove_quietly(self.journal_file + LOCK_SUFFIX)
+        self._owner.release()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "pending": self._pending,
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "stranded": self._stranded,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+        }
+
+    # ---- writer thread ----
+
+    def _collect(self):
+        """Wait for one item, then gather more until the batch is full or stale."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()  # past the deadline: drain only
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        answers = [(a, course) for _, _, a, course in batch if a]
+        saved = written = False
+        delay = RETRY_DELAY
+        # closing with storage already failing: one try per batch, so close() returns promptly
+        retries = 1 if self._closed and self._stranded else RETRIES
+        for attempt in range(1, retries + 1):
+            try:
+                if not saved:
+                    self.storage.save_results([row for _, row, _, _ in batch])
+                    saved = True
+                self._append_answers(answers)
+                written = True
+                break
+            except Exception as exc:
+                self.errors += 1
+                metrics.inc("quiz_sink_errors_total")
+                if attempt == retries:
+                    print(f"⚠️ Result write failed ({exc}); leaving {len(batch)} result(s) "
+                          f"in {self.journal_file} for the next start.", file=sys.stderr)
+                    break
+                print(f"⚠️ Result write failed ({exc}); retry {attempt}/{RETRIES - 1} "
+                      f"in {delay:.2f}s.", file=sys.stderr)
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+        elapsed = (time.perf_counter() - started) * 1000
+        metrics.observe("quiz_sink_flush_seconds", elapsed / 1000)
+        if written:
+            metrics.inc("quiz_sink_rows_total", len(batch))
+        with self._journal_lock:
+            self._pending -= len(batch)
+            if not written:
+                self._stranded += len(batch)
+            elif self._pending == 0 and not self._stranded:
+                # everything journaled is in storage: start a fresh journal
+                self._journal.seek(0)
+                self._journal.truncate()
+            else:
+                # batches are consecutive seqs; an explicit range keeps stranded rows uncommitted
+                self._write_journal({"commit": batch[-1][0], "first": batch[0][0]})
+        self.batches += 1
+        if written:
+            self.rows += len(batch)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._total_flush_ms += elapsed
+        with self._idle:
+            self._idle.notify_all()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """Return the process-wide sink writing to ``get_storage()``."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = ResultSink(get_storage())
+            atexit.register(_sink.close)
+            metrics.gauge("quiz_sink_queue_depth", lambda: _sink._queue.qsize(),
+                          "Results waiting for the next group commit")
+        return _sink
+
+
+def flush_sink(timeout=None):
+    """
+    Flush the process-wide sink if one has been started (a reader that never
+    submitted has nothing waiting, and should not start a writer thread).
+    """
+    sink = _sink
+    return True if sink is None else sink.flush(timeout)
+
+
+def set_sink(sink):
+    """Install ``sink`` as the process-wide sink (tools, benchmarks)."""
+    global _sink
+    with _sink_lock:
+        _sink = sink
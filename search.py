@@ -0,0 +1,372 @@
+"""
+search.py
+
+Ranked keyword search over the question bank, for teachers looking for
+the question to fix in a bank too large to scroll.
+
+An inverted index maps every word of a question and its options to the
+questions that contain it (ascending positions, with a weighted count:
+words of the question text count QUESTION_WEIGHT times, option words
+once). It is built with one streaming pass over the bank and then kept
+current incrementally: questions this process appends (``add_question``,
+bulk imports) are indexed as they are written, through
+``storage.on_questions_added``, and a query more than REFRESH_SECONDS
+after the last check reads only the tail other processes appended. A
+rewritten bank is re-indexed from scratch. Postings pack a position above
+an 8-bit count in 32 bits, so a bank indexes at most MAX_QUESTIONS (2**24)
+questions.
+
+Queries are ranked with BM25 over the weighted counts, so questions
+matching more, and rarer, words come first. A question must contain
+every word of the query (its rarest word's postings are the only list
+walked in full); if none does, or with ``match_any``, questions with any
+of the words are ranked instead. ``-word`` excludes questions containing
+a word, and ``answer`` keeps only questions whose correct option is that
+letter (the key is kept in the index, one byte per question). Only the
+questions on the requested results page are read from storage; the rest
+of the bank is never deserialized for a query.
+
+Example:
+    from search import get_search_index
+    result = get_search_index().search("photosynthesis -plant", page=0)
+    for hit in result.hits:
+        print(hit.number, round(hit.score, 2), hit.text)
+
+Run:
+    python search.py "chemical bond" [--page 2] [--any] [--answer b] [--json]
+"""
+
+import heapq
+import math
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from operator import itemgetter
+
+import metrics
+from grading import OPTIONS
+from storage import get_storage, on_questions_added
+
+QUESTION_WEIGHT = 2
+K1 = 1.2           # BM25 term-frequency saturation
+B = 0.75           # BM25 length normalization
+PAGE_SIZE = 10
+READ_PAGE = 256    # questions per storage read while indexing
+TF_BITS = 8        # postings pack position << TF_BITS | weighted count
+TF_MAX = (1 << TF_BITS) - 1
+MAX_QUESTIONS = 1 << (32 - TF_BITS)  # positions that fit an array("I") posting
+REFRESH_SECONDS = 2.0  # how stale another process's additions may get
+
+Hit = namedtuple("Hit", "number score text options answer")  # number is 1-based
+Hit.__doc__ = "One search result: the question, its three options and key letter."
+SearchResult = namedtuple("SearchResult", "total hits partial")
+SearchResult.__doc__ = "One results page, the number of matches, and whether any word sufficed."
+
+_WORDS = re.compile(r"\w+")
+
+
+def terms(text):
+    """The index terms of ``text``: case-folded words, as in dedupe.normalize."""
+    return _WORDS.findall(str(text).casefold())
+
+
+def parse_query(query):
+    """``"a b -c"`` -> (terms to match, terms to exclude)."""
+    wanted, excluded = [], []
+    for word in query.split():
+        if word.startswith("-") and len(word) > 1:
+            excluded.extend(terms(word[1:]))
+        else:
+            wanted.extend(terms(word))
+    return list(dict.fromkeys(wanted)), set(excluded)
+
+
+# ----------------- Index -----------------
+
+class SearchIndex:
+    """Inverted index over a storage backend's questions and options."""
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_storage()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self._postings = {}         # term -> array("I") of position << TF_BITS | count, ascending
+        self._lengths = array("H")  # weighted terms per question
+        self._total_length = 0
+        self._key = bytearray()     # correct letter per question
+        self._last = None           # text of the last indexed question (rewrite check)
+        self._norms = None          # BM25 length factors, rebuilt after the bank grows
+        self._checked = None        # time.monotonic() of the last refresh (None: due now)
+
+    # ---- building ----
+
+    def _insert(self, n, question, opts):
+        if n >= MAX_QUESTIONS:
+            raise ValueError(f"the search index holds at most {MAX_QUESTIONS} questions")
+        counts = dict.fromkeys(terms(question), 0)
+        for term in terms(question):
+            counts[term] += QUESTION_WEIGHT
+        for term in terms(" ".join(opts[:3])):
+            counts[term] = counts.get(term, 0) + 1
+        base = n << TF_BITS
+        postings = self._postings
+        for term, count in counts.items():
+            docs = postings.get(term)
+            if docs is None:
+                docs = postings[term] = array("I")
+            docs.append(base | min(count, TF_MAX))
+        length = sum(counts.values())
+        self._lengths.append(min(length, 0xFFFF))
+        self._total_length += length
+        self._key.append(ord(opts[3]))
+        self._last = question
+
+    @metrics.timed("quiz_search_refresh_seconds")
+    def refresh(self):
+        """Index questions appended since the last refresh (rebuild if the bank was rewritten)."""
+        with self._lock:
+            total = self.storage.count_questions()
+            if total < self.count or (
+                self.count and self.storage.get_question(self.count - 1)[0] != self._last
+            ):
+                self._reset()
+            start = self.count
+            while self.count < total:
+                page = self.storage.question_page(self.count, READ_PAGE)
+                if not page:
+                    break
+                for question, opts in page:
+                    self._insert(self.count, question, opts)
+                    self.count += 1
+            self._checked = time.monotonic()
+            if self.count > start:
+                self._norms = None
+                metrics.inc("quiz_search_indexed_total", self.count - start)
+
+    def add(self, positions):
+        """
+        Index questions just appended at ``positions`` (the storage hook).
+        Anything but the next contiguous run is left to the next refresh.
+        """
+        with self._lock:
+            if self._checked is None:
+                return  # a refresh is due anyway
+            positions = list(positions or ())
+            if (not positions or positions != list(range(self.count, self.count + len(positions)))
+                    or positions[-1] >= MAX_QUESTIONS):
+                self._checked = None  # the next query refreshes (and reports a full index)
+                return
+            for question, opts in self.storage.get_questions(positions):
+                self._insert(self.count, question, opts)
+                self.count += 1
+            self._norms = None
+            metrics.inc("quiz_search_indexed_total", len(positions))
+
+    # ---- queries ----
+
+    def _bm25_norms(self):
+        """Per question: K1 * (1 - B + B * length / average length)."""
+        if self._norms is None:
+            scale = K1 * B * self.count / (self._total_length or 1)
+            self._norms = array("d", [K1 * (1.0 - B) + scale * length for length in self._lengths])
+        return self._norms
+
+    def _rank(self, wanted, excluded, match_all, answer, k):
+        """
+        ``(matches, [(position, score), ...])``: the number of matching
+        questions and the ``k`` best, by BM25 (lock held).
+
+        Terms are scored rarest first (MaxScore): once the k-th best score
+        so far beats the most the remaining, common terms could add, those
+        terms only update questions already found instead of scoring their
+        whole postings list.
+        """
+        n = self.count
+        lists = sorted((self._postings.get(term) or array("I") for term in wanted), key=len)
+        if not n or not lists or (match_all and not lists[0]):
+            return 0, []
+        norms = self._bm25_norms()
+        skip = set()
+        for term in excluded:
+            skip.update(p >> TF_BITS for p in self._postings.get(term, ()))
+        code = ord(answer) if answer else 0
+        key = self._key
+
+        def wanted_doc(doc):
+            return doc not in skip and (not code or key[doc] == code)
+
+        weights = [math.log(1.0 + (n - len(p) + 0.5) / (len(p) + 0.5)) * (K1 + 1.0) for p in lists]
+        if match_all:
+            scores = {}
+            for posting in lists[0]:
+                doc = posting >> TF_BITS
+                if wanted_doc(doc):
+                    tf = posting & TF_MAX
+                    scores[doc] = weights[0] * tf / (tf + norms[doc])
+            for postings, weight in zip(lists[1:], weights[1:]):
+                scores = _merge(scores, postings, weight, norms, drop_missing=True)
+            return len(scores), _best(scores, k)
+
+        scores = {}
+        unscored = []   # lists past the MaxScore cut, for the match count
+        remaining = sum(weights)
+        for postings, weight in zip(lists, weights):
+            if len(scores) >= k and remaining <= heapq.nlargest(k, scores.values())[-1]:
+                scores = _merge(scores, postings, weight, norms)
+                unscored.append(postings)
+            else:
+                filtered = skip or code
+                get = scores.get
+                for posting in postings:
+                    doc = posting >> TF_BITS
+                    if filtered and not wanted_doc(doc):
+                        continue
+                    tf = posting & TF_MAX
+                    scores[doc] = get(doc, 0.0) + weight * tf / (tf + norms[doc])
+            remaining -= weight
+        matches = len(scores)
+        if unscored:
+            extra = set()
+            for postings in unscored:
+                extra.update(p >> TF_BITS for p in postings)
+            extra.difference_update(scores)
+            matches += sum(1 for doc in extra if wanted_doc(doc)) if skip or code else len(extra)
+        return matches, _best(scores, k)
+
+    @metrics.timed("quiz_search_query_seconds")
+    def search(self, query, page=0, page_size=PAGE_SIZE, match_any=False, answer=None):
+        """
+        Rank the questions matching ``query`` and return results ``page``
+        (0-based). Questions must contain every word unless ``match_any``;
+        when none does, questions with any of the words are ranked instead
+        (``partial`` is then True).
+        """
+        if answer is not None and answer not in OPTIONS[:3]:
+            raise ValueError("answer must be a, b or c")
+        if self._checked is None or time.monotonic() - self._checked >= REFRESH_SECONDS:
+            self.refresh()
+        wanted, excluded = parse_query(query)
+        first = max(page, 0) * page_size
+        with self._lock:
+            total, best = self._rank(wanted, excluded, not match_any, answer, first + page_size)
+            partial = match_any
+            if not total and not match_any and len(wanted) > 1:
+                total, best = self._rank(wanted, excluded, False, answer, first + page_size)
+                partial = True
+        best = best[first:]
+        hits = [Hit(n + 1, score, text, list(opts[:3]), opts[3])
+                for (n, score), (text, opts) in zip(best, self.storage.get_questions([n for n, _ in best]))]
+        metrics.inc("quiz_search_queries_total")
+        return SearchResult(total, hits, partial and len(wanted) > 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexed": self.count,
+                "terms": len(self._postings),
+                "postings": sum(len(docs) for docs in self._postings.values()),
+            }
+
+
+def _merge(scores, postings, weight, norms, drop_missing=False):
+    """
+    Add one term's contribution to the questions already in ``scores``
+    (binary searches into its sorted postings); with ``drop_missing``,
+    questions without the term are dropped.
+    """
+    size = len(postings)
+    if len(scores) * 16 > size:  # about as many probes as postings: one linear pass instead
+        merged = {} if drop_missing else dict(scores)
+        get = scores.get
+        for posting in postings:
+            doc = posting >> TF_BITS
+            score = get(doc)
+            if score is not None:
+                tf = posting & TF_MAX
+                merged[doc] = score + weight * tf / (tf + norms[doc])
+        return merged
+    merged = {}
+    for doc, score in scores.items():
+        i = bisect_left(postings, doc << TF_BITS)
+        if i < size and postings[i] >> TF_BITS == doc:
+            tf = postings[i] & TF_MAX
+            merged[doc] = score + weight * tf / (tf + norms[doc])
+        elif not drop_missing:
+            merged[doc] = score
+    return merged
+
+
+def _best(scores, k):
+    """The ``k`` highest-scoring (position, score) pairs; ties go to the earlier question."""
+    top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+    return sorted(top, key=lambda item: (-item[1], item[0]))
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(storage=None):
+    """Return the process-wide search index over ``storage`` (default ``get_storage()``)."""
+    storage = storage or get_storage()
+    with _indexes_lock:
+        index = _indexes.get(storage)
+        if index is None:
+            index = _indexes[storage] = SearchIndex(storage)
+        return index
+
+
+def _questions_added(storage, positions):
+    index = _indexes.get(storage)
+    if index is not None:
+        index.add(positions)
+
+
+on_questions_added(_questions_added)
+
+
+def format_hit(hit):
+    """Human-readable lines for one Hit (CLI / server)."""
+    lines = [f"Q{hit.number}. {hit.text}   (score {hit.score:.2f})"]
+    lines += [f"   {letter}) {option}" for letter, option in zip(OPTIONS, hit.options)]
+    lines.append(f"   ✅ Correct Answer: {hit.answer}) {hit.options[OPTIONS.index(hit.answer)]}")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Search the question bank")
+    parser.add_argument("query", help="keywords; prefix a word with - to exclude it")
+    parser.add_argument("--page", type=int, default=1, help="1-based results page")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--any", action="store_true", help="match questions with any keyword")
+    parser.add_argument("--answer", choices=OPTIONS[:3], help="only questions keyed to this option")
+    parser.add_argument("--course", help="course bank (default: QUIZ_COURSE, else quest.bin)")
+    parser.add_argument("--json", action="store_true", help="one JSON object per hit")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = get_search_index(get_storage(args.course))
+    index.refresh()
+    built = time.perf_counter()
+    result = index.search(args.query, args.page - 1, args.page_size, args.any, args.answer)
+    if result.partial and not args.any:
+        print("ℹ️ No question contains every keyword; showing partial matches.", file=sys.stderr)
+    for hit in result.hits:
+        if args.json:
+            print(json.dumps(hit._asdict(), ensure_ascii=False))
+        else:
+            print("\n".join(format_hit(hit)))
+    pages = max(1, -(-result.total // args.page_size))
+    print(f"✅ {result.total} matching question(s), page {args.page} of {pages} "
+          f"(indexed {index.count} in {built - started:.2f}s, "
+          f"query {(time.perf_counter() - built) * 1000:.1f} ms).", file=sys.stderr)
@@ -0,0 +1,301 @@
+"""
+server.py
+
+Asyncio exam server: one process hosts many concurrent CLI exam takers.
+
+Each TCP connection runs the familiar login -> menu -> exam flow as its own
+coroutine over the shared storage backend and result sink, so thousands of
+students can sit an exam at once without a process (or thread) each.
+Everything that may block (password hashing, journal writes, bank and
+result reads) is pushed to the default thread pool so it never stalls the
+event loop.
+
+Line protocol (UTF-8, newline terminated):
+    server -> client   display lines; a line starting with "> " is a prompt
+                       and the server waits for exactly one reply line
+    client -> server   one line per prompt
+
+Run:
+    python server.py [--host 127.0.0.1] [--port 8765]
+    nc 127.0.0.1 8765          # or: python loadgen.py --clients 1000
+"""
+
+import argparse
+import asyncio
+import functools
+
+from courses import get_catalog
+from dedupe import format_matches, get_index
+from exam import ExamSession
+from grading import CORRECT, INCORRECT
+from login import RateLimited, get_auth, validate_password
+from proctor import format_remaining, get_proctor
+from result_sink import get_sink
+from storage import get_storage
+from userstore import UserExists
+
+HOST = "127.0.0.1"
+PORT = 8765
+PROMPT = "> "
+BOARD_SIZE = 10
+BANK_PREVIEW = 20
+SESSION_PREFIX = "@"
+
+
+class Disconnected(Exception):
+    """The client went away mid-session."""
+
+
+class Connection:
+    """Prompt/response helpers over one client stream."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        peer = writer.get_extra_info("peername")
+        self.peer = peer[0] if isinstance(peer, tuple) else peer  # rate-limiting source
+        self.storage = get_storage()  # the course picked after login
+
+    async def send(self, *lines):
+        self.writer.write("".join(line + "\n" for line in lines).encode("utf-8"))
+        await self.writer.drain()
+
+    async def ask(self, prompt):
+        await self.send(PROMPT + prompt)
+        line = await self.reader.readline()
+        if not line:
+            raise Disconnected()
+        return line.decode("utf-8", "replace").strip()
+
+
+async def in_thread(func, *args):
+    """Run a blocking call (hashing, fsync, storage reads) off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+# ----------------- Flow -----------------
+
+async def login_flow(conn):
+    """
+    Network version of login.login_user(); returns (mode, username).
+    A session token from an earlier login, entered as ``@<token>`` at the
+    username prompt, logs straight back in without a password.
+    """
+    auth = get_auth()
+    await conn.send("=== Welcome to the Quiz System Login ===")
+    while True:
+        username = await conn.ask("Enter username (no commas):")
+        if username.startswith(SESSION_PREFIX):
+            resumed = await in_thread(auth.resume, username[len(SESSION_PREFIX):])
+            if resumed:
+                await conn.send(f"✅ Welcome back, {resumed}.")
+                return "user", resumed
+            await conn.send("Session expired or unknown. Please log in.")
+            continue
+        if not username or "," in username:
+            await conn.send("Username cannot be empty or contain commas. Try again.")
+            continue
+        password = await conn.ask("Enter password (min 4 chars, no commas):")
+        is_valid, msg = validate_password(password)
+        if not is_valid:
+            await conn.send(f"Invalid password: {msg}")
+            continue
+
+        try:
+            token = await in_thread(auth.login, username, password, conn.peer)
+        except RateLimited as exc:
+            await conn.send(f"⛔ {exc}")
+            continue
+        if token:
+            await conn.send(f"✅ Logged in as registered user: {username}",
+                            f"🔑 Session: {SESSION_PREFIX}{token} (enter it as your username next time)")
+            return "user", username
+
+        await conn.send("❌ Username/password not found or incorrect.")
+        choice = (await conn.ask("Register this account? (y/n) or 'guest':")).lower()
+        if choice in ("y", "yes"):
+            try:
+                token = await in_thread(auth.register, username, password, conn.peer)
+            except RateLimited as exc:
+                await conn.send(f"⛔ {exc}")
+                continue
+            except UserExists:
+                await conn.send("That username already exists. Try again.")
+                continue
+            await conn.send(f"✅ Registered new user: {username} (you are now logged in).",
+                            f"🔑 Session: {SESSION_PREFIX}{token}")
+            return "user", username
+        if choice == "guest":
+            await conn.send(f"⚠️ Continuing in guest mode as guest_{username}.")
+            return "guest", f"guest_{username}"
+        await conn.send("Okay — let's try logging in again.")
+
+
+async def course_flow(conn):
+    """Pick the course bank for this connection when the host serves several."""
+    catalog = get_catalog()
+    if not len(catalog):
+        return
+    names = [c["course"] for c in catalog.courses()]
+    await conn.send("Courses: " + ", ".join(names))
+    while True:
+        course = await conn.ask("Course (Enter for the default bank):")
+        if not course or course in catalog:
+            conn.storage = await in_thread(get_storage, course)
+            return
+        await conn.send(f"⚠️ Unknown course {course!r}.")
+
+
+async def add_question_flow(conn):
+    question = await conn.ask("Enter the question:")
+    matches = await in_thread(get_index(conn.storage).check, question)
+    if matches:
+        await conn.send("⚠️ This looks like a question already in the bank:",
+                        *format_matches(matches))
+        if (await conn.ask("Add it anyway? (y/n):")).lower() != "y":
+            await conn.send("❌ Question not added.")
+            return
+    options = [await conn.ask(f"Enter option {letter}:") for letter in "abc"]
+    while True:
+        correct = (await conn.ask("Enter the correct option [a/b/c]:")).lower()
+        if correct in ("a", "b", "c"):
+            break
+        await conn.send("⚠️ Please choose only a, b, or c.")
+    await in_thread(conn.storage.add_question, question, *options, correct)
+    await conn.send("✅ Question added successfully!")
+
+
+def _bank_preview(storage):
+    return storage.count_questions(), storage.question_page(0, BANK_PREVIEW)
+
+
+async def view_questions_flow(conn):
+    total, preview = await in_thread(_bank_preview, conn.storage)
+    if not total:
+        await conn.send("⚠️ No questions found. Please add some first.")
+        return
+    for i, (q, opts) in enumerate(preview, start=1):
+        await conn.send(f"Q{i}. {q}", f"   a) {opts[0]}", f"   b) {opts[1]}",
+                        f"   c) {opts[2]}", f"   ✅ Correct Answer: {opts[3]}")
+    if total > BANK_PREVIEW:
+        await conn.send(f"... {total - BANK_PREVIEW} more question(s).")
+
+
+async def exam_flow(conn, username):
+    """Network version of student.start_exam(); returns the result dict or None."""
+    await conn.send("📢 Exam is starting! Correct +4, wrong -1, skip (d) 0.")
+    name = await conn.ask("Enter your name:")
+    proctor = get_proctor()
+    if proctor:  # timed: deadline scheduled, answers checkpointed, resumable
+        session = await in_thread(proctor.start, username, name, conn.storage)
+    else:
+        session = await in_thread(ExamSession.for_student, username, conn.storage)
+    if not len(session):
+        await conn.send("⚠️ No questions available. Ask a teacher to add some first.")
+        return None
+    if proctor:
+        answered = session.answered()
+        await conn.send((f"↩️ Resuming your exam: {answered} answer(s) restored. " if answered else "")
+                        + f"⏳ Time limit: {format_remaining(session.remaining())} left.")
+
+    # page-at-a-time reads: no prefetch thread per connection
+    timed_out = False
+    for page in range(session.pages):
+        for q in await in_thread(session.page, page):
+            if proctor and session.choice(q):
+                continue
+            await conn.send(f"{q.number}. {q.text}", f"   a) {q.options[0]}",
+                            f"   b) {q.options[1]}", f"   c) {q.options[2]}", "   d) Skip")
+            prompt = conn.ask("Your answer [a/b/c/d]:")
+            if proctor:
+                try:
+                    choice = await asyncio.wait_for(prompt, max(session.remaining(), 0.001))
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    break
+                outcome = await in_thread(session.answer, q, choice)
+                if outcome is None:
+                    timed_out = True
+                    break
+            else:
+                outcome = session.answer(q, await prompt)
+            if outcome == CORRECT:
+                await conn.send("✅ Correct!")
+            elif outcome == INCORRECT:
+                await conn.send("❌ Wrong!")
+            else:
+                await conn.send("➡️ Skipped")
+        if timed_out:
+            await conn.send("⏰ Time is up! Your exam was submitted with the answers given so far.")
+            break
+
+    if proctor:
+        result = await in_thread(session.submit)  # no-op if the scheduler already submitted
+    else:
+        result = await in_thread(session.result)
+        await in_thread(get_sink().submit, username, name, result["correct"],
+                        result["incorrect"], result["skipped"], result["score"],
+                        session.answer_records(result["score"]), session.course)
+    await conn.send(
+        f"📊 {name}: correct {result['correct']}, incorrect {result['incorrect']}, "
+        f"skipped {result['skipped']}, score {result['score']}")
+    return result
+
+
+async def board_flow(conn):
+    results = await in_thread(get_storage().top_results, BOARD_SIZE)
+    if not results:
+        await conn.send("⚠️ No results found yet!")
+        return
+    await conn.send("🏆 Performance Board")
+    for rank, row in enumerate(results, start=1):
+        await conn.send(f"{rank:<5}{row['Username']:<20}{row['Name']:<15}{row['Score']:<10}")
+
+
+async def handle(reader, writer):
+    conn = Connection(reader, writer)
+    try:
+        mode, username = await login_flow(conn)
+        await course_flow(conn)
+        while True:
+            await conn.send("Main Menu: 1) Add question 2) View bank 3) Take exam "
+                            "4) Performance board 5) Exit")
+            choice = await conn.ask("Choose an option (1-5):")
+            if choice == "1":
+                await add_question_flow(conn)
+            elif choice == "2":
+                await view_questions_flow(conn)
+            elif choice == "3":
+                await exam_flow(conn, username)
+            elif choice == "4":
+                await board_flow(conn)
+            elif choice == "5":
+                await conn.send("👋 Goodbye!")
+                break
+            else:
+                await conn.send("⚠️ Invalid choice. Please select 1-5.")
+    except (Disconnected, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT):
+    get_storage()
+    get_sink()
+    server = await asyncio.start_server(handle, host, port, limit=64 * 1024, backlog=4096)
+    print(f"🎓 Exam server listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asyncio exam server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped.")
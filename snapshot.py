@@ -0,0 +1,340 @@
+"""
+snapshot.py
+
+Published exams: a chosen set of questions compiled into one immutable,
+memory-mapped file, so starting an exam parses nothing.
+
+``publish`` reads the questions once and writes revision N+1 of the exam
+to ``exams/<name>/r<N+1>.snap`` (QUIZ_EXAMS_DIR overrides ``exams``), then
+points ``exams/<name>/CURRENT`` at it. Revisions are never modified, so a
+student who started on revision 3 keeps (and is graded against) revision 3
+after a teacher republishes.
+
+Layout (little-endian, sections 8-byte aligned):
+
+    header     b"QSNP" | uint16 format | uint16 flags | uint32 revision
+               | uint32 count | uint32 meta size | uint64 strings size
+    positions  uint32[count]        bank position of each question
+    offsets    uint32[4 * count + 1] string table offsets (question, a, b, c)
+    key        uint8[count]         correct option, 1-3 = a-c (grading.py codes)
+    strings    UTF-8 text, concatenated
+    meta       JSON: name, title, course, bank size, publish time
+
+Opening a snapshot is an mmap plus a header read; the arrays are views
+straight into the mapping. Every process that opens the same revision
+shares one page-cached copy, and within a process ``get_snapshot`` hands
+all takers the same object. A question is decoded only when it is shown,
+and grading reads the packed key with a single ``bytes.translate``.
+
+ExamSnapshot offers the question half of the Storage interface, so an
+ExamSession (and per-student draws from assembly.py) run on it unchanged.
+QUIZ_EXAM_SNAPSHOT=<name> makes ``ExamSession.for_student`` use the current
+revision of that exam.
+
+Run:
+    python snapshot.py publish midterm [--questions 1-40,55] [--course bio101] [--title "Midterm"]
+    python snapshot.py list
+    QUIZ_EXAM_SNAPSHOT=midterm python main.py
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+
+import filelock
+import metrics
+from assembly import PERMUTATIONS
+from grading import OPTIONS
+from storage import get_storage
+
+EXAMS_DIR = "exams"
+CURRENT_FILE = "CURRENT"
+MAGIC = b"QSNP"
+FORMAT = 1
+HEADER = struct.Struct("<4sHHIIIQ")
+EXAM_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+READ_CHUNK = 1000   # questions per storage read while publishing
+
+_LETTERS = bytes.maketrans(b"\x01\x02\x03", b"abc")
+# per option order: original key letter -> the letter it is shown under
+_SHOWN = [bytes.maketrans(b"abc", bytes(ord(OPTIONS[perm.index(i)]) for i in range(3)))
+          for perm in PERMUTATIONS]
+
+
+def exams_dir():
+    return os.environ.get("QUIZ_EXAMS_DIR", EXAMS_DIR)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _u32(buf):
+    """uint32 view of little-endian bytes (a copy only on big-endian hosts)."""
+    if sys.byteorder == "little":
+        return buf.cast("I")
+    values = array("I", bytes(buf))
+    values.byteswap()
+    return values
+
+
+def _sections(count, strings_size):
+    """Byte offsets of positions, offsets, key, strings and meta."""
+    positions = _align(HEADER.size)
+    offsets = _align(positions + 4 * count)
+    key = _align(offsets + 4 * (4 * count + 1))
+    strings = _align(key + count)
+    return positions, offsets, key, strings, _align(strings + strings_size)
+
+
+# ----------------- Reading -----------------
+
+class ExamSnapshot:
+    """A read-only published exam, memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < HEADER.size:
+                raise ValueError(f"{path} is not an exam snapshot.")
+            magic, fmt, _, self.revision, count, meta_size, strings_size = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an exam snapshot.")
+            if fmt != FORMAT:
+                raise ValueError(f"{path}: unsupported snapshot format {fmt}.")
+            p, o, k, s, m = _sections(count, strings_size)
+            if len(self._map) < m + meta_size:
+                raise ValueError(f"{path} is truncated.")
+        except ValueError:
+            self._map.close()
+            raise
+        view = memoryview(self._map)
+        self.bank_positions = _u32(view[p:p + 4 * count])
+        self._offsets = _u32(view[o:o + 4 * (4 * count + 1)])
+        self.key = view[k:k + count]
+        self._strings = s
+        self.meta = json.loads(bytes(view[m:m + meta_size]).decode("utf-8"))
+        self.name = self.meta["name"]
+
+    @property
+    def ref(self):
+        """What a grader needs to find this exact revision again."""
+        return {"name": self.name, "revision": self.revision}
+
+    @property
+    def course(self):
+        """The course whose bank the questions came from (None: the default bank)."""
+        return self.meta.get("course") or None
+
+    def _text(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._map[self._strings + start:self._strings + end].decode("utf-8")
+
+    # ---- the question half of storage.Storage ----
+
+    def count_questions(self):
+        return len(self.key)
+
+    def get_question(self, n):
+        if n < 0:
+            n += len(self.key)
+        if not 0 <= n < len(self.key):
+            raise IndexError("question index out of range")
+        first = 4 * n
+        return self._text(first), [self._text(first + 1), self._text(first + 2),
+                                   self._text(first + 3), OPTIONS[self.key[n] - 1]]
+
+    def get_questions(self, positions):
+        return [self.get_question(n) for n in positions]
+
+    def question_page(self, start, size):
+        stop = min(start + size, len(self.key))
+        return [self.get_question(n) for n in range(max(start, 0), stop)]
+
+    def iter_questions(self, page_size=256):
+        return (self.get_question(n) for n in range(len(self.key)))
+
+    # ---- packed key ----
+
+    def key_letters(self, positions=None, orders=None):
+        """
+        Key letters as ASCII bytes, straight from the packed key: of every
+        question, or of ``positions`` with options shown in ``orders``.
+        """
+        if positions is None:
+            return bytes(self.key).translate(_LETTERS)
+        letters = bytes(self.key[n] for n in positions).translate(_LETTERS)
+        if orders is None:
+            return letters
+        return bytes(_SHOWN[order][letter] for letter, order in zip(letters, orders))
+
+    def close(self):
+        for view in (self.bank_positions, self._offsets, self.key):
+            if isinstance(view, memoryview):
+                view.release()
+        self._map.close()
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def _exam_dir(name):
+    return os.path.join(exams_dir(), name)
+
+
+def current_revision(name):
+    """The published revision of ``name`` (None if it was never published)."""
+    try:
+        with open(os.path.join(_exam_dir(name), CURRENT_FILE), encoding="ascii") as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_path(name, revision):
+    return os.path.join(_exam_dir(name), f"r{revision}.snap")
+
+
+def get_snapshot(name=None, revision=None):
+    """
+    The process-wide ExamSnapshot of ``name`` (default QUIZ_EXAM_SNAPSHOT)
+    at ``revision`` (default the current one); None when no exam is named.
+    """
+    name = name or os.environ.get("QUIZ_EXAM_SNAPSHOT")
+    if not name:
+        return None
+    if not EXAM_NAME.match(name):
+        raise ValueError(f"Invalid exam name {name!r}.")
+    if revision is None:
+        revision = current_revision(name)
+        if revision is None:
+            raise ValueError(f"Exam {name!r} has not been published: python snapshot.py publish {name}")
+    key = (os.path.abspath(exams_dir()), name, int(revision))
+    with _snapshots_lock:
+        snap = _snapshots.get(key)
+        if snap is None:
+            snap = _snapshots[key] = ExamSnapshot(snapshot_path(name, revision))
+            metrics.inc("quiz_snapshot_opens_total")
+        return snap
+
+
+# ----------------- Publishing -----------------
+
+def parse_numbers(spec, total):
+    """``"1-40,55"`` (1-based, inclusive) -> 0-based positions; None/"" means all."""
+    if not spec:
+        return list(range(total))
+    positions = []
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        first, last = int(first), int(last or first)
+        if not 1 <= first <= last <= total:
+            raise ValueError(f"Question range {part.strip()!r} is outside 1-{total}.")
+        positions.extend(range(first - 1, last))
+    return positions
+
+
+@metrics.timed("quiz_snapshot_publish_seconds")
+def publish(name, positions=None, storage=None, title=None):
+    """
+    Compile the questions at bank ``positions`` (default all) into the
+    next revision of exam ``name``; returns the new ExamSnapshot.
+    """
+    if not EXAM_NAME.match(name):
+        raise ValueError("Exam names are letters, digits, '_', '.' and '-' (max 64).")
+    storage = storage or get_storage()
+    total = storage.count_questions()
+    positions = list(range(total)) if positions is None else list(positions)
+    if not positions:
+        raise ValueError("An exam needs at least one question.")
+
+    offsets, key, strings = array("I", [0]), bytearray(), bytearray()
+    for first in range(0, len(positions), READ_CHUNK):
+        for question, opts in storage.get_questions(positions[first:first + READ_CHUNK]):
+            for text in (question, *opts[:3]):
+                strings += text.encode("utf-8")
+                offsets.append(len(strings))  # OverflowError past 4 GiB of text
+            key.append(OPTIONS.index(opts[3]) + 1)
+    bank_positions = array("I", positions)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        bank_positions.byteswap()
+
+    directory = _exam_dir(name)
+    os.makedirs(directory, exist_ok=True)
+    current = os.path.join(directory, CURRENT_FILE)
+    with filelock.locked(current):
+        revision = (current_revision(name) or 0) + 1
+        meta = json.dumps({
+            "name": name, "title": title or name, "revision": revision,
+            "course": getattr(storage, "course", None) or None,
+            "bank_size": total, "published": time.time(),
+        }, ensure_ascii=False).encode("utf-8")
+        sections = _sections(len(key), len(strings))
+        parts = [(0, HEADER.pack(MAGIC, FORMAT, 0, revision, len(key), len(meta), len(strings))),
+                 (sections[0], bank_positions.tobytes()), (sections[1], offsets.tobytes()),
+                 (sections[2], bytes(key)), (sections[3], bytes(strings)), (sections[4], meta)]
+        with filelock.atomic_write(snapshot_path(name, revision), "wb") as f:
+            for start, data in parts:
+                f.write(b"\0" * (start - f.tell()))
+                f.write(data)
+        with filelock.atomic_write(current, "w", encoding="ascii") as f:
+            f.write(f"{revision}\n")
+    metrics.inc("quiz_snapshot_published_total")
+    return get_snapshot(name, revision)
+
+
+def list_exams():
+    """(name, current revision, meta) of every published exam."""
+    root = exams_dir()
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else ():
+        revision = current_revision(name)
+        if revision is not None:
+            yield name, revision, get_snapshot(name, revision).meta
+
+
+# ----------------- Command line -----------------
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Publish exams as precompiled snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pub = sub.add_parser("publish", help="compile questions into a new exam revision")
+    pub.add_argument("name")
+    pub.add_argument("--questions", help="1-based numbers/ranges, e.g. 1-40,55 (default: all)")
+    pub.add_argument("--course", help="course bank (default: QUIZ_COURSE, else quest.bin)")
+    pub.add_argument("--title")
+    sub.add_parser("list", help="list published exams")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "publish":
+            started = time.perf_counter()
+            storage = get_storage(args.course)
+            positions = parse_numbers(args.questions, storage.count_questions())
+            snap = publish(args.name, positions, storage, args.title)
+            print(f"✅ Published {snap.name} revision {snap.revision}: "
+                  f"{snap.count_questions()} questions, {os.path.getsize(snap.path) / 1024:.0f} KiB "
+                  f"({time.perf_counter() - started:.2f}s).")
+        else:
+            for name, revision, meta in list_exams():
+                print(f"{name:<20} r{revision:<5}{meta['title']}"
+                      + (f"  [{meta['course']}]" if meta.get("course") else ""))
+    except ValueError as exc:
+        print(f"❌ {exc}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
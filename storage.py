@@ -0,0 +1,571 @@
+"""
+storage.py
+
+Repository interface over everything the Quiz System persists: the
+question bank, registered users and exam results.
+
+Two backends are provided:
+
+    FileStorage     the original files (indexed quest.bin, data/user.csv,
+                    results.csv); the default
+    SQLiteStorage   one SQLite database in WAL mode with indexed tables,
+                    safe for concurrent readers and writers
+
+The backend is picked once per process from the environment:
+
+    QUIZ_STORAGE=file               (default)
+    QUIZ_STORAGE=sqlite             database at QUIZ_DB (default data/quiz.db)
+
+``get_storage(course)`` (or QUIZ_COURSE) narrows it to one course: the
+questions come from that course's own bank, users and results stay shared
+(see courses.py).
+
+Every module (teacher, student, login, util, app) goes through
+``get_storage()`` instead of opening data files itself. Indexes kept over
+a bank (search.py) register with ``on_questions_added`` to hear about
+questions appended in this process as soon as they are written.
+
+Importing existing files into a database:
+    python storage.py import [--db data/quiz.db] [--questions quest.bin]
+                             [--users data/user.csv] [--results results.csv]
+"""
+
+import csv
+import io
+import os
+import threading
+
+import filelock
+import metrics
+from archive import read_live
+from leaderboard import get_leaderboard
+from qbank import QUESTIONS_FILE, iter_legacy, is_legacy, normalize_answer, shared_cache
+from userstore import USER_CSV, UserExists, get_store
+
+RESULTS_FILE = "results.csv"
+RESULTS_HEADER = ["Username", "Name", "Correct", "Incorrect", "Skipped", "Score"]
+DEFAULT_DB = os.path.join("data", "quiz.db")
+
+
+def result_row(username, name, correct, incorrect, skipped, score):
+    """Build the dict shape every backend returns for one result."""
+    return {
+        "Username": username,
+        "Name": name,
+        "Correct": int(correct),
+        "Incorrect": int(incorrect),
+        "Skipped": int(skipped),
+        "Score": int(score),
+    }
+
+
+# ----------------- Hooks -----------------
+
+_added_hooks = []
+
+
+def on_questions_added(hook):
+    """Call ``hook(storage, positions)`` after this process appends questions to a bank."""
+    _added_hooks.append(hook)
+
+
+def questions_added(storage, positions):
+    """Notify the hooks of the positions just appended to ``storage``."""
+    for hook in _added_hooks:
+        hook(storage, positions)
+
+
+# ----------------- Interface -----------------
+
+class Storage:
+    """
+    Base class for storage backends.
+
+    Questions are addressed by a 0-based position and returned as
+    ``(question, [a, b, c, answer_letter])``. Users map a username to a
+    stored password hash (see userstore.py). Results are dicts with the
+    RESULTS_HEADER keys.
+    """
+
+    # ---- questions ----
+
+    def add_question(self, question, a, b, c, ans):
+        """Append one question; returns its position."""
+        raise NotImplementedError
+
+    def add_questions(self, questions):
+        """Add many (question, opts) pairs in one batched write; returns their positions."""
+        return [self.add_question(q, *opts) for q, opts in questions]
+
+    def count_questions(self):
+        raise NotImplementedError
+
+    def get_question(self, n):
+        raise NotImplementedError
+
+    def question_page(self, start, size):
+        raise NotImplementedError
+
+    def get_questions(self, positions):
+        """Questions at arbitrary 0-based ``positions``, in the given order."""
+        return [self.get_question(n) for n in positions]
+
+    def iter_questions(self, page_size=256):
+        start = 0
+        while True:
+            page = self.question_page(start, page_size)
+            if not page:
+                return
+            yield from page
+            start += len(page)
+
+    # ---- users ----
+
+    def get_user(self, username):
+        raise NotImplementedError
+
+    def set_user(self, username, stored_hash, replace=False):
+        """
+        Store a user's password hash. Raises userstore.UserExists if the
+        user is registered, unless ``replace`` (rehashing on login).
+        """
+        raise NotImplementedError
+
+    def list_users(self):
+        """Return all (username, stored_hash) pairs."""
+        raise NotImplementedError
+
+    def count_users(self):
+        raise NotImplementedError
+
+    # ---- results ----
+
+    def save_result(self, username, name, correct, incorrect, skipped, score):
+        self.save_results([(username, name, correct, incorrect, skipped, score)])
+
+    def save_results(self, rows):
+        raise NotImplementedError
+
+    def top_results(self, limit=None, offset=0):
+        """Return results ordered by score (highest first), paginated."""
+        raise NotImplementedError
+
+    def count_results(self):
+        raise NotImplementedError
+
+    def rank_of(self, username):
+        """1-based rank of the user's best result (None if they have none)."""
+        raise NotImplementedError
+
+    def results_for(self, username):
+        raise NotImplementedError
+
+    # ---- misc ----
+
+    def stats(self):
+        """Backend-specific counters (e.g. cache hits); empty by default."""
+        return {}
+
+    def close(self):
+        pass
+
+
+# ----------------- File backend -----------------
+
+def _cut_torn_line(path, block=4096):
+    """Truncate ``path`` after its last newline; returns the new size (0 if missing)."""
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end:
+            start = max(end - block, 0)
+            f.seek(start)
+            cut = f.read(end - start).rfind(b"\n")
+            if cut >= 0:
+                end = start + cut + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+        return end
+
+
+class FileStorage(Storage):
+    """The original file layout, via the indexed bank and the user store."""
+
+    def __init__(self, questions_file=QUESTIONS_FILE, user_csv=USER_CSV,
+                 results_file=RESULTS_FILE):
+        self.bank = shared_cache(questions_file)
+        self.users = get_store(user_csv)
+        self.results_file = results_file
+        self.board = get_leaderboard(results_file)
+
+    def add_question(self, question, a, b, c, ans):
+        index = self.bank.append(question, a, b, c, ans)
+        questions_added(self, [index])
+        return index
+
+    @metrics.timed("quiz_storage_add_questions_seconds")
+    def add_questions(self, questions):
+        indexes = self.bank.extend(questions)
+        questions_added(self, indexes)
+        return indexes
+
+    def count_questions(self):
+        return len(self.bank)
+
+    def get_question(self, n):
+        return self.bank.get(n)
+
+    @metrics.timed("quiz_storage_get_questions_seconds")
+    def get_questions(self, positions):
+        return self.bank.get_many(positions)
+
+    @metrics.timed("quiz_storage_question_page_seconds")
+    def question_page(self, start, size):
+        return self.bank.page(start, size)
+
+    @metrics.timed("quiz_storage_get_user_seconds")
+    def get_user(self, username):
+        return self.users.get(username)
+
+    def set_user(self, username, stored_hash, replace=False):
+        self.users.set(username, stored_hash, replace)
+
+    def list_users(self):
+        return self.users.items()
+
+    def count_users(self):
+        return len(self.users)
+
+    @metrics.timed("quiz_storage_save_results_seconds")
+    def save_results(self, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        # one locked append per batch: rows from other processes never interleave
+        with filelock.locked(self.results_file):
+            # a writer died mid-row: cut it off, or the new rows would be glued onto it
+            if not _cut_torn_line(self.results_file):
+                writer.writerow(RESULTS_HEADER)
+            writer.writerows(rows)
+            filelock.append(self.results_file, buf.getvalue().encode("utf-8"))
+
+    def _read_results(self, username=None):
+        """Archived results, then the live CSV's (optionally one user's only)."""
+        archive = self.board.archive
+        if username is not None:
+            rows = archive.results_for(username) if len(archive) else []
+        else:
+            rows = archive.rows(range(len(archive))) if len(archive) else []
+        for _, header, chunk in read_live(self.results_file,
+                                          archive.folded_bytes(self.results_file)):
+            for r in map(dict, map(zip, [header] * len(chunk), chunk)):
+                # results written by the old Streamlit app had no Username column
+                row = result_row(r.get("Username") or r["Name"], r["Name"], r["Correct"],
+                                 r["Incorrect"], r["Skipped"], r["Score"])
+                if username is None or row["Username"] == username:
+                    rows.append(row)
+        return rows
+
+    @metrics.timed("quiz_storage_top_results_seconds")
+    def top_results(self, limit=None, offset=0):
+        return self.board.top(limit, offset)
+
+    def count_results(self):
+        return len(self.board)
+
+    def rank_of(self, username):
+        return self.board.rank_of(username)
+
+    def results_for(self, username):
+        return self._read_results(username)
+
+    def stats(self):
+        return {**self.bank.stats(), "locks": filelock.stats()}
+
+
+# ----------------- SQLite backend -----------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id        INTEGER PRIMARY KEY,
+    question  TEXT NOT NULL,
+    a         TEXT NOT NULL,
+    b         TEXT NOT NULL,
+    c         TEXT NOT NULL,
+    answer    TEXT NOT NULL CHECK (answer IN ('a', 'b', 'c'))
+);
+CREATE TABLE IF NOT EXISTS users (
+    username  TEXT PRIMARY KEY,
+    password  TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    id        INTEGER PRIMARY KEY,
+    username  TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    correct   INTEGER NOT NULL,
+    incorrect INTEGER NOT NULL,
+    skipped   INTEGER NOT NULL,
+    score     INTEGER NOT NULL,
+    created   REAL NOT NULL DEFAULT (julianday('now'))
+);
+CREATE INDEX IF NOT EXISTS results_by_score ON results (score DESC, id);
+CREATE INDEX IF NOT EXISTS results_by_user ON results (username);
+"""
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite backend. Each thread gets its own connection; WAL mode lets
+    readers proceed while a submission is being written.
+
+    Question positions map to ``id - 1``; questions are never deleted, so
+    lookups by position are primary-key seeks.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3  # only the SQLite backend pays for the import
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def add_question(self, question, a, b, c, ans):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO questions (question, a, b, c, answer) VALUES (?, ?, ?, ?, ?)",
+                (question, a, b, c, normalize_answer([a, b, c, ans])),
+            )
+        questions_added(self, [cur.lastrowid - 1])
+        return cur.lastrowid - 1
+
+    @metrics.timed("quiz_storage_add_questions_seconds")
+    def add_questions(self, questions):
+        """Insert many (question, opts) pairs in one transaction; returns their positions."""
+        rows = [(q, o[0], o[1], o[2], normalize_answer(o)) for q, o in questions]
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO questions (question, a, b, c, answer) VALUES (?, ?, ?, ?, ?)", rows)
+            # still inside the write transaction: the new ids are the last len(rows)
+            (last,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM questions").fetchone()
+        positions = list(range(last - len(rows), last))
+        questions_added(self, positions)
+        return positions
+
+    def count_questions(self):
+        (count,) = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM questions").fetchone()
+        return count
+
+    def get_question(self, n):
+        if n < 0:
+            n += self.count_questions()
+        row = self._conn().execute(
+            "SELECT question, a, b, c, answer FROM questions WHERE id = ?", (n + 1,)
+        ).fetchone()
+        if row is None:
+            raise IndexError("question index out of range")
+        return row[0], list(row[1:])
+
+    @metrics.timed("quiz_storage_get_questions_seconds")
+    def get_questions(self, positions):
+        positions = list(positions)
+        found = {}
+        for first in range(0, len(positions), 500):  # stay under SQLite's parameter limit
+            ids = [n + 1 for n in positions[first:first + 500]]
+            marks = ",".join("?" * len(ids))
+            for row in self._conn().execute(
+                f"SELECT id, question, a, b, c, answer FROM questions WHERE id IN ({marks})", ids
+            ):
+                found[row[0] - 1] = (row[1], list(row[2:]))
+        try:
+            return [found[n] for n in positions]
+        except KeyError:
+            raise IndexError("question index out of range") from None
+
+    @metrics.timed("quiz_storage_question_page_seconds")
+    def question_page(self, start, size):
+        rows = self._conn().execute(
+            "SELECT question, a, b, c, answer FROM questions WHERE id > ? ORDER BY id LIMIT ?",
+            (max(start, 0), size),
+        ).fetchall()
+        return [(r[0], list(r[1:])) for r in rows]
+
+    @metrics.timed("quiz_storage_get_user_seconds")
+    def get_user(self, username):
+        row = self._conn().execute(
+            "SELECT password FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_user(self, username, stored_hash, replace=False):
+        import sqlite3
+
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        try:
+            with self._conn() as conn:
+                conn.execute(f"{verb} INTO users (username, password) VALUES (?, ?)",
+                             (username, stored_hash))
+        except sqlite3.IntegrityError:
+            raise UserExists(username) from None
+
+    def set_users(self, rows):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", rows
+            )
+
+    def list_users(self):
+        return self._conn().execute("SELECT username, password FROM users").fetchall()
+
+    def count_users(self):
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    @metrics.timed("quiz_storage_save_results_seconds")
+    def save_results(self, rows):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO results (username, name, correct, incorrect, skipped, score) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    @metrics.timed("quiz_storage_top_results_seconds")
+    def top_results(self, limit=None, offset=0):
+        rows = self._conn().execute(
+            "SELECT username, name, correct, incorrect, skipped, score FROM results "
+            "ORDER BY score DESC, id LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        ).fetchall()
+        return [result_row(*r) for r in rows]
+
+    def count_results(self):
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def rank_of(self, username):
+        conn = self._conn()
+        (best,) = conn.execute(
+            "SELECT MAX(score) FROM results WHERE username = ?", (username,)
+        ).fetchone()
+        if best is None:
+            return None
+        (higher,) = conn.execute(
+            "SELECT COUNT(*) FROM results WHERE score > ?", (best,)
+        ).fetchone()
+        return higher + 1
+
+    def results_for(self, username):
+        rows = self._conn().execute(
+            "SELECT username, name, correct, incorrect, skipped, score FROM results "
+            "WHERE username = ? ORDER BY id",
+            (username,),
+        ).fetchall()
+        return [result_row(*r) for r in rows]
+
+
+# ----------------- Selection -----------------
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage(course=None):
+    """
+    Return the process-wide storage backend chosen by QUIZ_STORAGE, or the
+    view of one course's bank (``course``, default QUIZ_COURSE; "" means
+    the default bank).
+    """
+    global _storage
+    course = os.environ.get("QUIZ_COURSE", "") if course is None else course
+    if course:
+        from courses import course_storage  # courses.py builds on this module
+        return course_storage(course)
+    with _storage_lock:
+        if _storage is None:
+            kind = os.environ.get("QUIZ_STORAGE", "file").lower()
+            if kind == "sqlite":
+                _storage = SQLiteStorage(os.environ.get("QUIZ_DB", DEFAULT_DB))
+            elif kind == "file":
+                _storage = FileStorage()
+            else:
+                raise ValueError(f"Unknown QUIZ_STORAGE backend: {kind!r}")
+        return _storage
+
+
+def set_storage(storage):
+    """Install ``storage`` as the process-wide backend (tools, benchmarks)."""
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+
+# ----------------- Importer -----------------
+
+def import_files(target, questions_file=QUESTIONS_FILE, user_csv=USER_CSV,
+                 results_file=RESULTS_FILE):
+    """
+    Copy the existing file-based data into ``target`` (a SQLiteStorage).
+    Missing files are skipped. Returns a dict of row counts imported.
+    """
+    counts = {"questions": 0, "users": 0, "results": 0}
+
+    if os.path.exists(questions_file):
+        if is_legacy(questions_file):
+            questions = list(iter_legacy(questions_file))
+        else:
+            questions = list(FileStorage(questions_file, user_csv, results_file).iter_questions())
+        target.add_questions(questions)
+        counts["questions"] = len(questions)
+
+    if os.path.exists(user_csv):
+        users = get_store(user_csv).items()
+        target.set_users(users)
+        counts["users"] = len(users)
+
+    if os.path.exists(results_file):
+        source = FileStorage(questions_file, user_csv, results_file)
+        rows = [
+            (r["Username"], r["Name"], r["Correct"], r["Incorrect"], r["Skipped"], r["Score"])
+            for r in source._read_results()
+        ]
+        target.save_results(rows)
+        counts["results"] = len(rows)
+
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quiz System storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import quest.bin / user.csv / results.csv into SQLite")
+    imp.add_argument("--db", default=os.environ.get("QUIZ_DB", DEFAULT_DB))
+    imp.add_argument("--questions", default=QUESTIONS_FILE)
+    imp.add_argument("--users", default=USER_CSV)
+    imp.add_argument("--results", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    db = SQLiteStorage(args.db)
+    done = import_files(db, args.questions, args.users, args.results)
+    print(f"✅ Imported {done['questions']} questions, {done['users']} users "
+          f"and {done['results']} results into {args.db}.")
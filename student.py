@@ -1,8 +1,8 @@
-import pickle
+from exam import ExamSession
+from grading import CORRECT, INCORRECT
+from proctor import format_remaining, get_proctor
 from util import slow_print, banner, save_result
 
-QUESTIONS_FILE = "quest.bin"
-
 def start_exam(username):
     """Runs the student exam loop."""
     banner("Student Exam Interface")
@@ -15,56 +15,54 @@ def start_exam(username):
     print("-" * 50)
 
     name = input("Enter your name: ").strip()
-    correct = incorrect = skipped = score = 0
-    q_number = 1
 
-    try:
-        with open(QUESTIONS_FILE, "rb") as f:
-            while True:
-                try:
-                    data = pickle.load(f)
-                    for q, opts in data.items():
-                        print(f"\n{q_number}. {q}")
-                        print(f"   a) {opts[0]}")
-                        print(f"   b) {opts[1]}")
-                        print(f"   c) {opts[2]}")
-                        print("   d) Skip")
+    # timed exams (QUIZ_EXAM_MINUTES) run under the proctor: checkpointed, resumable
+    proctor = get_proctor()
+    session = proctor.start(username, name) if proctor else ExamSession.for_student(username)
+    if not len(session):
+        print("⚠️ No questions available. Ask a teacher to add some first.")
+        return None
+    if proctor:
+        answered = session.answered()
+        if answered:
+            print(f"↩️ Resuming your exam: {answered} answer(s) restored.")
+        print(f"⏳ Time limit: {format_remaining(session.remaining())} left.")
+
+    # questions stream in (prefetched) while the student answers
+    for q in session:
+        if proctor and session.choice(q):
+            continue  # answered before the interruption
+        if proctor:
+            print(f"\n⏳ {format_remaining(session.remaining())} left")
+        print(f"\n{q.number}. {q.text}")
+        print(f"   a) {q.options[0]}")
+        print(f"   b) {q.options[1]}")
+        print(f"   c) {q.options[2]}")
+        print("   d) Skip")
 
-                        choice = input("Your answer [a/b/c/d]: ").lower().strip()
-                        correct_answer = opts[3]
+        choice = input("Your answer [a/b/c/d]: ").lower().strip()
+        outcome = session.answer(q, choice)
 
-                        if choice == "a" and opts[0] == correct_answer:
-                            print("✅ Correct!")
-                            correct += 1
-                            score += 4
-                        elif choice == "b" and opts[1] == correct_answer:
-                            print("✅ Correct!")
-                            correct += 1
-                            score += 4
-                        elif choice == "c" and opts[2] == correct_answer:
-                            print("✅ Correct!")
-                            correct += 1
-                            score += 4
-                        elif choice == "d":
-                            print("➡️ Skipped")
-                            skipped += 1
-                        elif choice in ("a", "b", "c"):
-                            print("❌ Wrong!")
-                            incorrect += 1
-                            score -= 1
-                        else:
-                            print("⚠️ Invalid input! Question skipped.")
-                            skipped += 1
+        if proctor and session.submitted:
+            print("⏰ Time is up! Your exam was submitted with the answers given so far.")
+            break
+        if outcome == CORRECT:
+            print("✅ Correct!")
+        elif outcome == INCORRECT:
+            print("❌ Wrong!")
+        elif choice == "d":
+            print("➡️ Skipped")
+        else:
+            print("⚠️ Invalid input! Question skipped.")
 
-                        q_number += 1
-                except EOFError:
-                    break
-    except FileNotFoundError:
-        print("⚠️ No questions available. Ask a teacher to add some first.")
-        return None
+    graded = session.submit() if proctor else session.result()
+    correct, incorrect = graded["correct"], graded["incorrect"]
+    skipped, score = graded["skipped"], graded["score"]
 
-    # Save results (for performance board)
-    save_result(username, name, correct, incorrect, skipped, score)
+    # Save results (for performance board); the proctor saved a timed exam already
+    if not proctor:
+        save_result(username, name, correct, incorrect, skipped, score,
+                    session.answer_records(score), session.course)
 
     return {
         "name": name,
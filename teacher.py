@@ -1,14 +1,24 @@
-import pickle
+from dedupe import format_matches, get_index
+from search import PAGE_SIZE, format_hit, get_search_index
+from storage import get_storage
 from util import slow_print, banner
 
-QUESTIONS_FILE = "quest.bin"
-
 def add_question():
     """Allows a teacher to add new questions to the question bank."""
     banner("Teacher Interface - Add Question")
     slow_print("Welcome, Teacher! Add your questions to the quiz.", 0.01)
 
     question = input("Enter the question: ").strip()
+
+    matches = get_index().check(question)
+    if matches:
+        print("⚠️ This looks like a question already in the bank:")
+        for line in format_matches(matches):
+            print(line)
+        if input("Add it anyway? (y/n): ").strip().lower() != "y":
+            print("❌ Question not added.")
+            return
+
     option_a = input("Enter option a: ").strip()
     option_b = input("Enter option b: ").strip()
     option_c = input("Enter option c: ").strip()
@@ -20,35 +30,53 @@ def add_question():
         else:
             print("⚠️ Please choose only a, b, or c.")
 
-    # prepare structure: [opt_a, opt_b, opt_c, correct_letter]
-    q_data = {question: [option_a, option_b, option_c, correct]}
-
-    # save to binary file
-    with open(QUESTIONS_FILE, "ab") as f:
-        pickle.dump(q_data, f)
+    # save to the question bank: [opt_a, opt_b, opt_c, correct_letter]
+    get_storage().add_question(question, option_a, option_b, option_c, correct)
 
     print("✅ Question added successfully!")
 
 def view_questions():
     """Allows teacher to view all questions in the question bank."""
     banner("📚 Teacher Interface - Question Bank")
-    try:
-        with open(QUESTIONS_FILE, "rb") as f:
-            i = 1
-            while True:
-                try:
-                    data = pickle.load(f)
-                    for q, opts in data.items():
-                        print(f"\nQ{i}. {q}")
-                        print(f"   a) {opts[0]}")
-                        print(f"   b) {opts[1]}")
-                        print(f"   c) {opts[2]}")
-                        correct = opts[3]
-                        correct_text = opts[ord(correct) - ord("a")]
-                        print(f"   ✅ Correct Answer: {correct}) {correct_text}")
-                        print("-" * 50)
-                        i += 1
-                except EOFError:
-                    break
-    except FileNotFoundError:
+    storage = get_storage()
+    if not storage.count_questions():
         print("⚠️ No questions found. Please add some first.")
+        return
+    for i, (q, opts) in enumerate(storage.iter_questions(), start=1):
+        print(f"\nQ{i}. {q}")
+        print(f"   a) {opts[0]}")
+        print(f"   b) {opts[1]}")
+        print(f"   c) {opts[2]}")
+        correct = opts[3]
+        correct_text = opts[ord(correct) - ord("a")]
+        print(f"   ✅ Correct Answer: {correct}) {correct_text}")
+        print("-" * 50)
+
+def search_questions():
+    """Ranked keyword search over the question bank, a page at a time."""
+    banner("🔎 Teacher Interface - Search Questions")
+    query = input("Keywords (prefix a word with - to exclude it): ").strip()
+    if not query:
+        return
+    index = get_search_index()
+    page = 0
+    while True:
+        result = index.search(query, page)
+        if not result.total:
+            print("⚠️ No matching questions.")
+            return
+        if result.partial:
+            print("ℹ️ No question contains every keyword; showing partial matches.")
+        pages = (result.total + PAGE_SIZE - 1) // PAGE_SIZE
+        for hit in result.hits:
+            print()
+            print("\n".join(format_hit(hit)))
+        print("-" * 50)
+        print(f"{result.total} matching question(s), page {page + 1} of {pages}")
+        step = input("[n]ext, [p]revious or Enter to finish: ").strip().lower()
+        if step == "n" and page + 1 < pages:
+            page += 1
+        elif step == "p" and page > 0:
+            page -= 1
+        elif step not in ("n", "p"):
+            return
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import login  # noqa: E402
+import result_sink  # noqa: E402
+import userstore  # noqa: E402
+from result_sink import ResultSink  # noqa: E402
+from storage import FileStorage, SQLiteStorage, set_storage  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in an empty directory, with no QUIZ_* configuration."""
+    monkeypatch.chdir(tmp_path)
+    for name in [n for n in os.environ if n.startswith("QUIZ_")]:
+        monkeypatch.delenv(name)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashing():
+    """PBKDF2 at a test-friendly cost; the production cost only slows the suite."""
+    iterations = userstore.get_hash_iterations()
+    userstore.set_hash_iterations(1000)
+    yield
+    userstore.set_hash_iterations(iterations)
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def storage(request, tmp_path, monkeypatch):
+    """Each storage backend in turn, installed as the process-wide one."""
+    if request.param == "file":
+        backend = FileStorage(str(tmp_path / "quest.bin"), str(tmp_path / "user.csv"),
+                              str(tmp_path / "results.csv"))
+    else:
+        backend = SQLiteStorage(str(tmp_path / "quiz.db"))
+    set_storage(backend)
+    monkeypatch.setattr(login, "_auth", None)  # no limiter state from earlier tests
+    yield backend
+    backend.close()
+    set_storage(None)
+
+
+@pytest.fixture
+def sink(storage, tmp_path, monkeypatch):
+    """A process-wide result sink writing to ``storage``."""
+    sink = ResultSink(storage, str(tmp_path / "results.journal"))
+    monkeypatch.setattr(result_sink, "_sink", sink)
+    yield sink
+    sink.close()
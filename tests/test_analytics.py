@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from analytics import RECORD, ItemAnalysis, append_answers, get_analysis, pack_answers  # noqa: E402
+from assembly import PERMUTATIONS  # noqa: E402
+
+
+def test_pack_round_trip():
+    data = pack_answers(["a", None, "c"], ["a", "b", "b"], 3, [7, 8, 9])
+    assert len(data) == 3 * RECORD.size
+    records = [RECORD.unpack_from(data, i * RECORD.size) for i in range(3)]
+    assert records == [(7, 1, 1, 3), (8, 0, 2, 3), (9, 3, 2, 3)]
+
+
+def test_shuffled_options_are_stored_in_bank_order():
+    for order, perm in enumerate(PERMUTATIONS):
+        data = pack_answers(["a"], ["b"], 4, [0], orders=bytes([order]))
+        assert RECORD.unpack(data) == (0, perm[0] + 1, perm[1] + 1, 4)
+
+
+def test_analysis_counts_every_attempt(tmp_path):
+    log = str(tmp_path / "answers.bin")
+    append_answers(pack_answers(["a", "b"], ["a", "a"], 3, [0, 1]), log)
+    append_answers(pack_answers(["a", None], ["a", "a"], 4, [0, 1]), log)
+    table = ItemAnalysis(log).refresh().table()
+    assert list(table["served"]) == [2, 2]
+    assert list(table["difficulty"]) == [1.0, 0.0]
+    assert list(table["pick_skip"]) == [0.0, 0.5]
+
+
+def test_torn_tail_waits_for_the_rest(tmp_path):
+    log = str(tmp_path / "answers.bin")
+    data = pack_answers(["a", "b"], ["a", "a"], 3, [0, 1])
+    with open(log, "wb") as f:
+        f.write(data[:RECORD.size + 3])
+    analysis = ItemAnalysis(log).refresh()
+    assert analysis.records == 1
+    with open(log, "ab") as f:
+        f.write(data[RECORD.size + 3:])
+    assert analysis.refresh().records == 2
+
+
+def test_append_cuts_a_torn_tail(tmp_path):
+    log = str(tmp_path / "answers.bin")
+    data = pack_answers(["a"], ["a"], 4, [5])
+    append_answers(data, log)
+    with open(log, "ab") as f:
+        f.write(data[:5])  # writer died mid-record
+    append_answers(data, log)
+    assert os.path.getsize(log) == 2 * RECORD.size
+    assert list(ItemAnalysis(log).refresh().table()["served"])[5] == 2
+
+
+def test_one_analysis_per_log(tmp_path, monkeypatch):
+    monkeypatch.setenv("QUIZ_ANSWER_LOG", str(tmp_path / "a.bin"))
+    first = get_analysis()
+    monkeypatch.setenv("QUIZ_ANSWER_LOG", str(tmp_path / "b.bin"))
+    assert get_analysis() is not first
+    monkeypatch.setenv("QUIZ_ANSWER_LOG", str(tmp_path / "a.bin"))
+    assert get_analysis() is first  # switching back does not re-read the log
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from archive import ResultsArchive, archive_dir, compact  # noqa: E402
+from storage import FileStorage  # noqa: E402
+
+
+@pytest.fixture
+def files(tmp_path):
+    return FileStorage(str(tmp_path / "quest.bin"), str(tmp_path / "user.csv"),
+                       str(tmp_path / "results.csv"))
+
+
+def test_compaction_keeps_every_result(files):
+    files.save_results([("ann", "Ann", 5, 0, 0, 20), ("bob", "Bob", 2, 3, 0, 5)])
+    assert compact(files.results_file, "day1") == 2
+    with open(files.results_file, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1  # only the header is left
+    files.save_results([("ann", "Ann", 1, 4, 0, 0), ("cy", "Cy", 6, 0, 0, 24)])
+    assert compact(files.results_file, "day2") == 2
+    files.save_results([("dee", "Dee", 3, 0, 0, 12)])
+
+    archive = ResultsArchive(archive_dir(files.results_file))
+    assert archive.partitions() == ["day1", "day2"] and len(archive) == 4
+    assert [r["Username"] for r in archive.ranked(0, 4)] == ["cy", "ann", "bob", "ann"]
+    assert archive.best_score("ann") == 20 and archive.best_score("dee") is None
+
+    assert [r["Score"] for r in files.top_results()] == [24, 20, 12, 5, 0]
+    assert [r["Score"] for r in files.results_for("ann")] == [20, 0]
+    assert files.rank_of("dee") == 3
+
+
+def test_nothing_to_compact(files):
+    assert compact(files.results_file) == 0
+    assert not os.path.exists(archive_dir(files.results_file))
+    with pytest.raises(ValueError):
+        compact(files.results_file, "../escape")
@@ -0,0 +1,53 @@
+import pytest
+
+from assembly import (PERMUTATIONS, SamplingIndex, allocate, assemble, load_labels,
+                      shuffle_options, student_seed)
+from exam import ExamSession
+from grading import CORRECT
+
+
+@pytest.fixture
+def bank(storage):
+    for n in range(20):
+        storage.add_question(f"Q{n}?", f"right{n}", f"wrong{n}", f"other{n}", "a")
+    return storage
+
+
+def test_seeds_are_stable_per_student_and_exam():
+    assert student_seed("ann") == student_seed("ann", "quiz")
+    assert student_seed("ann") != student_seed("bob")
+    assert student_seed("ann", "midterm") != student_seed("ann", "final")
+
+
+def test_shuffled_options_keep_the_key():
+    for order in range(len(PERMUTATIONS)):
+        options, key = shuffle_options(["x", "y", "z", "b"], order)
+        assert options[ord(key) - ord("a")] == "y"
+
+
+def test_draws_are_reproducible_and_without_replacement(bank):
+    index = SamplingIndex(bank)
+    plan = assemble(index, 8, 42)
+    assert plan == assemble(index, 8, 42)
+    assert len(set(plan.positions)) == 8 and max(plan.positions) < 20
+    assert assemble(index, 8, 43).positions != plan.positions
+
+
+def test_strata_get_proportional_or_quota_shares(bank, tmp_path):
+    labels_file = tmp_path / "tags.csv"
+    labels_file.write_text("number,label\n" + "".join(
+        f"{n},{'hard' if n <= 5 else 'easy'}\n" for n in range(1, 16)), encoding="utf-8")
+    index = SamplingIndex(bank, load_labels(str(labels_file)))
+    assert index.sizes() == {"hard": 5, "easy": 10, None: 5}
+    assert allocate(index.sizes(), 8) == {"hard": 2, "easy": 4, None: 2}
+    plan = assemble(index, 0, 7, quotas={"hard": 3})
+    assert len(plan.positions) == 3 and all(p < 5 for p in plan.positions)
+
+
+def test_planned_session_grades_against_the_shuffled_key(bank):
+    plan = assemble(SamplingIndex(bank), 5, 1)
+    session = ExamSession(bank, plan=plan)
+    for q in session:
+        right = f"right{q.text[1:-1]}"
+        assert session.answer(q, "abc"[q.options.index(right)]) == CORRECT
+    assert session.result()["correct"] == 5
@@ -0,0 +1,63 @@
+import io
+import json
+
+import pytest
+
+from batch import WINDOW_PER_JOB, _login, run_batch
+from login import authenticate, register_user
+
+
+def test_attempts_never_act_as_an_account(storage):
+    register_user("ann", "pw-ann")
+    assert _login({"username": "ann"}) == ("guest", "guest_ann")
+    with pytest.raises(ValueError):
+        _login({"username": "ann", "password": "hijack", "register": True})
+    assert _login({"username": "ann", "password": "pw-ann"}) == ("user", "ann")
+    assert _login({"username": "new", "password": "pw-new", "register": True}) == ("user", "new")
+    assert authenticate("ann", "pw-ann") and authenticate("new", "pw-new")
+
+
+def test_run_batch_grades_and_saves_every_attempt(storage, sink, capsys):
+    for answer in "abc":
+        storage.add_question("?", "x", "y", "z", answer)
+    register_user("ann", "pw-ann")
+    attempts = [
+        {"username": "ann", "password": "pw-ann", "name": "Ann", "answers": "abc"},
+        {"username": "bob", "answers": ["a", "d"]},
+        {"username": "ann", "password": "wrong", "answers": "abc"},
+    ]
+    lines = [json.dumps(a) for a in attempts] + ["", "{not json"]
+    out = io.StringIO()
+    assert run_batch(lines, out, jobs=2) == (2, 2)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["line"] for r in results] == [1, 2, 3, 5]
+    assert (results[0]["mode"], results[0]["score"]) == ("user", 12)
+    assert (results[1]["username"], results[1]["skipped"]) == ("guest_bob", 2)
+    assert "error" in results[2] and "invalid JSON" in results[3]["error"]
+    assert sink.flush(timeout=5)
+    assert sorted(r["Score"] for r in storage.top_results()) == [4, 12]
+    assert "2 attempt(s) graded, 2 failed" in capsys.readouterr().err
+
+
+def test_run_batch_reads_a_bounded_window(storage, sink):
+    storage.add_question("?", "x", "y", "z", "a")
+    read = []
+
+    def source():
+        for n in range(100):
+            read.append(n)
+            yield json.dumps({"username": f"s{n}", "answers": "a"})
+
+    class Out(io.StringIO):
+        seen = None
+
+        def write(self, text):
+            if self.seen is None:
+                self.seen = len(read)  # input consumed before the first result came out
+            return super().write(text)
+
+    out = Out()
+    assert run_batch(source(), out, jobs=2) == (100, 0)
+    assert out.seen <= 2 * WINDOW_PER_JOB + 1
+    assert [json.loads(line)["username"] for line in out.getvalue().splitlines()] == \
+        [f"guest_s{n}" for n in range(100)]
@@ -0,0 +1,47 @@
+import io
+
+from bulk import export_questions, fingerprint, import_questions
+
+CSV = """question,a,b,c,answer
+2 + 2?,3,4,5,b
+Sky colour?,blue,green,red,A
+  2  +  2?,3,4,5,b
+No answer?,x,y,z,
+Short,row
+"""
+
+
+def test_import_validates_and_dedupes(storage):
+    errors = io.StringIO()
+    report = import_questions(io.StringIO(CSV), "csv", storage, chunk_size=1, errors=errors)
+    assert (report["read"], report["added"], report["duplicates"], report["invalid"]) == (5, 2, 1, 2)
+    assert [e["line"] for e in report["errors"]] == [5, 6]
+    assert "line 5: answer must be a, b or c" in errors.getvalue()
+    assert storage.get_question(1) == ("Sky colour?", ["blue", "green", "red", "a"])
+
+    again = import_questions(io.StringIO(CSV), "csv", storage)  # nothing twice
+    assert (again["added"], again["duplicates"]) == (0, 3)
+    assert storage.count_questions() == 2
+
+
+def test_dry_run_writes_nothing(storage):
+    report = import_questions(io.StringIO(CSV), "csv", storage, dry_run=True)
+    assert report["added"] == 2
+    assert storage.count_questions() == 0
+
+
+def test_jsonl_round_trip(storage):
+    storage.add_question("Q, with comma", "a1", "b1", "c1", "c")
+    storage.add_question("Ünïcode?", "x", "y", "z", "a")
+    out = io.StringIO()
+    assert export_questions(out, "jsonl", storage) == 2
+    lines = out.getvalue().splitlines() + ['["List form?", "1", "2", "3", "b"]', "7"]
+    report = import_questions(lines, "jsonl", storage)
+    assert (report["added"], report["duplicates"], report["invalid"]) == (1, 2, 1)
+    assert storage.get_question(2)[0] == "List form?"
+
+
+def test_fingerprint_ignores_case_and_spacing():
+    assert fingerprint("What  is X?", ["A", "b", "c", "a"]) == \
+        fingerprint("what is x?", ["a", "B ", "c", "b"])
+    assert fingerprint("What is X?", ["a", "b", "c"]) != fingerprint("What is Y?", ["a", "b", "c"])
@@ -0,0 +1,51 @@
+import pytest
+
+from courses import Catalog, ShardPool, get_catalog
+from storage import get_storage
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setenv("QUIZ_COURSES_DIR", str(tmp_path / "courses"))
+    return get_catalog()
+
+
+def test_courses_have_their_own_banks_but_share_users(storage, catalog):
+    catalog.create("bio101", "Biology 101")
+    catalog.create("chem200")
+    bio, chem = get_storage("bio101"), get_storage("chem200")
+    bio.add_question("Cell?", "a", "b", "c", "a")
+    bio.add_question("DNA?", "a", "b", "c", "b")
+    chem.add_question("H2O?", "a", "b", "c", "c")
+    assert (bio.count_questions(), chem.count_questions(), storage.count_questions()) == (2, 1, 0)
+    assert chem.get_question(0)[0] == "H2O?"
+
+    bio.set_user("ann", "h1")
+    assert chem.get_user("ann") == storage.get_user("ann") == "h1"
+    listed = {c["course"]: c for c in catalog.courses()}
+    assert listed["bio101"]["title"] == "Biology 101" and listed["bio101"]["questions"] == 2
+
+
+def test_unknown_and_invalid_courses(catalog):
+    with pytest.raises(ValueError, match="Unknown course"):
+        get_storage("nope")
+    with pytest.raises(ValueError):
+        catalog.create("../escape")
+
+
+def test_scan_rebuilds_the_catalog(catalog, tmp_path):
+    catalog.create("bio101")
+    (tmp_path / "courses" / "catalog.json").unlink()
+    fresh = Catalog(str(tmp_path / "courses"))
+    assert len(fresh) == 0
+    assert fresh.scan() == 1 and "bio101" in fresh
+
+
+def test_pool_closes_shards_beyond_max_open(catalog):
+    for n in range(4):
+        catalog.create(f"c{n}")
+    pool = ShardPool(catalog, max_open=2)
+    for n in range(4):
+        pool.get(f"c{n}")
+    stats = pool.stats()
+    assert stats["open"] == 2 and stats["evictions"] == 2 and stats["loads"] == 4
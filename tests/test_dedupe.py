@@ -0,0 +1,47 @@
+from dedupe import DuplicateIndex, format_matches, get_index, normalize
+from storage import FileStorage
+
+BANK = [
+    "What is the capital city of France?",
+    "Which planet is known as the red planet?",
+    "What is the capital city of Spain?",
+    "what is the CAPITAL city of France",
+]
+
+
+def fill(storage, questions):
+    for question in questions:
+        storage.add_question(question, "x", "y", "z", "a")
+
+
+def test_normalize_ignores_case_spacing_and_punctuation():
+    assert normalize("  What IS   this?! ") == normalize("what is this")
+
+
+def test_check_finds_exact_and_near_duplicates(storage):
+    fill(storage, BANK[:3])
+    index = DuplicateIndex(storage)
+    exact = index.check("WHAT is the capital city of france")
+    assert exact[0].number == 1 and exact[0].similarity == 1.0
+    near = index.check("What is the capital city of Spain, in Europe?")
+    assert near and near[0].number == 3 and 0.7 <= near[0].similarity < 1.0
+    assert index.check("How many legs does a spider have?") == []
+    assert format_matches(exact)[0].startswith("   exact duplicate of Q1:")
+
+
+def test_index_follows_appends_and_reports_repeats(storage):
+    fill(storage, BANK[:2])
+    index = DuplicateIndex(storage)
+    assert index.check(BANK[3]) and index.count == 2
+    fill(storage, BANK[2:])
+    report = list(index.report())
+    assert index.count == 4
+    assert [(number, match.number) for number, match in report] == [(4, 1)]
+
+
+def test_one_index_per_storage(storage, tmp_path):
+    other = FileStorage(str(tmp_path / "other.bin"), str(tmp_path / "other.csv"),
+                        str(tmp_path / "other_results.csv"))
+    first = get_index(storage)
+    assert get_index(other) is not first
+    assert get_index(storage) is first  # switching back does not rebuild
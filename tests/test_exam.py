@@ -0,0 +1,48 @@
+import pytest
+
+from exam import ExamSession
+from grading import CORRECT, INCORRECT, SKIPPED, grade, score_answer, total_score
+
+KEY = "abcab"
+
+
+@pytest.fixture
+def bank(storage):
+    for number, answer in enumerate(KEY, start=1):
+        storage.add_question(f"Q{number}?", "x", "y", "z", answer)
+    return storage
+
+
+def test_scoring_rules():
+    assert score_answer(" A ", "a") == CORRECT
+    assert score_answer("b", "a") == INCORRECT
+    assert score_answer("d", "a") == score_answer(None, "a") == SKIPPED
+    assert grade(["a", "c", None], "abc") == {
+        "correct": 1, "incorrect": 1, "skipped": 1, "score": total_score(1, 1)}
+
+
+def test_streamed_session_grades_what_was_answered(bank):
+    session = ExamSession(bank, window=2)
+    texts = []
+    for q in session:
+        texts.append(q.text)
+        if q.number == 1:
+            assert session.answer(q, "a") == CORRECT
+        elif q.number == 2:
+            assert session.answer(q, "c") == INCORRECT
+    assert texts == [f"Q{n}?" for n in range(1, 6)]
+    result = session.result()
+    assert (result["correct"], result["incorrect"], result["skipped"]) == (1, 1, 3)
+    assert result["score"] == 3
+    assert result["answers"] == [(1, CORRECT), (2, INCORRECT)] + [(n, SKIPPED) for n in (3, 4, 5)]
+
+
+def test_pages_and_unseen_questions(bank):
+    session = ExamSession(bank, start=1, count=3, page_size=2)
+    assert len(session) == 3 and session.pages == 2
+    first, second = session.page(0)
+    assert (first.number, first.text, second.answer) == (1, "Q2?", "c")
+    session.answer(second, "c")
+    assert session.choice(second) == "c" and session.choice(first) is None
+    result = session.result()  # page 1 was never read; its key is loaded on demand
+    assert (result["correct"], result["skipped"]) == (1, 2)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+from assembly import SamplingIndex, assemble
+from exam import plan_key
+from grader import Grader, GraderClient, handle
+
+
+@pytest.fixture
+def grader(storage, sink):
+    for answer in "abc":
+        storage.add_question(f"Q{answer}?", "x", "y", "z", answer)
+    return Grader(storage, sink)
+
+
+@pytest.fixture
+def client(grader, tmp_path):
+    """A GraderClient talking to ``grader`` over a Unix socket served from a thread."""
+    path = str(tmp_path / "grader.sock")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(
+        asyncio.start_unix_server(lambda r, w: handle(grader, r, w), path), loop).result(5)
+    client = GraderClient(path, timeout=5)
+    yield client
+    client.close()
+
+    async def shutdown():
+        server.close()
+        handlers = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.wait_for(asyncio.gather(*handlers), 5)  # they see the hang-up and end
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_submit_grades_and_records(grader, storage, sink):
+    result = grader.submit("ann", "Ann", ["a", None, "b"])
+    assert (result["correct"], result["incorrect"], result["skipped"]) == (1, 1, 1)
+    assert result["answers"] == [(1, "correct"), (2, "skipped"), (3, "incorrect")]
+    assert sink.flush(timeout=5)
+    assert storage.top_results()[0]["Name"] == "Ann"
+
+
+def test_sheet_is_graded_against_the_bank_it_was_taken_on(grader, storage):
+    choices = ["a", "b", "c"]  # a session over the three-question bank
+    storage.add_question("Qd?", "x", "y", "z", "b")  # appended before it was submitted
+    result = grader.submit("ann", "Ann", choices)
+    assert (result["correct"], result["skipped"]) == (3, 0)
+    with pytest.raises(ValueError):
+        grader.submit("ann", "Ann", choices + ["a", "a"])
+
+
+def test_bank_key_follows_appends(grader, storage):
+    assert grader.bank_key() == ["a", "b", "c"]
+    storage.add_question("Qd?", "x", "y", "z", "b")
+    assert grader.bank_key() == ["a", "b", "c", "b"]
+
+
+def test_client_round_trip(client, storage):
+    plan = assemble(SamplingIndex(storage), 2, 5)
+    key = plan_key(plan, storage)
+    result = client.submit("bob", "Bob", key, plan)
+    assert (result["correct"], result["score"]) == (2, 8)
+    assert result["answers"] == [(1, "correct"), (2, "correct")]
+    board = client.board(limit=5)
+    assert board["total"] == 1 and board["rows"][0]["Username"] == "bob"
+    with pytest.raises(RuntimeError, match="unknown op"):
+        client.call({"op": "nope"})
+    assert client.ping()["pid"]
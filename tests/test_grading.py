@@ -0,0 +1,37 @@
+import pytest
+
+from exam import answer_key
+from grading import encode_answers, grade, grade_sheets
+
+np = pytest.importorskip("numpy")
+
+KEY = ["a", "b", "c", "a"]
+SHEETS = [["a", "b", "c", "a"], ["b", None, "C ", "x"], ["", "", "", ""]]
+
+
+def test_codes():
+    assert encode_answers(["a", " B", "c", "", "d"]).tolist() == [1, 2, 3, 0, 0]
+    codes = np.array([[1, 0]], dtype=np.int64)
+    assert encode_answers(codes).dtype == np.uint8
+
+
+def test_sheets_grade_like_one_at_a_time():
+    result = grade_sheets([[c or "" for c in s] for s in SHEETS], KEY)
+    for i, sheet in enumerate(SHEETS):
+        expected = grade(sheet, KEY)
+        assert [int(result[k][i]) for k in ("correct", "incorrect", "skipped", "score")] == \
+            [expected[k] for k in ("correct", "incorrect", "skipped", "score")]
+    assert result["p_correct"].tolist() == pytest.approx([1 / 3, 1 / 3, 2 / 3, 1 / 3])
+    assert result["option_counts"][0].tolist() == [1, 1, 1, 0]  # skip, a, b, c on Q1
+
+
+def test_key_length_must_match():
+    with pytest.raises(ValueError):
+        grade_sheets([["a", "b"]], KEY)
+
+
+def test_answer_key_reads_the_bank(storage):
+    for answer in "cab":
+        storage.add_question("?", "x", "y", "z", answer)
+    assert answer_key(storage) == ["c", "a", "b"]
+    assert answer_key(storage, start=1, count=1) == ["a"]
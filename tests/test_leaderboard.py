@@ -0,0 +1,75 @@
+import csv
+
+from leaderboard import Leaderboard
+from storage import RESULTS_HEADER
+
+ROWS = [["ann", "Ann", 5, 0, 0, 20], ["bob", "Bob", 2, 3, 0, 5],
+        ["cy", "Cy", 5, 0, 0, 20], ["ann", "Ann", 1, 4, 0, 0]]
+
+
+def write_results(path, rows, header=True):
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(RESULTS_HEADER)
+        writer.writerows(rows)
+
+
+def ranking(board):
+    return [(row["Username"], row["Score"]) for row in board.top()]
+
+
+def test_ranking_and_snapshot_round_trip(tmp_path):
+    results = str(tmp_path / "results.csv")
+    write_results(results, ROWS)
+    board = Leaderboard(results)
+    expected = [("ann", 20), ("cy", 20), ("bob", 5), ("ann", 0)]  # ties keep file order
+    assert ranking(board) == expected
+    assert board.rank_of("bob") == 3
+    board.save_snapshot()
+
+    write_results(results, [["dee", "Dee", 3, 0, 0, 12]], header=False)
+    loaded = Leaderboard(results)
+    assert loaded._consumed > 0  # resumed from the snapshot, not re-parsed
+    assert ranking(loaded) == expected[:2] + [("dee", 12)] + expected[2:]
+    assert loaded.best_score("ann") == 20
+
+
+def test_torn_snapshot_is_rebuilt_from_the_csv(tmp_path):
+    results = str(tmp_path / "results.csv")
+    write_results(results, ROWS)
+    board = Leaderboard(results)
+    expected = ranking(board)
+    board.save_snapshot()
+    data = open(board.snapshot_file, "rb").read()
+    for keep in (0, 1, len(data) // 2, len(data) - 1):
+        with open(board.snapshot_file, "wb") as f:
+            f.write(data[:keep])
+        assert ranking(Leaderboard(results)) == expected
+
+
+def test_torn_csv_row_waits_for_the_writer(tmp_path):
+    results = str(tmp_path / "results.csv")
+    write_results(results, ROWS[:1])
+    with open(results, "a", encoding="utf-8") as f:
+        f.write("bob,Bob,2,3")
+    board = Leaderboard(results)
+    assert len(board) == 1
+    with open(results, "a", encoding="utf-8") as f:
+        f.write(",0,5\n")
+    assert ranking(board) == [("ann", 20), ("bob", 5)]
+
+
+def test_empty_board_before_any_result(tmp_path):
+    board = Leaderboard(str(tmp_path / "results.csv"))
+    assert board.top(10) == []
+    assert board.rank_of("ann") is None
+
+
+def test_glued_row_is_skipped(tmp_path):
+    results = str(tmp_path / "results.csv")
+    write_results(results, ROWS[:2])
+    with open(results, "a", encoding="utf-8") as f:
+        f.write("cy,Cy,5,")  # torn row, then another appended straight after it
+    write_results(results, [["dee", "Dee", 3, 0, 0, 12], ROWS[2]], header=False)
+    assert ranking(Leaderboard(results)) == [("ann", 20), ("cy", 20), ("bob", 5)]
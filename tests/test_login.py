@@ -0,0 +1,70 @@
+import pytest
+
+from login import (AuthService, RateLimited, authenticate, get_auth, login_with_credentials,
+                   register_user)
+from ratelimit import RateLimiter
+from userstore import UserExists
+
+
+def test_register_then_login(storage):
+    register_user("ann", "pw-ann")
+    assert authenticate("ann", "pw-ann")
+    assert not authenticate("ann", "wrong")
+    assert login_with_credentials("ann", "pw-ann") == ("user", "ann")
+
+
+def test_register_never_overwrites(storage):
+    register_user("ann", "pw-ann")
+    with pytest.raises(UserExists):
+        register_user("ann", "hijack")
+    with pytest.raises(UserExists):
+        storage.set_user("ann", "plain")
+    assert authenticate("ann", "pw-ann")
+    assert not authenticate("ann", "hijack")
+
+
+
+def test_auto_register_only_for_unknown_users(storage):
+    assert login_with_credentials("new", "pw-new", auto_register=True) == ("user", "new")
+    assert authenticate("new", "pw-new")
+    register_user("ann", "pw-ann")
+    assert login_with_credentials("ann", "hijack", auto_register=True) == ("guest", "guest_ann")
+    assert authenticate("ann", "pw-ann")
+
+
+def test_sessions_resume_without_the_password(storage):
+    register_user("ann", "pw-ann")
+    auth = get_auth()
+    assert auth.login("ann", "wrong") is None
+    token = auth.login("ann", "pw-ann")
+    assert auth.resume(token) == "ann"
+    auth.logout(token)
+    assert auth.resume(token) is None
+
+
+def test_failed_logins_are_throttled(storage):
+    register_user("ann", "pw-ann")
+    auth = AuthService(users=RateLimiter(1 / 3600, 2))
+    assert auth.login("ann", "wrong") is None
+    assert auth.login("ann", "wrong") is None
+    with pytest.raises(RateLimited):
+        auth.login("ann", "pw-ann")
+
+
+def test_registrations_are_throttled_per_source(storage):
+    auth = AuthService(sources=RateLimiter(1 / 3600, 2))
+    auth.register("a1", "pw-a1", source="10.0.0.1")
+    auth.register("a2", "pw-a2", source="10.0.0.1")
+    with pytest.raises(RateLimited):
+        auth.register("a3", "pw-a3", source="10.0.0.1")
+    assert storage.get_user("a3") is None
+
+
+def test_trusted_sources_skip_the_source_bucket(storage):
+    auth = AuthService(sources=RateLimiter(1 / 3600, 1), trusted={"127.0.0.1"})
+    for n in range(5):
+        auth.register(f"l{n}", f"pw-l{n}", source="127.0.0.1")
+    assert len(auth.sources) == 0
+    auth.register("r1", "pw-r1", source="10.0.0.1")
+    with pytest.raises(RateLimited):
+        auth.register("r2", "pw-r2", source="10.0.0.1")
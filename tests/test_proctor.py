@@ -0,0 +1,57 @@
+import os
+
+from proctor import ANSWER, ANSWER_REC, START, START_HEAD, CheckpointLog
+
+META = {"username": "ann", "name": "Ann", "deadline": 1e12, "start": 0, "stop": 3}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoints.bin")
+    log = CheckpointLog(path)
+    log.start(1, META)
+    log.start(2, dict(META, username="bob"))
+    log.answer(1, 0, ord("a"))
+    log.answer(1, 2, ord("c"))
+    log.answer(1, 0, ord("b"))  # a changed answer: the latest wins
+    log.end(2)
+    sessions = CheckpointLog(path).refresh()
+    assert list(sessions) == [1]
+    assert sessions[1] == {"meta": META, "answers": {0: ord("b"), 2: ord("c")}}
+
+
+def test_refresh_reads_other_writers_tail(tmp_path):
+    path = str(tmp_path / "checkpoints.bin")
+    reader, writer = CheckpointLog(path), CheckpointLog(path)
+    writer.start(1, META)
+    assert reader.refresh()[1]["answers"] == {}
+    writer.answer(1, 1, ord("a"))
+    assert reader.refresh()[1]["answers"] == {1: ord("a")}
+
+
+def test_torn_tail_is_ignored_then_cut(tmp_path):
+    path = str(tmp_path / "checkpoints.bin")
+    CheckpointLog(path).start(1, META)
+    for torn in (ANSWER_REC.pack(ANSWER, 1, 1, ord("b"))[:6], START_HEAD.pack(START, 2, 50) + b"{"):
+        with open(path, "ab") as f:
+            f.write(torn)  # writer died mid-record
+        log = CheckpointLog(path)
+        assert list(log.refresh()) == [1]
+        log.answer(1, 2, ord("c"))
+        assert CheckpointLog(path).refresh()[1]["answers"][2] == ord("c")
+
+
+def test_compact_keeps_only_open_sessions(tmp_path):
+    path = str(tmp_path / "checkpoints.bin")
+    log = CheckpointLog(path)
+    log.start(1, META)
+    for slot in range(3):
+        log.answer(1, slot, ord("a"))
+        log.answer(1, slot, ord("b"))
+    log.start(2, META)
+    log.end(2)
+    before = os.path.getsize(path)
+    log.compact()
+    assert os.path.getsize(path) < before
+    assert CheckpointLog(path).refresh() == {1: {"meta": META, "answers": {0: 98, 1: 98, 2: 98}}}
+    log.answer(1, 0, ord("c"))  # the compacted file is re-read, not appended to blindly
+    assert log.refresh()[1]["answers"][0] == ord("c")
@@ -0,0 +1,59 @@
+import os
+
+from qbank import OFFSET, RECORD_LEN, index_path, open_bank
+
+QUESTIONS = [
+    ("What is H2O?", ["Water", "Salt", "Sand", "a"]),
+    ("Ünïcödé – 🌳?", ["ä", "ß", "漢字", "c"]),
+    ("Commas, \"quotes\"\nand newlines", ["x,y", "'", "", "b"]),
+]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "quest.bin")
+    with open_bank(path) as bank:
+        assert bank.extend(QUESTIONS) == [0, 1, 2]
+        assert bank.append("Last?", "a", "b", "c", "B") == 3
+    with open_bank(path) as bank:
+        assert len(bank) == 4
+        assert [bank.get(n) for n in range(3)] == QUESTIONS
+        assert bank.get(-1) == ("Last?", ["a", "b", "c", "b"])
+        assert bank.page(1, 2) == QUESTIONS[1:]
+    with open_bank(path, use_mmap=True) as bank:
+        assert list(bank)[:3] == QUESTIONS
+
+
+def test_torn_index_entry_is_ignored_and_dropped(tmp_path):
+    path = str(tmp_path / "quest.bin")
+    with open_bank(path) as bank:
+        bank.extend(QUESTIONS[:1])
+    with open(index_path(path), "ab") as f:
+        f.write(OFFSET.pack(12345)[:3])  # writer died mid-entry
+    with open_bank(path) as bank:
+        assert len(bank) == 1
+        assert bank.extend(QUESTIONS[1:]) == [1, 2]
+        assert [bank.get(n) for n in range(3)] == QUESTIONS
+    assert os.path.getsize(index_path(path)) == 3 * OFFSET.size
+
+
+def test_torn_record_is_invisible(tmp_path):
+    path = str(tmp_path / "quest.bin")
+    with open_bank(path) as bank:
+        bank.extend(QUESTIONS[:2])
+    with open(path, "ab") as f:
+        f.write(RECORD_LEN.pack(100) + b'["half')  # record written, index entry never
+    with open_bank(path) as bank:
+        assert len(bank) == 2
+        bank.extend(QUESTIONS[2:])
+        assert bank.get(2) == QUESTIONS[2]
+
+
+def test_lost_index_is_rebuilt_without_the_torn_tail(tmp_path):
+    path = str(tmp_path / "quest.bin")
+    with open_bank(path) as bank:
+        bank.extend(QUESTIONS)
+    with open(path, "ab") as f:
+        f.write(RECORD_LEN.pack(100) + b'["half')
+    os.remove(index_path(path))
+    with open_bank(path) as bank:
+        assert [bank.get(n) for n in range(len(bank))] == QUESTIONS
@@ -0,0 +1,68 @@
+from ratelimit import RateLimiter, SessionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_empties_and_refills():
+    clock = Clock()
+    limiter = RateLimiter(rate=0.5, burst=2, clock=clock)
+    assert limiter.retry_after("ann") == 0.0
+    limiter.charge("ann")
+    limiter.charge("ann")
+    assert limiter.retry_after("ann") == 2.0  # one token at 0.5/s
+    clock.now += 1.0
+    assert limiter.retry_after("ann") == 1.0
+    assert limiter.retry_after("bob") == 0.0
+    limiter.forget("ann")
+    assert limiter.retry_after("ann") == 0.0
+
+
+def test_disabled_or_keyless_limits_nothing():
+    limiter = RateLimiter(rate=0, burst=1)
+    limiter.charge("ann")
+    assert limiter.retry_after("ann") == 0.0 and len(limiter) == 0
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.charge(None)
+    assert limiter.retry_after(None) == 0.0
+
+
+def test_limiter_stays_bounded():
+    clock = Clock()
+    limiter = RateLimiter(rate=1, burst=1, max_keys=3, clock=clock)
+    for n in range(3):
+        limiter.charge(f"k{n}")
+    clock.now += 10  # every bucket is full again: nothing worth keeping
+    limiter.charge("k3")
+    assert len(limiter) == 1
+    for n in range(4, 8):
+        limiter.charge(f"k{n}")
+    assert len(limiter) == 3 and limiter.retry_after("k7") > 0
+
+
+def test_sessions_expire_and_follow_the_credential():
+    clock = Clock()
+    sessions = SessionCache(capacity=2, ttl=60, clock=clock)
+    stored = {"ann": "h1", "bob": "h2"}
+    ann = sessions.issue("ann", "h1")
+    assert sessions.get(ann, stored.get) == "ann"
+    assert sessions.get("forged", stored.get) is None
+    stored["ann"] = "h1-new"  # password changed: the token stops working
+    assert sessions.get(ann, stored.get) is None
+    bob = sessions.issue("bob", "h2")
+    clock.now += 61
+    assert sessions.get(bob, stored.get) is None
+
+
+def test_session_cache_evicts_least_recently_used():
+    sessions = SessionCache(capacity=2)
+    first, second = sessions.issue("a", "x"), sessions.issue("b", "x")
+    assert sessions.get(first, lambda u: "x") == "a"  # first is now the most recent
+    sessions.issue("c", "x")
+    assert sessions.get(second, lambda u: "x") is None
+    assert sessions.get(first, lambda u: "x") == "a" and len(sessions) == 2
@@ -0,0 +1,103 @@
+import json
+import os
+
+import result_sink
+from analytics import RECORD, pack_answers
+from result_sink import ResultSink
+
+
+class MemoryStorage:
+    """Just the part of Storage the sink writes to."""
+
+    def __init__(self, failing=False):
+        self.rows = []
+        self.failing = failing
+
+    def save_results(self, rows):
+        if self.failing:
+            raise OSError("disk full")
+        self.rows.extend(rows)
+
+
+def journal(path, *records, torn=None):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        if torn:
+            f.write(torn)
+
+
+def test_submit_reaches_storage_and_answer_log(tmp_path):
+    storage, log = MemoryStorage(), str(tmp_path / "answers.bin")
+    sink = ResultSink(storage, str(tmp_path / "results.journal"), answer_log=log)
+    answers = pack_answers(["a", "b"], ["a", "a"], 3, [0, 1])
+    sink.submit("ann", "Ann", 1, 1, 0, 3, answers)
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert storage.rows == [["ann", "Ann", 1, 1, 0, 3]]
+    assert open(log, "rb").read() == answers
+    assert os.path.getsize(tmp_path / "results.journal") == 0
+
+
+def test_replay_skips_committed_rows_and_a_torn_line(tmp_path):
+    path = str(tmp_path / "results.journal")
+    row = ["ann", "Ann", 1, 0, 0, 4]
+    answers = pack_answers(["a"], ["a"], 4, [3])
+    journal(path,
+            {"seq": 1, "row": row}, {"commit": 1},
+            {"seq": 2, "row": row, "answers": answers.hex()},
+            {"seq": 3, "row": ["bob", "Bob", 0, 1, 0, -1]},
+            torn='{"seq": 4, "row": ["cy"')
+    storage, log = MemoryStorage(), str(tmp_path / "answers.bin")
+    ResultSink(storage, path, answer_log=log).close()
+    assert storage.rows == [row, ["bob", "Bob", 0, 1, 0, -1]]
+    assert open(log, "rb").read() == answers
+    storage_again = MemoryStorage()
+    ResultSink(storage_again, path, answer_log=log).close()
+    assert storage_again.rows == []  # the journal was emptied after the replay
+
+
+def test_range_commits_leave_stranded_rows_for_replay(tmp_path):
+    path = str(tmp_path / "results.journal")
+    journal(path,
+            {"seq": 1, "row": ["ann", "Ann", 1, 0, 0, 4]},
+            {"seq": 2, "row": ["bob", "Bob", 1, 0, 0, 4]},
+            {"commit": 2, "first": 2})
+    storage = MemoryStorage()
+    ResultSink(storage, path, answer_log=str(tmp_path / "answers.bin")).close()
+    assert [row[0] for row in storage.rows] == ["ann"]
+
+
+def test_failed_batch_stays_in_the_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_sink, "RETRIES", 2)
+    monkeypatch.setattr(result_sink, "RETRY_DELAY", 0.001)
+    path, log = str(tmp_path / "results.journal"), str(tmp_path / "answers.bin")
+    sink = ResultSink(MemoryStorage(failing=True), path, answer_log=log)
+    sink.submit("ann", "Ann", 1, 0, 0, 4)
+    assert not sink.flush(timeout=5)
+    assert sink.stats()["stranded"] == 1
+    sink.close()  # returns although storage is still failing
+    storage = MemoryStorage()
+    ResultSink(storage, path, answer_log=log).close()
+    assert storage.rows == [["ann", "Ann", 1, 0, 0, 4]]
+
+
+def test_answers_go_to_their_course_log(tmp_path, monkeypatch):
+    logs = {"bio101": str(tmp_path / "bio.bin")}
+    monkeypatch.setattr(result_sink.analytics, "answer_log_path", lambda course=None: logs[course])
+    sink = ResultSink(MemoryStorage(), str(tmp_path / "results.journal"),
+                      answer_log=str(tmp_path / "answers.bin"))
+    bio = pack_answers(["a"], ["a"], 4, [0])
+    default = pack_answers(["b"], ["a"], -1, [0])
+    sink.submit("ann", "Ann", 1, 0, 0, 4, bio, "bio101")
+    sink.submit("bob", "Bob", 0, 1, 0, -1, default)
+    sink.close()
+    assert open(logs["bio101"], "rb").read() == bio
+    assert open(tmp_path / "answers.bin", "rb").read() == default
+    assert os.path.getsize(logs["bio101"]) == RECORD.size
+
+
+def test_flush_sink_does_not_start_a_sink(monkeypatch):
+    monkeypatch.setattr(result_sink, "_sink", None)
+    assert result_sink.flush_sink()
+    assert result_sink._sink is None
@@ -0,0 +1,59 @@
+import pytest
+
+import search
+from search import get_search_index, parse_query
+
+BANK = [
+    ("What gas do plants absorb?", ["Oxygen", "Carbon dioxide", "Nitrogen", "b"]),
+    ("Which organ pumps blood?", ["Heart", "Lung", "Liver", "a"]),
+    ("What do plants release in photosynthesis?", ["Oxygen", "Helium", "Argon", "a"]),
+    ("Capital of France?", ["Paris", "Rome", "Oslo", "a"]),
+]
+
+
+@pytest.fixture
+def index(storage):
+    storage.add_questions(BANK)
+    return get_search_index(storage)
+
+
+def numbers(result):
+    return [hit.number for hit in result.hits]
+
+
+def test_parse_query():
+    assert parse_query("Plant plant -Oxygen") == (["plant"], {"oxygen"})
+
+
+def test_every_word_must_match_and_rarer_words_rank_higher(index):
+    assert numbers(index.search("plants")) == [1, 3]
+    assert numbers(index.search("plants photosynthesis")) == [3]
+    hit = index.search("photosynthesis").hits[0]
+    assert (hit.text, hit.options, hit.answer) == (BANK[2][0], BANK[2][1][:3], "a")
+    assert numbers(index.search("oxygen")) == [1, 3]  # option words count too
+
+
+def test_any_word_fallback_exclusions_and_answer_filter(index):
+    result = index.search("heart paris")
+    assert result.partial and sorted(numbers(result)) == [2, 4]
+    assert numbers(index.search("plants -photosynthesis")) == [1]
+    assert numbers(index.search("plants", answer="b")) == [1]
+    with pytest.raises(ValueError):
+        index.search("plants", answer="d")
+
+
+def test_pages_and_appends(index, storage):
+    result = index.search("what", page_size=1, page=1)
+    assert result.total == 2 and numbers(result) == [3]
+    storage.add_question("What is water made of?", "H2O", "CO2", "NaCl", "a")
+    assert index.search("water").total == 1
+    assert get_search_index(storage) is get_search_index(storage)
+
+
+def test_appends_are_indexed_through_the_storage_hook(index, storage, monkeypatch):
+    monkeypatch.setattr(search, "REFRESH_SECONDS", 3600)  # no periodic refresh
+    assert index.search("water").total == 0
+    storage.add_question("What is water made of?", "H2O", "CO2", "NaCl", "a")
+    assert index.count == 5  # indexed on write, before any query
+    storage.add_questions([("Boiling point of water?", ["100", "50", "0", "a"])])
+    assert index.search("water").total == 2
@@ -0,0 +1,48 @@
+import asyncio
+
+import server
+from login import register_user
+
+
+def converse(replies):
+    """Run one client session against a fresh server; returns every line it was sent."""
+
+    async def main():
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        lines, pending = [], list(replies)
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode("utf-8").rstrip("\n")
+            lines.append(line)
+            if line.startswith(server.PROMPT):
+                writer.write((pending.pop(0) + "\n").encode("utf-8"))
+                await writer.drain()
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return lines
+
+    return asyncio.run(main())
+
+
+def test_register_take_exam_and_see_the_board(storage, sink):
+    storage.add_question("2 + 2?", "3", "4", "5", "b")
+    storage.add_question("Sky?", "blue", "green", "red", "a")
+    lines = converse(["ann", "pw-ann", "y", "3", "Ann", "b", "d", "4", "5"])
+    assert "✅ Registered new user: ann (you are now logged in)." in lines
+    assert "✅ Correct!" in lines and "➡️ Skipped" in lines
+    assert "📊 Ann: correct 1, incorrect 0, skipped 1, score 4" in lines
+    assert lines[-1] == "👋 Goodbye!"
+    assert sink.flush(timeout=5)
+    assert storage.top_results()[0]["Score"] == 4
+
+
+def test_existing_account_is_not_registered_again(storage, sink):
+    register_user("ann", "pw-ann")
+    lines = converse(["ann", "hijack", "y", "ann", "pw-ann", "5"])
+    assert "That username already exists. Try again." in lines
+    assert "✅ Logged in as registered user: ann" in lines
@@ -0,0 +1,47 @@
+import pytest
+
+import snapshot
+from storage import FileStorage
+
+QUESTIONS = [
+    ("What is H2O?", ["Water", "Salt", "Sand", "a"]),
+    ("Ünïcödé – 🌳?", ["ä", "ß", "漢字", "c"]),
+    ("Third", ["x", "y", "z", "b"]),
+]
+
+
+@pytest.fixture
+def bank(tmp_path):
+    storage = FileStorage(str(tmp_path / "quest.bin"), str(tmp_path / "user.csv"),
+                          str(tmp_path / "results.csv"))
+    storage.add_questions(QUESTIONS)
+    return storage
+
+
+def test_round_trip(bank):
+    snap = snapshot.publish("midterm", [2, 0], storage=bank, title="Midterm")
+    assert snap.revision == 1 and snap.meta["title"] == "Midterm"
+    assert snap.count_questions() == 2
+    assert snap.get_questions([0, 1]) == [QUESTIONS[2], QUESTIONS[0]]
+    assert list(snap.bank_positions) == [2, 0]
+    assert snap.key_letters() == b"ba"
+    reopened = snapshot.ExamSnapshot(snap.path)
+    assert reopened.question_page(0, 5) == [QUESTIONS[2], QUESTIONS[0]]
+
+
+def test_republish_keeps_old_revisions(bank):
+    first = snapshot.publish("quiz", [0], storage=bank)
+    second = snapshot.publish("quiz", storage=bank)
+    assert snapshot.current_revision("quiz") == 2
+    assert snapshot.get_snapshot("quiz").count_questions() == 3
+    assert snapshot.get_snapshot("quiz", first.revision).get_question(0) == QUESTIONS[0]
+    assert second.path != first.path
+
+
+@pytest.mark.parametrize("keep", [0, 10, 100, -1])
+def test_truncated_file_is_rejected(bank, tmp_path, keep):
+    data = open(snapshot.publish("final", storage=bank).path, "rb").read()
+    torn = tmp_path / "torn.snap"
+    torn.write_bytes(data[:keep % len(data)])
+    with pytest.raises(ValueError):
+        snapshot.ExamSnapshot(str(torn))
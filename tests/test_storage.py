@@ -0,0 +1,57 @@
+import pytest
+
+from storage import FileStorage, SQLiteStorage, import_files
+from userstore import UserExists, hash_password
+
+
+def test_questions_round_trip(storage):
+    storage.add_question("2 + 2?", "3", "4", "5", "b")
+    storage.add_question("Capital of France?", "Paris", "Rome", "Oslo", "a")
+    assert storage.count_questions() == 2
+    assert storage.get_question(1) == ("Capital of France?", ["Paris", "Rome", "Oslo", "a"])
+    assert [q for q, _ in storage.question_page(0, 10)] == ["2 + 2?", "Capital of France?"]
+    assert len(list(storage.iter_questions(page_size=1))) == 2
+
+
+def test_users_are_not_replaced_unless_asked(storage):
+    storage.set_user("ann", "h1")
+    with pytest.raises(UserExists):
+        storage.set_user("ann", "h2")
+    storage.set_user("ann", "h3", replace=True)
+    assert storage.get_user("ann") == "h3"
+    assert storage.count_users() == 1
+
+
+def test_results_are_ranked_by_score(storage):
+    storage.save_result("ann", "Ann", 3, 1, 0, 3)
+    storage.save_results([("bob", "Bob", 4, 0, 0, 4), ("ann", "Ann", 1, 2, 1, 1)])
+    assert [r["Score"] for r in storage.top_results()] == [4, 3, 1]
+    assert [r["Username"] for r in storage.top_results(limit=1, offset=1)] == ["ann"]
+    assert [r["Score"] for r in storage.results_for("ann")] == [3, 1]
+
+
+def test_import_files(tmp_path):
+    with open("user.csv", "w", encoding="utf-8") as f:
+        f.write(f"username,password\nann,{hash_password('pw-ann')}\n")
+    with open("results.csv", "w", encoding="utf-8") as f:
+        f.write("Name,Correct,Incorrect,Skipped,Score\nAnn,2,0,0,2\n")  # pre-Username layout
+    target = SQLiteStorage(str(tmp_path / "quiz.db"))
+    counts = import_files(target, "quest.bin", "user.csv", "results.csv")
+    assert counts == {"questions": 0, "users": 1, "results": 1}
+    assert target.results_for("Ann")[0]["Score"] == 2
+    target.close()
+
+
+def test_add_questions_returns_positions(storage):
+    assert storage.add_question("First?", "x", "y", "z", "a") == 0
+    assert storage.add_questions([("Q2?", ["x", "y", "z", "b"]), ("Q3?", ["x", "y", "z", "c"])]) == [1, 2]
+    assert storage.add_questions([]) == []
+
+
+def test_torn_result_row_is_cut_before_appending(tmp_path):
+    storage = FileStorage(results_file=str(tmp_path / "results.csv"))
+    storage.save_results([("ann", "Ann", 3, 0, 0, 3)])
+    with open(storage.results_file, "ab") as f:
+        f.write(b"bob,Bob,4,")  # a writer died mid-row
+    storage.save_results([("cy", "Cy", 2, 0, 0, 2)])
+    assert [(r["Username"], r["Score"]) for r in storage.top_results()] == [("ann", 3), ("cy", 2)]
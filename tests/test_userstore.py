@@ -0,0 +1,65 @@
+import pytest
+
+import userstore
+from userstore import UserExists, UserStore, hash_password, needs_rehash, verify_password
+
+
+def test_hash_round_trip():
+    stored = hash_password("s3cret!")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert stored != hash_password("s3cret!")  # salted
+    assert verify_password("s3cret!", stored)
+    assert not verify_password("s3cret", stored)
+    assert not verify_password("s3cret!", "pbkdf2_sha256$1000$not-base64")
+
+
+def test_rehash_when_the_cost_changes():
+    stored = hash_password("pw12")
+    assert not needs_rehash(stored)
+    userstore.set_hash_iterations(2000)
+    assert needs_rehash(stored)
+    assert verify_password("pw12", stored)  # old hashes verify at their own cost
+    assert needs_rehash("pw12")  # plaintext from an old install
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path / "user.csv")
+    store = UserStore(path)
+    store.ensure_file()
+    store.add("ann", "pw-ann")
+    store.add("bob,by", "pw-bob")  # quoted by the csv module
+    reopened = UserStore(path)
+    assert reopened.authenticate("ann", "pw-ann")
+    assert reopened.authenticate("bob,by", "pw-bob")
+    assert not reopened.authenticate("ann", "pw-bob")
+    assert len(reopened) == 2
+
+
+def test_existing_user_is_never_overwritten(tmp_path):
+    store = UserStore(str(tmp_path / "user.csv"))
+    store.add("ann", "first")
+    with pytest.raises(UserExists):
+        store.add("ann", "second")
+    assert UserStore(store.path).authenticate("ann", "first")
+
+
+def test_plaintext_row_is_upgraded_on_login(tmp_path):
+    path = tmp_path / "user.csv"
+    path.write_text("username,password\nann,old-plain\n", encoding="utf-8")
+    store = UserStore(str(path))
+    assert store.authenticate("ann", "old-plain")
+    assert store.get("ann").startswith("pbkdf2_sha256$")
+    assert UserStore(str(path)).authenticate("ann", "old-plain")
+
+
+def test_torn_row_is_ignored_and_cut(tmp_path):
+    path = tmp_path / "user.csv"
+    store = UserStore(str(path))
+    store.add("ann", "pw-ann")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("bob,pbkdf2_sha256$1000$ab")  # writer died mid-row
+    assert not UserStore(str(path)).exists("bob")
+    store.add("cy", "pw-cy")
+    reopened = UserStore(str(path))
+    assert reopened.authenticate("cy", "pw-cy")
+    assert not reopened.exists("bob")
@@ -0,0 +1,276 @@
+"""
+userstore.py
+
+Salted, hashed credential store for the Quiz System.
+
+``user.csv`` keeps its two columns (username, password), but the password
+column now holds a PBKDF2 hash string:
+
+    pbkdf2_sha256$<iterations>$<salt, base64>$<digest, base64>
+
+Rows are indexed into a dict the first time the store is used. Later rows
+override earlier ones, so re-hashing a user's password is just another
+append. Only an explicit ``replace=True`` (the rehash paths) may append a
+row for an existing user; adding one again raises UserExists. The index
+is kept fresh incrementally: rows appended by this process go straight
+into the dict, and rows appended by other processes are read from the
+last known file offset instead of re-parsing the file.
+
+The hashing cost is tunable with the ``QUIZ_HASH_ITERATIONS`` environment
+variable or ``set_hash_iterations()``; existing hashes keep verifying at the
+cost they were created with.
+
+Plaintext rows from older installs still verify. They are upgraded one by
+one on successful login, or all at once with ``migrate_plaintext()``
+(also available as ``python userstore.py``).
+"""
+
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import os
+import secrets
+import threading
+
+import metrics
+from filelock import append, atomic_write, locked
+
+DATA_DIR = "data"
+USER_CSV = os.path.join(DATA_DIR, "user.csv")
+CSV_HEADER = ["username", "password"]
+
+HASH_SCHEME = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 100_000
+SALT_BYTES = 16
+
+_iterations = int(os.environ.get("QUIZ_HASH_ITERATIONS", DEFAULT_ITERATIONS))
+
+
+class UserExists(ValueError):
+    """The username is already registered (its password is never overwritten implicitly)."""
+
+    def __init__(self, username):
+        super().__init__(f"User {username!r} already exists.")
+        self.username = username
+
+
+# ----------------- Hashing -----------------
+
+def set_hash_iterations(iterations):
+    """Change the PBKDF2 cost used for new hashes (affects this process only)."""
+    global _iterations
+    if iterations < 1:
+        raise ValueError("iterations must be positive")
+    _iterations = int(iterations)
+
+
+def get_hash_iterations():
+    return _iterations
+
+
+@metrics.timed("quiz_auth_hash_seconds")
+def hash_password(password, iterations=None):
+    """Return a salted PBKDF2 hash string for ``password``."""
+    iterations = iterations or _iterations
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((
+        HASH_SCHEME,
+        str(iterations),
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(digest).decode("ascii"),
+    ))
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_SCHEME + "$")
+
+
+@metrics.timed("quiz_auth_verify_seconds")
+def verify_password(password, stored):
+    """Check ``password`` against a stored hash (or a legacy plaintext value)."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    try:
+        _, iterations, salt, digest = stored.split("$")
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        iterations = int(iterations)
+    except ValueError:
+        return False
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return hmac.compare_digest(candidate, digest)
+
+
+def needs_rehash(stored):
+    """True for plaintext rows and hashes made with a different cost."""
+    if not is_hashed(stored):
+        return True
+    try:
+        return int(stored.split("$")[1]) != _iterations
+    except (IndexError, ValueError):
+        return True
+
+
+# ----------------- UserStore -----------------
+
+def _parse_rows(text):
+    """Yield (username, password) pairs from CSV text, skipping headers and junk."""
+    for row in csv.reader(io.StringIO(text)):
+        if row == CSV_HEADER or len(row) < 2:
+            continue
+        uname, pwd = row[0].strip(), row[1].strip()
+        if uname and pwd:
+            yield uname, pwd
+
+
+class UserStore:
+    """Dict-indexed view of ``user.csv`` with O(1) lookups."""
+
+    def __init__(self, path=USER_CSV):
+        self.path = path
+        self._lock = threading.RLock()
+        self._index = {}
+        self._offset = 0      # bytes of the file already folded into the index
+        self._inode = None
+
+    # ---- file bookkeeping ----
+
+    def ensure_file(self):
+        """Create the CSV (with header) if needed; fix a missing header once."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with locked(self.path):  # another process may be creating it too
+            if not os.path.exists(self.path):
+                self._rewrite([])
+                return
+            with open(self.path, "r", newline="", encoding="utf-8") as f:
+                first = next(csv.reader(f), None)
+            if first != CSV_HEADER:
+                with open(self.path, "r", newline="", encoding="utf-8") as f:
+                    rows = list(_parse_rows(f.read()))
+                self._rewrite(rows)
+
+    def _rewrite(self, rows):
+        """Atomically replace the file with a header plus ``rows``."""
+        with locked(self.path), atomic_write(self.path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+        self._inode = None  # force a full reload
+
+    @metrics.timed("quiz_users_refresh_seconds")
+    def _refresh(self):
+        """Fold any bytes appended since the last look into the index."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.ensure_file()
+            st = os.stat(self.path)
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # first load, or the file was replaced/truncated: start over
+            self._index.clear()
+            self._offset = 0
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        # only consume complete lines; a concurrent writer may be mid-row
+        end = chunk.rfind(b"\n") + 1
+        for uname, pwd in _parse_rows(chunk[:end].decode("utf-8")):
+            self._index[uname] = pwd
+        self._offset += end
+
+    # ---- queries ----
+
+    def get(self, username):
+        """Return the stored password hash for ``username`` (or None)."""
+        with self._lock:
+            self._refresh()
+            return self._index.get(username)
+
+    def exists(self, username):
+        return self.get(username) is not None
+
+    def items(self):
+        with self._lock:
+            self._refresh()
+            return list(self._index.items())
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    # ---- updates ----
+
+    def set(self, username, stored, replace=False):
+        """
+        Append a (username, stored hash) row. Raises UserExists if the user
+        is registered, unless ``replace`` (a rehash of the same password).
+        """
+        with self._lock, locked(self.path):  # no other process registers in between
+            self._refresh()
+            if not replace and username in self._index:
+                raise UserExists(username)
+            if os.path.getsize(self.path) > self._offset:
+                # a writer died mid-row: cut it off, or the new row would be glued onto it
+                os.truncate(self.path, self._offset)
+            line = io.StringIO()
+            csv.writer(line).writerow([username, stored])
+            append(self.path, line.getvalue().encode("utf-8"))
+            # the row is re-read (harmlessly) by the next _refresh, which also
+            # picks up anything other processes appended in between
+            self._index[username] = stored
+
+    def add(self, username, password):
+        """Hash ``password`` and append the user; raises UserExists if registered."""
+        self.set(username, hash_password(password))
+
+    def authenticate(self, username, password):
+        """Verify credentials; upgrades plaintext or outdated hashes in place."""
+        stored = self.get(username)
+        if stored is None or not verify_password(password, stored):
+            return False
+        if needs_rehash(stored):
+            self.set(username, hash_password(password), replace=True)
+        return True
+
+    def migrate_plaintext(self):
+        """Hash every plaintext password and compact the file. Returns rows converted."""
+        with self._lock, locked(self.path):  # no appends between read and rewrite
+            self.ensure_file()
+            self._refresh()
+            converted = 0
+            rows = []
+            for uname, stored in self._index.items():
+                if not is_hashed(stored):
+                    stored = hash_password(stored)
+                    converted += 1
+                rows.append((uname, stored))
+            self._rewrite(rows)
+            return converted
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=USER_CSV):
+    """Return the process-wide ``UserStore`` for ``path``."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = UserStore(path)
+            store.ensure_file()
+        return store
+
+
+if __name__ == "__main__":
+    count = get_store().migrate_plaintext()
+    print(f"✅ Hashed {count} plaintext password(s) in {USER_CSV}.")
@@ -1,18 +1,34 @@
 import time
 import os
-import csv
 
-RESULTS_FILE = "results.csv"
+import metrics
+from result_sink import flush_sink, get_sink
+from storage import get_storage
 
+# Fast mode (QUIZ_FAST=1 or main.py --fast) skips the cinematic effects.
+FAST = os.environ.get("QUIZ_FAST", "0") != "0"
+
+def set_fast(enabled=True):
+    """Turn off slow printing and screen clearing (headless / scripted runs)."""
+    global FAST
+    FAST = enabled
+
+@metrics.timed("quiz_render_slow_print_seconds")
 def slow_print(text: str, delay: float = 0.02):
     """Prints text one character at a time for cinematic effect."""
+    if FAST:
+        print(text)
+        return
     for char in text:
         print(char, end='', flush=True)
         time.sleep(delay)
     print()
 
+@metrics.timed("quiz_render_clear_screen_seconds")
 def clear_screen():
     """Clears the console screen (cross-platform)."""
+    if FAST:
+        return
     os.system('cls' if os.name == 'nt' else 'clear')
 
 def banner(title: str):
@@ -21,38 +37,29 @@ def banner(title: str):
     print(title.center(60))
     print("=" * 60 + "\n")
 
-def save_result(username, name, cor, incor, skip, marks):
-    """Save a student's result after the quiz."""
-    file_exists = os.path.isfile(RESULTS_FILE)
+def save_result(username, name, cor, incor, skip, marks, answers=None, course=None):
+    """
+    Save a student's result after the quiz (journaled, written in batches),
+    with its packed per-answer records for item analysis if given (logged
+    with ``course``'s bank).
+    """
+    get_sink().submit(username, name, cor, incor, skip, marks, answers, course)
 
-    with open(RESULTS_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists:  # write header if file doesn't exist
-            writer.writerow(["Username", "Name", "Correct", "Incorrect", "Skipped", "Score"])
-        writer.writerow([username, name, cor, incor, skip, marks])
-
-def performance_board():
-    """Display all stored results as a leaderboard."""
-    if not os.path.isfile(RESULTS_FILE):
-        print("⚠️ No results found yet!")
-        return
-
-    with open(RESULTS_FILE, "r") as f:
-        reader = csv.DictReader(f)
-        results = list(reader)
+def performance_board(limit=None, offset=0):
+    """Display stored results as a leaderboard (optionally one page of it)."""
+    flush_sink()  # include results still waiting in the write batch
+    # highest score first, served from the maintained leaderboard
+    results = get_storage().top_results(limit, offset)
 
     if not results:
         print("⚠️ No results found yet!")
         return
 
-    # Sort by score (highest first)
-    results.sort(key=lambda x: int(x["Score"]), reverse=True)
-
     banner("🏆 Performance Board")
     print(f"{'Rank':<5}{'Username':<20}{'Name':<15}{'Score':<10}{'Correct':<10}{'Incorrect':<12}{'Skipped':<10}")
     print("-" * 80)
 
-    for idx, row in enumerate(results, start=1):
+    for idx, row in enumerate(results, start=offset + 1):
         print(f"{idx:<5}{row['Username']:<20}{row['Name']:<15}{row['Score']:<10}{row['Correct']:<10}{row['Incorrect']:<12}{row['Skipped']:<10}")
 
     print("=" * 80)